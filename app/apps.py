@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        # Register cache invalidation and image reference receivers
+        import app.views.helpers.invalidation  # noqa: F401
+        import app.views.helpers.storefront  # noqa: F401
+        import app.views.helpers.assets  # noqa: F401
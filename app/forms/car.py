@@ -9,15 +9,26 @@ from app.models.cars.category import (
 )
 from app.models.cars.gallery_image import VehicleGalleryImage
 from app.models.cars.review import VehicleReview
-from cloudinary.forms import CloudinaryFileField
+from app.views.helpers.cloudinary import validate_image
+
+
+def clean_image_upload(image):
+    """Validate an optional uploaded image, raising ValidationError"""
+    if image:
+        try:
+            validate_image(image)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+    return image
 
 
 class VehicleForm(forms.ModelForm):
     """
     Django ModelForm for Vehicle creation and editing with proper validation
     """
-    # Cloudinary image field for primary image
-    primary_image = CloudinaryFileField(
+    # Primary image; staged locally and uploaded to Cloudinary in the
+    # background (see app.views.helpers.uploads)
+    primary_image = forms.FileField(
         required=False,
         help_text="Upload the main image for this vehicle"
     )
@@ -157,6 +168,9 @@ class VehicleForm(forms.ModelForm):
                 "Sale price must be less than the regular price.")
         return sale_price
 
+    def clean_primary_image(self):
+        return clean_image_upload(self.cleaned_data.get('primary_image'))
+
     def clean_vin(self):
         vin = self.cleaned_data.get('vin')
         if vin and len(vin) not in [0, 17]:  # Allow empty or full VIN
@@ -189,13 +203,14 @@ class VehicleGalleryImageForm(forms.ModelForm):
     """
     Form for individual vehicle gallery images
     """
-    image = CloudinaryFileField(
+    image = forms.FileField(
+        required=False,
         help_text="Upload an image for the vehicle gallery"
     )
 
     class Meta:
         model = VehicleGalleryImage
-        fields = ['image', 'caption', 'alt_text', 'sort_order']
+        fields = ['caption', 'alt_text', 'sort_order']
         widgets = {
             'caption': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -212,13 +227,19 @@ class VehicleGalleryImageForm(forms.ModelForm):
             }),
         }
 
+    def clean_image(self):
+        image = clean_image_upload(self.cleaned_data.get('image'))
+        if not image and not self.instance.pk:
+            raise forms.ValidationError("Please upload an image.")
+        return image
+
 
 # Create formset for vehicle gallery images
 VehicleGalleryImageFormSet = inlineformset_factory(
     Vehicle,
     VehicleGalleryImage,
     form=VehicleGalleryImageForm,
-    fields=['image', 'caption', 'alt_text', 'sort_order'],
+    fields=['caption', 'alt_text', 'sort_order'],
     extra=3,  # Number of empty forms to display
     can_delete=True,
     max_num=10,  # Maximum number of images
@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from app.models.car import Vehicle
+from app.models.cars.asset import ImageAsset
+from app.models.cars.gallery_image import VehicleGalleryImage
+from app.views.helpers.cloudinary import get_image_handler
+from app.views.helpers.image_processing import compute_placeholders
+from app.views.helpers.invalidation import (
+    coalesced_bumps, invalidate_vehicles
+)
+from app.views.helpers.uploads import get_upload_workers
+
+
+class Command(BaseCommand):
+    help = ("Compute the inline placeholder and dominant colour of images "
+            "uploaded before they were recorded")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=100,
+            help="Rows read per batch",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Concurrent downloads (defaults to IMAGE_UPLOAD_WORKERS)",
+        )
+        parser.add_argument(
+            "--width", type=int, default=256,
+            help="Width of the rendition downloaded for each image",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Recompute placeholders that are already set",
+        )
+
+    def fetch(self, public_ids):
+        """Download renditions concurrently; errors are returned"""
+        def fetch_one(public_id):
+            try:
+                return self.handler.fetch_image(public_id, self.width)
+            except Exception as e:
+                return e
+
+        workers = min(self.workers or get_upload_workers(), len(public_ids))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fetch_one, public_ids))
+
+    def compute(self, public_ids):
+        """Return {public_id: placeholder fields} and the failure count"""
+        known = {}
+        if not self.force:
+            # Content uploaded since placeholders were introduced
+            known = {
+                asset.public_id: {
+                    "image_placeholder": asset.image_placeholder,
+                    "dominant_color": asset.dominant_color,
+                }
+                for asset in ImageAsset.objects.filter(
+                    public_id__in=public_ids
+                ).exclude(image_placeholder="")
+            }
+        missing = [
+            public_id for public_id in public_ids if public_id not in known
+        ]
+        if not missing:
+            return known, 0
+
+        downloads = self.fetch(missing)
+        fetched = [
+            (public_id, data) for public_id, data in zip(missing, downloads)
+            if not isinstance(data, Exception)
+        ]
+        # Decoding is CPU bound, so it runs in the image process pool
+        results = compute_placeholders([data for _, data in fetched])
+
+        failed = len(missing) - len(fetched)
+        for (public_id, _), result in zip(fetched, results):
+            if isinstance(result, Exception) or \
+                    not result["image_placeholder"]:
+                failed += 1
+                continue
+            known[public_id] = result
+        return known, failed
+
+    def backfill(self, model):
+        """Fill in placeholders for one model; returns (updated, failed)"""
+        rows = model._default_manager.exclude(
+            cloudinary_image_id__isnull=True
+        ).exclude(cloudinary_image_id="")
+        if not self.force:
+            rows = rows.filter(image_placeholder="")
+
+        updated = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                rows.filter(pk__gt=last_pk).order_by("pk")
+                .values_list("pk", "cloudinary_image_id")[:self.batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+
+            public_ids = sorted({public_id for _, public_id in batch})
+            placeholders, batch_failed = self.compute(public_ids)
+            failed += batch_failed
+            for public_id, fields in placeholders.items():
+                ImageAsset.objects.filter(public_id=public_id).update(
+                    **fields)
+                # Update the rows directly: this is derived data and
+                # must not create page revisions or touch updated_at
+                updated += rows.filter(
+                    pk__in=[pk for pk, _ in batch],
+                    cloudinary_image_id=public_id,
+                ).update(**fields)
+            self.invalidate(model, [
+                pk for pk, public_id in batch if public_id in placeholders
+            ])
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: {updated} updated, "
+                f"{failed} failed..."
+            )
+        return updated, failed
+
+    def invalidate(self, model, pks):
+        """Queryset updates send no signals; bump the vehicles' tags"""
+        if model is not Vehicle:
+            pks = model._default_manager.filter(
+                pk__in=pks).values_list("vehicle_id", flat=True)
+        invalidate_vehicles(pks)
+
+    def handle(self, *args, **options):
+        self.handler = get_image_handler()
+        self.batch_size = options["batch_size"]
+        self.workers = options["workers"]
+        self.width = options["width"]
+        self.force = options["force"]
+
+        total_updated = total_failed = 0
+        # Every touched vehicle's tags are bumped once, when the run ends
+        with coalesced_bumps():
+            for model in (Vehicle, VehicleGalleryImage):
+                updated, failed = self.backfill(model)
+                total_updated += updated
+                total_failed += failed
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled placeholders for {total_updated} images, "
+            f"{total_failed} failed."
+        ))
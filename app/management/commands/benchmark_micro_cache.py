@@ -0,0 +1,75 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+
+
+class Command(BaseCommand):
+    help = ("Measure anonymous page throughput under a synthetic burst, "
+            "with and without the micro-cache")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls", nargs="*", default=["/", "/cars", "/search?q=car"],
+            help="Paths requested in turn",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=300,
+            help="Requests per run",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=8,
+            help="Concurrent clients",
+        )
+        parser.add_argument(
+            "--host", default="localhost",
+            help="Host header (must be in ALLOWED_HOSTS)",
+        )
+
+    def request(self, i):
+        url = self.urls[i % len(self.urls)]
+        # One address per request so the burst is not rate limited
+        address = f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}"
+        started = time.perf_counter()
+        response = Client(HTTP_HOST=self.host).get(url, REMOTE_ADDR=address)
+        elapsed = time.perf_counter() - started
+        connections.close_all()
+        return elapsed, response.status_code, response.get("X-Micro-Cache")
+
+    def burst(self, enabled):
+        with override_settings(MICRO_CACHE_ENABLED=enabled):
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                started = time.perf_counter()
+                results = list(pool.map(self.request, range(self.total)))
+                duration = time.perf_counter() - started
+
+        latencies = sorted(elapsed for elapsed, _, _ in results)
+        errors = sum(status >= 500 for _, status, _ in results)
+        hits = sum(cache == "HIT" for _, _, cache in results)
+        self.stdout.write(
+            f"{'on' if enabled else 'off':>4}  "
+            f"{self.total / duration:8.1f} req/s  "
+            f"p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+            f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms  "
+            f"hits {hits:>5}  errors {errors}"
+        )
+        return self.total / duration
+
+    def handle(self, *args, **options):
+        self.urls = options["urls"]
+        self.total = options["requests"]
+        self.concurrency = options["concurrency"]
+        self.host = options["host"]
+
+        self.stdout.write(
+            f"{self.total} requests, {self.concurrency} concurrent, "
+            f"over {', '.join(self.urls)}"
+        )
+        before = self.burst(enabled=False)
+        after = self.burst(enabled=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Micro-cache throughput: {after / before:.1f}x"
+        ))
@@ -0,0 +1,134 @@
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from app.models.cars.asset import ImageAsset
+from app.views.helpers.assets import referenced_public_ids
+from app.views.helpers.cloudinary import DELETE_BATCH_SIZE, get_image_handler
+from app.views.helpers.uploads import VEHICLE_FOLDER
+
+# Folders this app uploads to (gallery images live under vehicles/)
+APP_PREFIXES = (f"{VEHICLE_FOLDER}/",)
+
+
+class Command(BaseCommand):
+    help = ("Delete Cloudinary images in the app's upload folders that no "
+            "vehicle, gallery image or profile references any more")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="List the orphans without deleting anything",
+        )
+        parser.add_argument(
+            "--grace-hours", type=float, default=24,
+            help="Only delete images uploaded at least this long ago",
+        )
+        parser.add_argument(
+            "--prefix", action="append", dest="prefixes",
+            help="Scan public ids starting with this folder prefix instead "
+                 "of the app's upload folders (repeatable)",
+        )
+        parser.add_argument(
+            "--all", action="store_true", dest="scan_all",
+            help="Scan every image in the Cloudinary account, including "
+                 "ones uploaded by other apps",
+        )
+        parser.add_argument(
+            "--page-size", type=int, default=500,
+            help="Remote images listed per Admin API call",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=os.path.join(settings.BASE_DIR, ".orphaned_images.json"),
+            help="File recording progress, so an interrupted run resumes",
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="Ignore any checkpoint and scan from the beginning",
+        )
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path, "r") as fl:
+                return json.load(fl)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_checkpoint(self, path, state):
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as fl:
+            json.dump(state, fl)
+        os.replace(temp_path, path)
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        checkpoint = options["checkpoint"]
+        if options["scan_all"] and options["prefixes"]:
+            raise CommandError("--all and --prefix can't be combined.")
+        if options["scan_all"]:
+            prefixes = [None]
+        else:
+            prefixes = options["prefixes"] or list(APP_PREFIXES)
+        handler = get_image_handler()
+
+        state = {"prefix_index": 0, "next_cursor": None,
+                 "scanned": 0, "deleted": 0}
+        saved = None if options["restart"] else self.load_checkpoint(
+            checkpoint)
+        if saved and saved.get("prefixes") == prefixes:
+            state.update(saved)
+            self.stdout.write(f"Resuming after {state['scanned']} images...")
+        state["prefixes"] = prefixes
+
+        referenced = referenced_public_ids()
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+
+        while state["prefix_index"] < len(prefixes):
+            page = handler.list_images(
+                next_cursor=state["next_cursor"],
+                prefix=prefixes[state["prefix_index"]],
+                max_results=options["page_size"],
+            )
+            orphans = [
+                resource["public_id"] for resource in page["resources"]
+                if resource["public_id"] not in referenced
+                and parse_datetime(resource["created_at"]) < cutoff
+            ]
+            state["scanned"] += len(page["resources"])
+
+            for start in range(0, len(orphans), DELETE_BATCH_SIZE):
+                batch = orphans[start:start + DELETE_BATCH_SIZE]
+                if dry_run:
+                    for public_id in batch:
+                        self.stdout.write(f"Would delete {public_id}")
+                    state["deleted"] += len(batch)
+                    continue
+
+                results = handler.delete_images(batch)
+                ImageAsset.objects.filter(
+                    public_id__in=batch, ref_count=0
+                ).delete()
+                state["deleted"] += sum(
+                    1 for result in results.values() if result == "deleted"
+                )
+
+            state["next_cursor"] = page["next_cursor"]
+            if not state["next_cursor"]:
+                state["prefix_index"] += 1
+            if not dry_run:
+                self.save_checkpoint(checkpoint, state)
+
+        if not dry_run and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        verb = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {state['deleted']} orphaned images "
+            f"out of {state['scanned']} scanned."
+        ))
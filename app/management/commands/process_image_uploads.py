@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat as format_bytes
+
+from app.views.helpers.uploads import process_upload_jobs
+
+
+class Command(BaseCommand):
+    help = "Upload staged images to Cloudinary with a pool of worker threads"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=50,
+            help="Number of jobs claimed per batch",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None,
+            help="Concurrent uploads (defaults to IMAGE_UPLOAD_WORKERS)",
+        )
+        parser.add_argument(
+            "--watch", action="store_true",
+            help="Keep polling for new jobs instead of exiting when idle",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=2.0,
+            help="Seconds to sleep between polls in --watch mode",
+        )
+
+    def handle(self, *args, **options):
+        total_uploaded = total_failed = total_saved = 0
+        while True:
+            uploaded, failed, saved = process_upload_jobs(
+                options["batch_size"], options["workers"]
+            )
+            total_uploaded += uploaded
+            total_failed += failed
+            total_saved += saved
+            if uploaded or failed:
+                self.stdout.write(
+                    f"Uploaded {uploaded} images, {failed} failed, "
+                    f"{format_bytes(saved)} saved by pre-processing..."
+                )
+            if uploaded:
+                continue
+            # Idle, or only failures left; retry those on a later pass
+            if not options["watch"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Uploaded {total_uploaded} images, {total_failed} failed, "
+            f"{format_bytes(total_saved)} saved by pre-processing."
+        ))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_imageasset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageuploadjob',
+            name='original_bytes',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imageuploadjob',
+            name='processed_bytes',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
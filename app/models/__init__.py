@@ -0,0 +1,11 @@
+from app.models.car import VehicleIndexPage, Vehicle  # noqa: F401
+from app.models.cars.feature import VehicleFeature  # noqa: F401
+from app.models.cars.category import (  # noqa: F401
+    VehicleCategory, VehicleCategoryRelation
+)
+from app.models.cars.gallery_image import VehicleGalleryImage  # noqa: F401
+from app.models.cars.review import VehicleReview  # noqa: F401
+from app.models.cars.saved import SavedVehicle  # noqa: F401
+from app.models.models import SocialLinks, ContactMessage  # noqa: F401
+from app.models.cars.upload import ImageUploadJob  # noqa: F401
+from app.models.cars.asset import ImageAsset  # noqa: F401
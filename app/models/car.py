@@ -4,16 +4,22 @@ from django.utils.text import slugify
 from django.core.paginator import (
     EmptyPage, InvalidPage, PageNotAnInteger, Paginator
 )
-from wagtail.models import Page
+from wagtail.models import Page, PageManager
+from wagtail.query import PageQuerySet
 from wagtail.search import index
 from wagtail.admin.panels import FieldPanel, MultiFieldPanel, InlinePanel
 from wagtail.contrib.routable_page.models import RoutablePageMixin, route
 from wagtail.fields import RichTextField
-from django.db.models import Q
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
 # from modelcluster.fields import ParentalKey
 from django import forms
 
 from app.models.cars.feature import VehicleFeature
+from carhouse.mixins.dirty_fields import DirtyFieldsMixin
+
+
+PLACEHOLDER_IMAGE = "/static/images/placeholder-car.jpg"
 
 
 class VehicleIndexPage(RoutablePageMixin, Page):
@@ -38,7 +44,8 @@ class VehicleIndexPage(RoutablePageMixin, Page):
     def get_vehicle_queryset(self, request):
         """Get base queryset of vehicles with filters applied"""
         # Base queryset
-        vehicles = Vehicle.objects.filter(live=True, published=True)
+        vehicles = Vehicle.objects.filter(
+            live=True, published=True).with_cover_image()
 
         # Apply filters from GET parameters
         filters = {}
@@ -136,8 +143,10 @@ class VehicleIndexPage(RoutablePageMixin, Page):
             page_obj = paginator.get_page(1)
 
         # Add to context
+        from app.views.helpers.saved import get_saved_on_page
         context.update({
             'vehicles': page_obj,
+            'saved_vehicle_ids': get_saved_on_page(request.user, page_obj),
             'is_paginated': page_obj.has_other_pages(),
             'total_vehicles': vehicles.count(),
             'current_filters': {k: v for k, v in request.GET.items()},
@@ -155,7 +164,7 @@ class VehicleIndexPage(RoutablePageMixin, Page):
         context = self.get_context(request)
         vehicles = Vehicle.objects.filter(
             live=True, published=True, categories__slug=category
-        )
+        ).with_cover_image()
         context['vehicles'] = self._paginate_queryset(vehicles, request)
         context['category'] = category
         return self.render(request, template="app/cars/category.html",
@@ -179,7 +188,36 @@ class VehicleIndexPage(RoutablePageMixin, Page):
             return paginator.get_page(1)
 
 
-class Vehicle(Page):
+def image_url():
+    """The optimized image URL of a row, else its plain URL, else NULL"""
+    return Coalesce(
+        NullIf('optimized_image_url', Value('')),
+        NullIf('cloudinary_image_url', Value('')),
+    )
+
+
+class VehicleQuerySet(PageQuerySet):
+
+    def with_cover_image(self):
+        """
+        Annotate ``cover_image_url``: the vehicle's own image, else the
+        URL of its first live gallery image, else NULL.
+        * One correlated subquery for the whole listing, instead of a
+            query per card from ``primary_image``.
+        """
+        from app.models.cars.gallery_image import VehicleGalleryImage
+
+        gallery = VehicleGalleryImage.objects.filter(
+            vehicle=OuterRef('pk'), live=True
+        ).annotate(url=image_url()).exclude(url=None).order_by(
+            'sort_order', '-id'
+        )
+        return self.annotate(cover_image_url=Coalesce(
+            image_url(), Subquery(gallery.values('url')[:1])
+        ))
+
+
+class Vehicle(DirtyFieldsMixin, Page):
     """
     A model representing a vehicle (car) with enhanced features.
     """
@@ -262,6 +300,12 @@ class Vehicle(Page):
                                            null=True)
     cloudinary_image_url = models.URLField(blank=True, null=True)
     optimized_image_url = models.URLField(blank=True, null=True)
+    # Inline low-quality placeholder shown while the image loads
+    image_placeholder = models.TextField(blank=True, editable=False)
+    dominant_color = models.CharField(max_length=7, blank=True,
+                                      editable=False)
+
+    objects = PageManager.from_queryset(VehicleQuerySet)()
 
     # Search fields
     search_fields = Page.search_fields + [
@@ -350,22 +394,27 @@ class Vehicle(Page):
 
     @property
     def primary_image(self):
-        """Return the primary image for the vehicle"""
+        """
+        Return the primary image for the vehicle, falling back to its
+        first live gallery image, then to a placeholder.
+        * Listings should use Vehicle.objects.with_cover_image(); the
+            gallery is only queried here for a single vehicle, once per
+            instance.
+        """
+        if 'cover_image_url' in self.__dict__:
+            return self.cover_image_url or PLACEHOLDER_IMAGE
         if self.optimized_image_url:
             return self.optimized_image_url
         elif self.cloudinary_image_url:
             return self.cloudinary_image_url
         # Return first gallery image if no primary image
-        # Return first gallery image if no primary image
-        # Note: gallery_images relation needs to be implemented
-        # if hasattr(self, 'gallery_images'):
-        #     try:
-        #         gallery = self.gallery_images.filter(live=True).first()
-        #         if gallery and gallery.optimized_image_url:
-        #             return gallery.optimized_image_url
-        #     except AttributeError:
-        #         pass
-        return "/static/images/placeholder-car.jpg"
+        if '_gallery_cover' not in self.__dict__:
+            self._gallery_cover = self.gallery_images.filter(
+                live=True
+            ).annotate(url=image_url()).exclude(url=None).values_list(
+                'url', flat=True
+            ).first()
+        return self._gallery_cover or PLACEHOLDER_IMAGE
 
     class Meta(Page.Meta):
         verbose_name = "Vehicle"
@@ -0,0 +1,38 @@
+from django.db import models
+
+
+class ImageAsset(models.Model):
+    """
+    A Cloudinary image addressed by the SHA-256 of its content.
+    Identical uploads share one asset; ``ref_count`` is the number of
+    vehicles and gallery images pointing at its ``public_id``, plus
+    uploads about to be saved on one (see hold_assets).
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    public_id = models.CharField(max_length=255, unique=True)
+    secure_url = models.URLField()
+    optimized_url = models.URLField()
+    bytes = models.PositiveIntegerField(default=0)
+    image_placeholder = models.TextField(blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.public_id} ({self.ref_count} references)"
+
+    @property
+    def image_fields(self):
+        """The values stored on a model that displays this image"""
+        return {
+            'cloudinary_image_id': self.public_id,
+            'cloudinary_image_url': self.secure_url,
+            'optimized_image_url': self.optimized_url,
+            'image_placeholder': self.image_placeholder,
+            'dominant_color': self.dominant_color,
+        }
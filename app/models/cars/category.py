@@ -2,9 +2,10 @@ from django.db import models
 from django.utils.text import slugify
 
 from app.models.car import Vehicle
+from carhouse.mixins.dirty_fields import DirtyFieldsMixin
 
 
-class VehicleCategory(models.Model):
+class VehicleCategory(DirtyFieldsMixin, models.Model):
     """
     Categories for vehicles (e.g., SUV, Sedan, Truck)
     """
@@ -3,9 +3,10 @@ from cloudinary.models import CloudinaryField
 from wagtail.admin.panels import FieldPanel
 
 from app.models.car import Vehicle
+from carhouse.mixins.dirty_fields import DirtyFieldsMixin
 
 
-class VehicleGalleryImage(models.Model):
+class VehicleGalleryImage(DirtyFieldsMixin, models.Model):
     """
     Gallery images for a vehicle with enhanced functionality.
     """
@@ -16,6 +17,10 @@ class VehicleGalleryImage(models.Model):
                                            blank=True, null=True)
     cloudinary_image_url = models.URLField(blank=True, null=True)
     optimized_image_url = models.URLField(blank=True, null=True)
+    # Inline low-quality placeholder shown while the image loads
+    image_placeholder = models.TextField(blank=True, editable=False)
+    dominant_color = models.CharField(max_length=7, blank=True,
+                                      editable=False)
     caption = models.CharField(max_length=255, blank=True)
     alt_text = models.CharField(max_length=255, blank=True,
                                 help_text="Alternative text for accessibility")
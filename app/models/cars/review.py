@@ -1,9 +1,10 @@
 from django.conf import settings
 from django.db import models
 from app.models.car import Vehicle
+from carhouse.mixins.dirty_fields import DirtyFieldsMixin
 
 
-class VehicleReview(models.Model):
+class VehicleReview(DirtyFieldsMixin, models.Model):
     """
     User reviews for vehicles.
     """
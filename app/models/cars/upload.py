@@ -0,0 +1,49 @@
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+
+
+class ImageUploadJob(models.Model):
+    """
+    An image staged on local disk, waiting to be uploaded to Cloudinary
+    for the object it belongs to (a Vehicle or VehicleGalleryImage).
+    """
+    PENDING = 'pending'
+    UPLOADING = 'uploading'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (UPLOADING, 'Uploading'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    target = GenericForeignKey('content_type', 'object_id')
+
+    file_path = models.CharField(max_length=500)
+    folder = models.CharField(max_length=255, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    # Sizes before and after pre-processing; unset until it has run
+    original_bytes = models.PositiveBigIntegerField(null=True, blank=True)
+    processed_bytes = models.PositiveBigIntegerField(null=True, blank=True)
+    image_placeholder = models.TextField(blank=True)
+    dominant_color = models.CharField(max_length=7, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['pk']
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+            models.Index(fields=['content_type', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.pk} ({self.status}) for {self.content_type}"
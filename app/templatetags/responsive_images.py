@@ -0,0 +1,75 @@
+from django import template
+from django.utils.html import format_html
+
+from app.views.helpers.responsive import responsive_image
+
+register = template.Library()
+
+
+def _image_parts(image):
+    """
+    Return (public_id, fallback url, placeholder style) for a model,
+    dict or public id.
+    """
+    if isinstance(image, str):
+        return image, "", ""
+    if isinstance(image, dict):
+        get = image.get
+    else:
+        def get(name):
+            return getattr(image, name, None)
+    fallback = get("primary_image") or get("optimized_image_url") or \
+        get("cloudinary_image_url") or ""
+    return get("cloudinary_image_id"), fallback, _placeholder_style(
+        get("image_placeholder"), get("dominant_color")
+    )
+
+
+def _placeholder_style(placeholder, color):
+    """
+    Inline CSS painting the placeholder behind an image until it loads;
+    the browser's upscaling of the tiny image blurs it.
+    """
+    layers = []
+    if color:
+        layers.append(f"background-color:{color}")
+    if placeholder:
+        layers.append(f"background-image:url({placeholder});"
+                      f"background-size:cover;background-position:center")
+    return ";".join(layers)
+
+
+@register.simple_tag
+def image_srcset(image, preset="card"):
+    """The srcset string for an image, or '' if it has none"""
+    public_id, _, _ = _image_parts(image)
+    responsive = responsive_image(public_id, preset)
+    return responsive.srcset if responsive else ""
+
+
+@register.simple_tag
+def responsive_img(image, preset="card", alt="", css_class="",
+                   loading="lazy"):
+    """
+    Render an <img> with srcset/sizes for a Cloudinary image preset.
+    * Accepts a Vehicle, VehicleGalleryImage, a card dict or a public id.
+    * Images without a public id fall back to their plain URL.
+    * A stored placeholder and dominant colour are inlined as the
+        image's background, so the card is painted immediately.
+
+    Usage: {% responsive_img vehicle "card" alt=vehicle.title %}
+    """
+    public_id, fallback, style = _image_parts(image)
+    style = format_html(' style="{}"', style) if style else ""
+    responsive = responsive_image(public_id, preset)
+    if responsive is None:
+        return format_html(
+            '<img class="{}" src="{}" alt="{}" loading="{}"{}>',
+            css_class, fallback, alt, loading, style,
+        )
+    return format_html(
+        '<img class="{}" src="{}" srcset="{}" sizes="{}" alt="{}" '
+        'loading="{}"{}>',
+        css_class, responsive.src, responsive.srcset, responsive.sizes,
+        alt, loading, style,
+    )
@@ -1,3 +1,1673 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from django.db import DatabaseError, IntegrityError
+from django.http import Http404
+from django.template import Context, Template
+from django.db import connection, connections
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from wagtail.models import Page
+
+from app.forms.car import VehicleForm, VehicleGalleryImageFormSet
+from app.models.car import Vehicle, VehicleIndexPage
+from app.models.cars.asset import ImageAsset
+from app.models.cars.category import VehicleCategory
+from app.models.cars.gallery_image import VehicleGalleryImage
+from app.models.cars.review import VehicleReview
+from app.models.cars.saved import SavedVehicle
+from app.models.cars.upload import ImageUploadJob
+from app.views.helpers.cloudinary import FakeCloudinaryImageHandler
+from app.views.helpers.image_processing import (
+    ImageRejected, image_placeholder, optimize_image, optimize_uploads
+)
+from app.views.helpers.assets import referenced_public_ids, release_images
+from app.views.helpers import caching, invalidation, micro_cache
+from app.views.helpers.responsive import (
+    _build_responsive_image, responsive_image
+)
+from app.views.helpers.saved import get_saved_on_page, get_saved_vehicle_ids
+from app.views.helpers.storefront import _build_storefront
+from app.views.car.user_vehicle import VehicleGalleryMixin
+from app.views.helpers.upload_handler import (
+    RejectedUpload, ValidatingImageUploadHandler
+)
+from app.views.helpers.uploads import stage_image_upload
+from authentication.models.profile import Profile
+from carhouse import database
+from carhouse.cache import two_level
+from carhouse.middleware import rate_limit
+from carhouse.routers import ReplicaRouter, replica_state, use_primary
+
+
+def create_vehicle(parent, user, **kwargs):
+    """Create a published vehicle page under the given index page"""
+    fields = {
+        'title': 'Test Vehicle', 'year': 2020, 'make': 'Toyota',
+        'model': 'Camry', 'price': 20000, 'mileage': 1000,
+        'color': 'red', 'fuel_type': 'petrol', 'transmission': 'manual',
+        'listed_by': user,
+    }
+    fields.update(kwargs)
+    return parent.add_child(instance=Vehicle(**fields))
+
+
+def image_file(name='car.png', size=(8, 8), color='red'):
+    """Return an uploaded PNG image"""
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
+
+class VehicleTestCase(TestCase):
+    """Base test case with a vehicle index page and a seller"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', password='pass')
+        root = Page.objects.get(depth=1)
+        self.index = root.add_child(
+            instance=VehicleIndexPage(title='Vehicles', slug='vehicles')
+        )
+
+
+class SavedVehicleTests(VehicleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.vehicles = [
+            create_vehicle(self.index, self.seller, title=f'Car {i}',
+                           slug=f'car-{i}')
+            for i in range(3)
+        ]
+        self.client.force_login(self.user)
+
+    def post_json(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse(name), json.dumps(data),
+                                    content_type='application/json')
+
+    def test_toggle_saves_then_unsaves(self):
+        vehicle = self.vehicles[0]
+        response = self.post_json('app:save_vehicle',
+                                  {'vehicle_id': vehicle.pk})
+        self.assertEqual(response.json(), {'saved': True})
+        self.assertIn(vehicle.pk, get_saved_vehicle_ids(self.user))
+
+        response = self.post_json('app:save_vehicle',
+                                  {'vehicle_id': vehicle.pk})
+        self.assertEqual(response.json(), {'saved': False})
+        self.assertFalse(SavedVehicle.objects.exists())
+        self.assertNotIn(vehicle.pk, get_saved_vehicle_ids(self.user))
+
+    def test_explicit_save_is_idempotent(self):
+        vehicle = self.vehicles[0]
+        for _ in range(2):
+            response = self.post_json(
+                'app:save_vehicle',
+                {'vehicle_id': vehicle.pk, 'action': 'save'}
+            )
+            self.assertEqual(response.json(), {'saved': True})
+        self.assertEqual(SavedVehicle.objects.count(), 1)
+
+    def test_bulk_save_and_unsave(self):
+        ids = [vehicle.pk for vehicle in self.vehicles]
+        response = self.post_json('app:bulk_save_vehicles',
+                                  {'action': 'save', 'vehicle_ids': ids})
+        self.assertEqual(response.json()['saved_count'], 3)
+
+        response = self.post_json('app:bulk_save_vehicles',
+                                  {'action': 'unsave', 'vehicle_ids': ids[:2]})
+        self.assertEqual(response.json()['saved_count'], 1)
+        self.assertEqual(get_saved_vehicle_ids(self.user), {ids[2]})
+
+    def test_changes_drop_the_cached_set(self):
+        from app.views.helpers.saved import save_vehicles, unsave_vehicles
+
+        key = f'saved_vehicles:{self.user.pk}'
+        first, second = self.vehicles[0].pk, self.vehicles[1].pk
+        get_saved_vehicle_ids(self.user)
+        # Two changes committing in either order both show on reload
+        with self.captureOnCommitCallbacks(execute=True):
+            save_vehicles(self.user, [first])
+            self.assertIsNone(cache.get(key))
+            get_saved_vehicle_ids(self.user)
+            save_vehicles(self.user, [second])
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(get_saved_vehicle_ids(self.user), {first, second})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            unsave_vehicles(self.user, [first])
+        self.assertEqual(get_saved_vehicle_ids(self.user), {second})
+
+    def test_page_marking_uses_cached_set(self):
+        SavedVehicle.objects.create(user=self.user, vehicle=self.vehicles[1])
+        get_saved_vehicle_ids(self.user)
+
+        with self.assertNumQueries(0):
+            saved = get_saved_on_page(self.user, self.vehicles)
+        self.assertEqual(saved, {self.vehicles[1].pk})
+
+
+class ListingCounterTests(VehicleTestCase):
+
+    def counters(self, user=None):
+        profile = Profile.objects.get(user=user or self.seller)
+        return (profile.listing_count, profile.active_listings_count,
+                profile.sold_listings_count)
+
+    def test_counters_follow_vehicle_lifecycle(self):
+        vehicle = create_vehicle(self.index, self.seller)
+        create_vehicle(self.index, self.seller, slug='second')
+        self.assertEqual(self.counters(), (2, 2, 0))
+
+        vehicle = Vehicle.objects.get(pk=vehicle.pk)
+        vehicle.sold = True
+        vehicle.save()
+        self.assertEqual(self.counters(), (2, 1, 1))
+
+        vehicle.published = False
+        vehicle.sold = False
+        vehicle.save()
+        self.assertEqual(self.counters(), (2, 1, 0))
+
+        vehicle.delete()
+        self.assertEqual(self.counters(), (1, 1, 0))
+
+    def test_unpublish_and_reassign(self):
+        vehicle = create_vehicle(self.index, self.seller)
+        vehicle.unpublish()
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+        dealer = User.objects.create_user('dealer', password='pass')
+        vehicle = Vehicle.objects.get(pk=vehicle.pk)
+        vehicle.listed_by = dealer
+        vehicle.save()
+        self.assertEqual(self.counters(), (0, 0, 0))
+        self.assertEqual(self.counters(dealer), (1, 0, 0))
+
+    def test_reconcile_repairs_counters(self):
+        create_vehicle(self.index, self.seller)
+        Profile.objects.filter(user=self.seller).update(
+            listing_count=7, active_listings_count=0)
+
+        call_command('reconcile_listing_counters', batch_size=1,
+                     stdout=StringIO())
+        self.assertEqual(self.counters(), (1, 1, 0))
+
+
+class CoverImageTests(VehicleTestCase):
+
+    def add_vehicles(self, count):
+        for i in range(count):
+            vehicle = create_vehicle(self.index, self.seller,
+                                     title=f'Gallery {i}',
+                                     slug=f'gallery-{uuid4().hex}')
+            VehicleGalleryImage.objects.create(
+                vehicle=vehicle, sort_order=1,
+                cloudinary_image_url=f'https://img.test/{i}-second.jpg')
+            VehicleGalleryImage.objects.create(
+                vehicle=vehicle, sort_order=0,
+                optimized_image_url=f'https://img.test/{i}-first.jpg')
+
+    def list_vehicles(self):
+        """Render the listing and every card's image; count queries"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('app:cars_list'))
+            images = [vehicle.primary_image
+                      for vehicle in response.context['vehicles']]
+        self.assertEqual(response.status_code, 200)
+        return images, len(queries)
+
+    def test_cover_image_falls_back_to_gallery(self):
+        own = create_vehicle(self.index, self.seller, slug='own',
+                             optimized_image_url='https://img.test/own.jpg')
+        VehicleGalleryImage.objects.create(
+            vehicle=own, optimized_image_url='https://img.test/unused.jpg')
+        hidden = create_vehicle(self.index, self.seller, slug='hidden')
+        VehicleGalleryImage.objects.create(
+            vehicle=hidden, live=False,
+            optimized_image_url='https://img.test/hidden.jpg')
+        self.add_vehicles(1)
+
+        covers = {
+            vehicle.pk: vehicle.primary_image
+            for vehicle in Vehicle.objects.with_cover_image()
+        }
+        gallery = Vehicle.objects.get(title='Gallery 0')
+        self.assertEqual(covers, {
+            own.pk: 'https://img.test/own.jpg',
+            hidden.pk: '/static/images/placeholder-car.jpg',
+            gallery.pk: 'https://img.test/0-first.jpg',
+        })
+        # Without the annotation a single vehicle queries its gallery once
+        with self.assertNumQueries(1):
+            for _ in range(4):
+                self.assertEqual(gallery.primary_image,
+                                 'https://img.test/0-first.jpg')
+
+    def test_list_view_query_count_is_constant(self):
+        self.add_vehicles(2)
+        _, baseline = self.list_vehicles()
+        self.add_vehicles(6)
+        images, queries = self.list_vehicles()
+
+        self.assertEqual(queries, baseline)
+        self.assertEqual(len(images), 8)
+        self.assertTrue(all(url.endswith('-first.jpg') for url in images))
+
+
+class SellerStorefrontTests(VehicleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.vehicle = create_vehicle(self.index, self.seller, title='Camry')
+        self.url = Profile.objects.get(user=self.seller).get_absolute_url()
+
+    def test_storefront_lists_active_vehicles(self):
+        create_vehicle(self.index, self.seller, title='Sold Car',
+                       slug='sold', sold=True)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        titles = [vehicle['title'] for vehicle in response.context['vehicles']]
+        self.assertEqual(titles, ['Camry'])
+        self.assertEqual(response.context['seller']['active_listings_count'],
+                         1)
+
+    def test_cached_storefront_needs_only_the_seller_lookup(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_storefront_build_loads_cards_in_one_query(self):
+        for i in range(5):
+            create_vehicle(self.index, self.seller, slug=f'card-{i}')
+        # The seller's profile, then every card with its image fields
+        with self.assertNumQueries(2):
+            _build_storefront(self.seller.pk, None)
+
+    def test_new_listing_invalidates_storefront(self):
+        self.client.get(self.url)
+        create_vehicle(self.index, self.seller, title='Corolla',
+                       slug='corolla')
+        response = self.client.get(self.url)
+        titles = [vehicle['title'] for vehicle in response.context['vehicles']]
+        self.assertEqual(titles, ['Corolla', 'Camry'])
+
+    def test_keyset_pagination(self):
+        for i in range(12):
+            create_vehicle(self.index, self.seller, slug=f'extra-{i}')
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.context['vehicles']), 12)
+
+        cursor = response.context['next_cursor']
+        response = self.client.get(self.url, {'after': cursor})
+        self.assertEqual(
+            [vehicle['id'] for vehicle in response.context['vehicles']],
+            [self.vehicle.pk]
+        )
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_unknown_seller_returns_404(self):
+        response = self.client.get(
+            reverse('app:profile_detail', kwargs={'username': 'nobody'}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ImageUploadTestCase(VehicleTestCase):
+    """Runs uploads against the in-memory Cloudinary backend"""
+    handler = 'app.views.helpers.cloudinary.FakeCloudinaryImageHandler'
+
+    def setUp(self):
+        super().setUp()
+        staging = tempfile.TemporaryDirectory()
+        self.addCleanup(staging.cleanup)
+        settings = override_settings(
+            IMAGE_UPLOAD_HANDLER=self.handler,
+            IMAGE_UPLOAD_STAGING_DIR=staging.name,
+            IMAGE_PROCESS_WORKERS=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        FakeCloudinaryImageHandler.reset()
+        self.vehicle = create_vehicle(self.index, self.seller)
+
+    def process_uploads(self):
+        call_command('process_image_uploads', stdout=StringIO())
+
+
+class ImageUploadPipelineTests(ImageUploadTestCase):
+
+    def test_staged_images_upload_in_background(self):
+        gallery = VehicleGalleryImage.objects.create(vehicle=self.vehicle)
+        jobs = [
+            stage_image_upload(self.vehicle, image_file(), 'vehicles'),
+            stage_image_upload(gallery, image_file(color='blue'),
+                               'vehicles/gallery'),
+        ]
+        self.assertTrue(all(os.path.exists(job.file_path) for job in jobs))
+        self.assertIsNone(
+            Vehicle.objects.get(pk=self.vehicle.pk).cloudinary_image_url)
+
+        self.process_uploads()
+        vehicle = Vehicle.objects.get(pk=self.vehicle.pk)
+        gallery.refresh_from_db()
+        self.assertTrue(vehicle.cloudinary_image_id.startswith('vehicles/'))
+        self.assertIn('q_auto', vehicle.optimized_image_url)
+        self.assertTrue(gallery.cloudinary_image_url)
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 2)
+        self.assertFalse(any(os.path.exists(job.file_path) for job in jobs))
+        self.assertEqual(
+            ImageUploadJob.objects.filter(status=ImageUploadJob.DONE).count(),
+            2
+        )
+
+    def test_invalid_upload_fails_after_retries(self):
+        bad = SimpleUploadedFile('notes.png', b'not an image')
+        job = stage_image_upload(self.vehicle, bad, 'vehicles')
+
+        for attempt in range(3):
+            self.process_uploads()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts),
+                         (ImageUploadJob.FAILED, 3))
+        self.assertIn('Unsupported image type', job.error)
+        self.assertFalse(os.path.exists(job.file_path))
+
+    def test_a_job_that_cannot_be_stored_fails_alone(self):
+        from app.views.helpers import uploads
+
+        gallery = VehicleGalleryImage.objects.create(vehicle=self.vehicle)
+        broken = stage_image_upload(self.vehicle, image_file(), 'vehicles')
+        job = stage_image_upload(gallery, image_file(color='blue'),
+                                 'vehicles/gallery')
+        apply_upload = uploads._apply_upload
+
+        def apply_or_fail(job, fields):
+            if job.pk == broken.pk:
+                raise IntegrityError('target row is gone')
+            apply_upload(job, fields)
+
+        with patch.object(uploads, '_apply_upload', apply_or_fail), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.process_uploads()
+        broken.refresh_from_db()
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImageUploadJob.DONE)
+        self.assertEqual(broken.status, ImageUploadJob.FAILED)
+        self.assertIn('target row is gone', broken.error)
+        self.assertFalse(os.path.exists(broken.file_path))
+        # The upload nothing stores was not kept
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 1)
+
+
+class ImageDeduplicationTests(ImageUploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = create_vehicle(self.index, self.seller, slug='other')
+
+    def asset(self):
+        return ImageAsset.objects.get()
+
+    def test_repeated_content_reuses_one_asset(self):
+        for vehicle in (self.vehicle, self.other):
+            stage_image_upload(vehicle, image_file(), 'vehicles')
+        self.process_uploads()
+
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 1)
+        asset = self.asset()
+        self.assertEqual(asset.ref_count, 2)
+        self.assertEqual(
+            set(Vehicle.objects.values_list('cloudinary_image_id',
+                                            flat=True)),
+            {asset.public_id}
+        )
+
+        # A later upload of the same bytes is not sent again
+        stage_image_upload(self.vehicle, image_file(name='copy.png'),
+                           'vehicles')
+        self.process_uploads()
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 1)
+        self.assertEqual(self.asset().ref_count, 2)
+
+    def test_asset_is_deleted_with_its_last_reference(self):
+        for vehicle in (self.vehicle, self.other):
+            stage_image_upload(vehicle, image_file(), 'vehicles')
+        self.process_uploads()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Vehicle.objects.get(pk=self.vehicle.pk).delete()
+        self.assertEqual(self.asset().ref_count, 1)
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 1)
+
+        # Replacing the image releases the old one
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_image_upload(self.other, image_file(color='blue'),
+                               'vehicles')
+            self.process_uploads()
+        asset = self.asset()
+        self.assertEqual(asset.ref_count, 1)
+        self.assertEqual(list(FakeCloudinaryImageHandler.assets),
+                         [asset.public_id])
+
+    def test_replaced_image_is_kept_for_revisions(self):
+        stage_image_upload(self.vehicle, image_file(), 'vehicles')
+        self.process_uploads()
+        vehicle = Vehicle.objects.get(pk=self.vehicle.pk)
+        old_id = vehicle.cloudinary_image_id
+        vehicle.save_revision()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_image_upload(self.vehicle, image_file(color='blue'),
+                               'vehicles')
+            self.process_uploads()
+        self.assertNotEqual(
+            Vehicle.objects.get(pk=self.vehicle.pk).cloudinary_image_id,
+            old_id
+        )
+        self.assertIn(old_id, FakeCloudinaryImageHandler.assets)
+        self.assertEqual(
+            ImageAsset.objects.get(public_id=old_id).ref_count, 0
+        )
+
+    def test_reused_asset_is_held_until_its_row_is_saved(self):
+        from app.views.helpers.assets import delete_unreferenced
+        from app.views.helpers.uploads import upload_deduplicated
+
+        stage_image_upload(self.vehicle, image_file(), 'vehicles')
+        self.process_uploads()
+        with self.captureOnCommitCallbacks(execute=True):
+            Vehicle.objects.get(pk=self.vehicle.pk).delete()
+        # Kept: no reference, but not released (and collected) yet
+        ImageAsset.objects.update(ref_count=0)
+
+        handler = FakeCloudinaryImageHandler()
+        results = upload_deduplicated(handler, [(image_file(), 'vehicles')])
+        self.assertEqual(self.asset().ref_count, 1)
+        # A concurrent release of the last reference can't delete it
+        self.assertEqual(delete_unreferenced([self.asset().public_id]), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.cloudinary_image_id = results[0]['cloudinary_image_id']
+            self.other.save()
+            release_images([self.other.cloudinary_image_id])
+        self.assertEqual(self.asset().ref_count, 1)
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 1)
+
+
+class ImagePreprocessingTests(ImageUploadTestCase):
+
+    def test_optimize_image_normalizes_orientation_and_metadata(self):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        exif[0x010F] = 'Camera Maker'
+        buffer = BytesIO()
+        Image.new('RGB', (400, 100), 'red').save(buffer, format='JPEG',
+                                                 exif=exif)
+
+        data = optimize_image(buffer.getvalue(), max_dimension=200)
+        image = Image.open(BytesIO(data))
+        self.assertEqual(image.format, 'WEBP')
+        self.assertEqual(image.size, (50, 200))
+        self.assertFalse(image.getexif())
+
+    def test_unreadable_content_is_left_alone(self):
+        self.assertIsNone(optimize_image(b'<svg></svg>'))
+
+    def test_original_is_kept_when_it_is_smaller(self):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(buffer, format='WEBP',
+                                               quality=30)
+        self.assertIsNone(optimize_image(buffer.getvalue()))
+
+        # Metadata is stripped whatever the size
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera Maker'
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(buffer, format='WEBP',
+                                               quality=30, exif=exif)
+        data = optimize_image(buffer.getvalue())
+        self.assertFalse(Image.open(BytesIO(data)).getexif())
+
+    def test_heic_photos_are_converted(self):
+        from PIL import Image
+        from pillow_heif import from_pillow
+
+        buffer = BytesIO()
+        from_pillow(Image.new('RGB', (400, 100), 'red')).save(buffer)
+        data = optimize_image(buffer.getvalue(), max_dimension=200)
+        self.assertEqual(Image.open(BytesIO(data)).size, (200, 50))
+
+    def test_failed_processing_uploads_the_original(self):
+        from PIL import ImageOps
+
+        image = image_file()
+        with patch.object(ImageOps, 'exif_transpose',
+                          side_effect=OSError('broken data stream')):
+            [upload] = optimize_uploads([image])
+        self.assertIs(upload, image)
+        self.assertEqual(upload.placeholder, {})
+
+    @override_settings(IMAGE_PROCESS_WORKERS=1)
+    def test_process_pool_is_created_once_without_forking(self):
+        from app.views.helpers import image_processing
+
+        with patch.object(image_processing, '_process_pool', None):
+            with ThreadPoolExecutor(max_workers=8) as threads:
+                pools = set(threads.map(
+                    lambda _: image_processing.get_process_pool(), range(8)
+                ))
+            self.assertEqual(len(pools), 1)
+            pool = pools.pop()
+            self.addCleanup(pool.shutdown)
+            self.assertNotEqual(
+                pool._mp_context.get_start_method(), 'fork'
+            )
+
+    def test_decompression_bombs_are_rejected(self):
+        from PIL import Image
+
+        data = image_file(size=(64, 64)).read()
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 100):
+            with self.assertRaises(ImageRejected):
+                optimize_image(data)
+            self.assertEqual(image_placeholder(data),
+                             {'image_placeholder': '', 'dominant_color': ''})
+
+            job = stage_image_upload(self.vehicle, image_file(size=(64, 64)),
+                                     'vehicles')
+            self.process_uploads()
+        job.refresh_from_db()
+        # Not retried
+        self.assertEqual((job.status, job.attempts),
+                         (ImageUploadJob.FAILED, 1))
+        self.assertIn('too large', job.error)
+        self.assertFalse(os.path.exists(job.file_path))
+        self.assertEqual(FakeCloudinaryImageHandler.assets, {})
+
+    @override_settings(IMAGE_PROCESS_WORKERS=2)
+    def test_worker_preprocesses_in_process_pool(self):
+        job = stage_image_upload(
+            self.vehicle, image_file('big.png', size=(1200, 900)), 'vehicles'
+        )
+        output = StringIO()
+        call_command('process_image_uploads', stdout=output)
+
+        job.refresh_from_db()
+        self.assertTrue(job.file_path.endswith('.webp'))
+        self.assertLess(job.processed_bytes, job.original_bytes)
+        self.assertIn('saved by pre-processing', output.getvalue())
+        self.assertEqual(ImageAsset.objects.get().sha256, job.sha256)
+
+
+class ImagePlaceholderTests(ImageUploadTestCase):
+
+    def test_placeholder_is_tiny_inline_webp(self):
+        from PIL import Image
+
+        buffer = BytesIO()
+        image = Image.new('RGB', (1200, 900), (200, 30, 30))
+        image.paste((20, 20, 220), (0, 0, 300, 900))
+        image.save(buffer, format='JPEG')
+
+        result = image_placeholder(buffer.getvalue())
+        self.assertTrue(result['image_placeholder'].startswith(
+            'data:image/webp;base64,'))
+        self.assertLess(len(result['image_placeholder']), 400)
+        red, green, blue = (
+            int(result['dominant_color'][i:i + 2], 16) for i in (1, 3, 5)
+        )
+        self.assertGreater(red, 150)
+        self.assertLess(blue, 100)
+        self.assertEqual(image_placeholder(b'<svg></svg>'),
+                         {'image_placeholder': '', 'dominant_color': ''})
+
+    def test_placeholder_stored_when_upload_is_processed(self):
+        gallery = VehicleGalleryImage.objects.create(vehicle=self.vehicle)
+        stage_image_upload(self.vehicle, image_file(color='green'),
+                           'vehicles')
+        stage_image_upload(gallery, image_file(color='green'),
+                           'vehicles/gallery')
+        self.process_uploads()
+
+        vehicle = Vehicle.objects.get(pk=self.vehicle.pk)
+        gallery.refresh_from_db()
+        self.assertTrue(vehicle.image_placeholder.startswith('data:'))
+        # Computed from the lossy WebP, so green give or take a little
+        self.assertRegex(vehicle.dominant_color, r'^#0.[78].0.$')
+        # Identical content reuses the asset and its placeholder
+        self.assertEqual(gallery.image_placeholder,
+                         vehicle.image_placeholder)
+        self.assertEqual(ImageAsset.objects.get().dominant_color,
+                         vehicle.dominant_color)
+
+    def test_backfill_command(self):
+        handler = FakeCloudinaryImageHandler()
+        images = [image_file(color=color) for color in ('red', 'blue')]
+        uploads = [handler.upload_image(image, folder='vehicles')
+                   for image in images]
+        Vehicle.objects.filter(pk=self.vehicle.pk).update(
+            cloudinary_image_id=uploads[0]['public_id'])
+        gallery = [
+            VehicleGalleryImage.objects.create(
+                vehicle=self.vehicle, cloudinary_image_id=upload['public_id'])
+            for upload in uploads
+        ]
+        VehicleGalleryImage.objects.create(
+            vehicle=self.vehicle, cloudinary_image_id='vehicles/missing')
+
+        output = StringIO()
+        call_command('backfill_image_placeholders', '--batch-size', '2',
+                     stdout=output)
+        self.assertIn('for 3 images, 1 failed', output.getvalue())
+        self.assertEqual(
+            Vehicle.objects.get(pk=self.vehicle.pk).dominant_color,
+            '#ff0000')
+        gallery[1].refresh_from_db()
+        self.assertEqual(gallery[1].dominant_color, '#0000ff')
+
+    def test_card_inlines_placeholder(self):
+        html = Template(
+            '{% load responsive_images %}{% responsive_img image %}'
+        ).render(Context({'image': {
+            'cloudinary_image_id': 'vehicles/abc',
+            'image_placeholder': 'data:image/webp;base64,AAAA',
+            'dominant_color': '#102030',
+        }}))
+        self.assertIn('style="background-color:#102030;'
+                      'background-image:url(data:image/webp;base64,AAAA)',
+                      html)
+
+
+class OrphanedImageTests(ImageUploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'gc.json')
+        stage_image_upload(self.vehicle, image_file(), 'vehicles')
+        self.process_uploads()
+        self.kept = self.vehicle_image_id()
+
+        assets = FakeCloudinaryImageHandler.assets
+        old = timezone.now() - timedelta(days=2)
+        for i in range(150):
+            assets[f'vehicles/orphan-{i:03}'] = {'created_at': old}
+        assets['vehicles/fresh'] = {'created_at': timezone.now()}
+        assets['other-app/logo'] = {'created_at': old}
+
+    def vehicle_image_id(self):
+        return Vehicle.objects.get(pk=self.vehicle.pk).cloudinary_image_id
+
+    def collect(self, **options):
+        output = StringIO()
+        call_command('collect_orphaned_images', checkpoint=self.checkpoint,
+                     page_size=40, stdout=output, **options)
+        return output.getvalue()
+
+    def test_referenced_ids_include_every_source(self):
+        gallery = VehicleGalleryImage.objects.create(
+            vehicle=self.vehicle, cloudinary_image_id='vehicles/gallery/a',
+            image='image/upload/v1/vehicles/gallery/b.jpg',
+        )
+        self.assertEqual(
+            referenced_public_ids(),
+            {self.kept, 'vehicles/gallery/a', 'vehicles/gallery/b'}
+        )
+        gallery.delete()
+
+    def test_referenced_ids_include_vehicle_revisions(self):
+        self.vehicle.cloudinary_image_id = 'vehicles/orphan-007'
+        self.vehicle.save_revision()
+        self.assertIn('vehicles/orphan-007', referenced_public_ids())
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.collect(dry_run=True)
+        self.assertIn('Would delete 150 orphaned images', output)
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 153)
+
+    def test_only_app_folders_are_scanned_by_default(self):
+        self.collect()
+        self.assertIn('other-app/logo', FakeCloudinaryImageHandler.assets)
+
+    def test_whole_account_is_scanned_with_all(self):
+        with self.assertRaises(CommandError):
+            self.collect(scan_all=True, prefixes=['vehicles/'])
+        self.collect(scan_all=True)
+        self.assertEqual(
+            set(FakeCloudinaryImageHandler.assets),
+            {self.kept, 'vehicles/fresh'}
+        )
+
+    def test_orphans_are_deleted_in_batches(self):
+        self.collect()
+        self.assertEqual(
+            set(FakeCloudinaryImageHandler.assets),
+            {self.kept, 'vehicles/fresh', 'other-app/logo'}
+        )
+        self.assertTrue(all(
+            len(batch) <= 100
+            for batch in FakeCloudinaryImageHandler.delete_calls
+        ))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_interrupted_run_resumes_from_checkpoint(self):
+        delete_images = FakeCloudinaryImageHandler.delete_images
+        calls = []
+
+        def flaky_delete(handler, public_ids):
+            calls.append(public_ids)
+            if len(calls) == 3:
+                raise Exception('Cloudinary unavailable')
+            return delete_images(handler, public_ids)
+
+        FakeCloudinaryImageHandler.delete_images = flaky_delete
+        self.addCleanup(setattr, FakeCloudinaryImageHandler,
+                        'delete_images', delete_images)
+        with self.assertRaises(Exception):
+            self.collect()
+        with open(self.checkpoint) as fl:
+            self.assertEqual(json.load(fl)['scanned'], 80)
+
+        output = self.collect()
+        self.assertIn('Resuming after 80 images', output)
+        self.assertEqual(len(FakeCloudinaryImageHandler.assets), 3)
+
+
+class SlowFakeCloudinaryImageHandler(FakeCloudinaryImageHandler):
+    """Fake backend with network latency; fails files named fail*"""
+    latency = 0.2
+
+    def upload_image(self, image, *args, **kwargs):
+        time.sleep(self.latency)
+        if os.path.basename(image.name).startswith('fail'):
+            raise Exception("Cloudinary Error: upload rejected")
+        return super().upload_image(image, *args, **kwargs)
+
+
+@override_settings(IMAGE_UPLOADS_DEFERRED=False, IMAGE_UPLOAD_WORKERS=5)
+class GalleryUploadTests(ImageUploadTestCase):
+    handler = 'app.tests.SlowFakeCloudinaryImageHandler'
+
+    def forms(self, *names):
+        form = VehicleForm(data={
+            'title': 'Test Vehicle', 'year': 2020, 'make': 'Toyota',
+            'model': 'Camry', 'price': 20000, 'mileage': 1000,
+            'color': 'red', 'fuel_type': 'petrol', 'transmission': 'manual',
+            'condition': 'used', 'doors': 4, 'seats': 5,
+        }, instance=self.vehicle)
+        prefix = 'gallery_images'
+        data = {
+            f'{prefix}-TOTAL_FORMS': len(names),
+            f'{prefix}-INITIAL_FORMS': 0,
+        }
+        files = {}
+        for i, name in enumerate(names):
+            data[f'{prefix}-{i}-sort_order'] = i
+            # Distinct content, so no upload is deduplicated
+            files[f'{prefix}-{i}-image'] = image_file(name, size=(8 + i, 8))
+        formset = VehicleGalleryImageFormSet(data, files,
+                                             instance=self.vehicle)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        return form, formset
+
+    def save(self, form, formset):
+        view = VehicleGalleryMixin()
+        view.object = form.save(commit=False)
+        # Unused uploads are deleted once released, on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            return view.save_with_gallery(form, formset)
+
+    def test_gallery_uploads_run_concurrently(self):
+        form, formset = self.forms(*[f'car{i}.png' for i in range(5)])
+        started = time.monotonic()
+        self.assertTrue(self.save(form, formset))
+        elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 5 * SlowFakeCloudinaryImageHandler.latency)
+        images = VehicleGalleryImage.objects.filter(vehicle=self.vehicle)
+        self.assertEqual(images.count(), 5)
+        self.assertTrue(all(image.optimized_image_url for image in images))
+
+    def test_failed_upload_is_reported_on_its_form(self):
+        form, formset = self.forms('car.png', 'fail.png')
+        self.assertFalse(self.save(form, formset))
+
+        self.assertFalse(formset.forms[0].errors)
+        self.assertIn('upload rejected', formset.forms[1].errors['image'][0])
+        self.assertFalse(VehicleGalleryImage.objects.exists())
+        self.assertEqual(SlowFakeCloudinaryImageHandler.assets, {})
+
+    def test_rejected_image_is_reported_on_its_form(self):
+        from PIL import Image
+
+        form, formset = self.forms('car.png')
+        with patch.object(Image, 'MAX_IMAGE_PIXELS', 10):
+            self.assertFalse(self.save(form, formset))
+        self.assertIn('too large', formset.forms[0].errors['image'][0])
+        self.assertEqual(SlowFakeCloudinaryImageHandler.assets, {})
+
+    def test_new_vehicle_without_a_live_index_is_a_form_error(self):
+        VehicleIndexPage.objects.update(live=False)
+        form, formset = self.forms('car.png')
+        view = VehicleGalleryMixin()
+        view.object = Vehicle(title='New Vehicle', listed_by=self.seller)
+
+        self.assertFalse(view.save_with_gallery(form, formset))
+        self.assertIn('try again later', form.non_field_errors()[0])
+        self.assertIsNone(view.object.pk)
+        self.assertEqual(SlowFakeCloudinaryImageHandler.assets, {})
+
+    def test_uploads_are_discarded_on_rollback(self):
+        form, formset = self.forms('car.png', 'other.png')
+        formset.save = lambda: (_ for _ in ()).throw(IntegrityError())
+        with self.assertRaises(IntegrityError):
+            self.save(form, formset)
+        self.assertEqual(SlowFakeCloudinaryImageHandler.assets, {})
+
+
+class UploadHandlerTests(TestCase):
+
+    def stream(self, data, field_name='gallery_images-0-image',
+               chunk_size=1024, declared=None):
+        handler = ValidatingImageUploadHandler()
+        with self.assertRaises(StopFutureHandlers):
+            handler.new_file(field_name, 'car.png', 'image/png', declared)
+        for start in range(0, len(data), chunk_size):
+            handler.receive_data_chunk(data[start:start + chunk_size], start)
+        return handler, handler.file_complete(len(data))
+
+    def png(self, size=(64, 64)):
+        return image_file(size=size).read()
+
+    def test_valid_image_is_hashed_while_streaming(self):
+        data = self.png()
+        handler, upload = self.stream(data)
+        self.assertEqual(upload.sniffed_type, 'image/png')
+        self.assertEqual(upload.sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(upload.read(), data)
+        upload.close()
+
+    def test_wrong_type_is_rejected_before_touching_disk(self):
+        handler, upload = self.stream(b'%PDF-1.7' + b'0' * 20000)
+        self.assertIsInstance(upload, RejectedUpload)
+        self.assertIn('Unsupported image type', upload.upload_error)
+        self.assertIsNone(handler.file)
+
+    @override_settings(MAX_UPLOAD_SIZE=2048)
+    def test_oversized_image_is_rejected(self):
+        _, upload = self.stream(b'0' * 10, declared=4096)
+        self.assertIn('Image too large', upload.upload_error)
+
+        handler, upload = self.stream(self.png(size=(256, 256)) + b'0' * 4096)
+        self.assertIn('Image too large', upload.upload_error)
+        self.assertIsNone(handler.file)
+
+    @override_settings(MAX_UPLOAD_REQUEST_SIZE=100)
+    def test_oversized_request_is_refused(self):
+        response = self.client.post(reverse('app:contact'), {
+            'name': 'Buyer', 'image': image_file(),
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_fields_pass_through(self):
+        handler = ValidatingImageUploadHandler()
+        handler.new_file('document', 'notes.txt', 'text/plain', None)
+        self.assertEqual(handler.receive_data_chunk(b'notes', 0), b'notes')
+        self.assertIsNone(handler.file_complete(5))
+
+
+@override_settings(CLOUDINARY_CLOUD_NAME='carhouse')
+class ResponsiveImageTests(TestCase):
+
+    def test_preset_srcset(self):
+        image = responsive_image('vehicles/abc', 'card')
+        self.assertEqual(
+            image.src,
+            'https://res.cloudinary.com/carhouse/image/upload/'
+            'c_fill,ar_4:3,g_auto,w_640,q_auto,f_auto/vehicles/abc'
+        )
+        self.assertEqual(image.srcset.count(' 320w'), 1)
+        self.assertTrue(image.srcset.endswith('/vehicles/abc 800w'))
+        self.assertIn('100vw', image.sizes)
+        self.assertIsNone(responsive_image(None))
+
+    def test_urls_are_memoized(self):
+        _build_responsive_image.cache_clear()
+        for _ in range(12):
+            responsive_image('vehicles/abc', 'thumb')
+        info = _build_responsive_image.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 11))
+
+    def test_template_tag(self):
+        template = Template(
+            '{% load responsive_images %}'
+            '{% responsive_img image "hero" alt="Camry" %}'
+        )
+        html = template.render(Context({
+            'image': {'cloudinary_image_id': 'vehicles/abc'}
+        }))
+        self.assertIn('srcset="https://res.cloudinary.com/carhouse', html)
+        self.assertIn('sizes="100vw"', html)
+
+        html = template.render(Context({
+            'image': {'primary_image': '/static/placeholder.jpg'}
+        }))
+        self.assertIn('src="/static/placeholder.jpg"', html)
+        self.assertNotIn('srcset', html)
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        rate_limit.local_limiter.clear()
+
+    def test_window_edge_burst_is_not_doubled(self):
+        admitted = sum(
+            rate_limit.hit('edge', 10, 60, now=59.0).allowed
+            for _ in range(10)
+        )
+        self.assertEqual(admitted, 10)
+        # A fixed window would admit 10 more right after the boundary
+        result = rate_limit.hit('edge', 10, 60, now=61.0)
+        self.assertFalse(result.allowed)
+        # 10 * (1 - t / 60) + 1 <= 9 once t reaches 12s, 11s from now
+        self.assertEqual(result.retry_after, 11)
+        # The previous window's weight decays as the new one progresses
+        self.assertTrue(rate_limit.hit('edge', 10, 60, now=100.0).allowed)
+
+    def assert_never_over_admits(self):
+        barrier = threading.Barrier(40)
+
+        def request(_):
+            barrier.wait()
+            return rate_limit.hit('burst', 25, 60, now=1000.0).allowed
+
+        with ThreadPoolExecutor(max_workers=40) as executor:
+            admitted = sum(executor.map(request, range(40)))
+        self.assertEqual(admitted, 25)
+
+    def test_concurrent_requests_never_over_admit(self):
+        self.assert_never_over_admits()
+
+    def test_redis_pipeline_never_over_admits(self):
+        import fakeredis
+
+        client = fakeredis.FakeRedis()
+        with patch.object(rate_limit, 'get_redis_client',
+                          return_value=client):
+            self.assert_never_over_admits()
+        self.assertEqual(
+            int(client.get(cache.make_key('ratelimit:burst:16'))), 40)
+
+    @override_settings(RATELIMIT=2, RATELIMIT_WINDOW=60)
+    def test_middleware_headers(self):
+        url = reverse('app:cars_list')
+        response = self.client.get(url)
+        self.assertEqual(response['RateLimit-Limit'], '2')
+        self.assertEqual(response['RateLimit-Policy'], '2;w=60')
+        self.assertNotIn('Retry-After', response)
+
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['RateLimit-Remaining'], '0')
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    @override_settings(
+        RATELIMIT_POLICIES={
+            'auth': {'limit': 2, 'window': 60, 'key': 'ip'},
+            'search': {'limit': 3, 'window': 60, 'key': 'ip'},
+        },
+        RATELIMIT_ROUTES={
+            'authentication:login': ('auth', 1),
+            'app:search': ('search', 2),
+        },
+    )
+    def test_route_policies_have_separate_weighted_budgets(self):
+        login = reverse('authentication:login')
+        statuses = [self.client.get(login).status_code for _ in range(3)]
+        self.assertEqual(statuses[2], 429)
+        self.assertNotIn(429, statuses[:2])
+
+        response = self.client.get(reverse('app:cars_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['RateLimit-Limit'], '1000')
+
+        search = reverse('app:search')
+        self.assertEqual(self.client.get(search)['RateLimit-Remaining'], '1')
+        self.assertEqual(self.client.get(search).status_code, 429)
+
+    def test_client_keys(self):
+        factory = RequestFactory()
+        request = factory.get('/', REMOTE_ADDR='10.0.0.1',
+                              HTTP_X_API_KEY='secret')
+        request.user = User.objects.create_user('buyer')
+        self.assertEqual(rate_limit.client_key(request, 'ip'),
+                         'ip:10.0.0.1')
+        self.assertEqual(rate_limit.client_key(request, 'user'),
+                         f'user:{request.user.pk}')
+        self.assertTrue(
+            rate_limit.client_key(request, 'api_key').startswith('key:'))
+        self.assertNotIn('secret', rate_limit.client_key(request, 'api_key'))
+
+        anonymous = factory.get('/', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(rate_limit.client_key(anonymous, 'api_key'),
+                         'ip:10.0.0.2')
+
+    @override_settings(RATELIMIT=1)
+    def test_exempt_paths_skip_accounting(self):
+        for path in ('/static/css/site.css', '/media/car.jpg', '/health'):
+            response = self.client.get(path)
+            self.assertNotIn('RateLimit-Limit', response)
+        self.assertEqual(
+            self.client.get(reverse('app:cars_list')).status_code, 200)
+
+    @override_settings(RATELIMIT_SYNC_HITS=10, RATELIMIT_SYNC_INTERVAL=1000)
+    def test_local_tier_batches_shared_cache_traffic(self):
+        limiter = rate_limit.LocalRateLimiter()
+        with patch.object(rate_limit, '_count',
+                          wraps=rate_limit._count) as shared:
+            results = [limiter.hit('batched', 100, 60, now=10.0)
+                       for _ in range(25)]
+            self.assertEqual(shared.call_count, 3)
+            self.assertEqual(results[-1].remaining, 75)
+            # Time-based sync picks up the remaining local delta
+            limiter.hit('batched', 100, 60, now=11.5)
+            self.assertEqual(shared.call_count, 4)
+        self.assertEqual(cache.get('ratelimit:batched:0'), 26)
+
+    @override_settings(RATELIMIT_SYNC_HITS=5, RATELIMIT_SYNC_INTERVAL=60000)
+    def test_local_tier_overshoot_is_bounded(self):
+        workers = [rate_limit.LocalRateLimiter() for _ in range(4)]
+        admitted = 0
+        for i in range(200):
+            limiter = workers[i % len(workers)]
+            admitted += limiter.hit('shared', 50, 60, now=5.0).allowed
+        self.assertGreaterEqual(admitted, 50)
+        self.assertLessEqual(admitted, 50 + len(workers) * 5)
+
+    def test_policy_modes(self):
+        strict = rate_limit.RateLimitPolicy('strict', 5, 60)
+        approximate = strict._replace(mode='approximate')
+        with patch.object(rate_limit.local_limiter, 'hit') as local:
+            strict.hit('client')
+            local.assert_not_called()
+            approximate.hit('client', 2)
+            local.assert_called_once_with('client', 5, 60, 2)
+
+
+def two_level_cache(**options):
+    """A TwoLevelRedisCache on its own in-memory fake Redis server"""
+    from fakeredis import FakeConnection
+
+    # fakeredis shares one server per host
+    location = f'redis://{uuid4().hex[:12]}:6379/0'
+    return two_level.TwoLevelRedisCache(location, {'OPTIONS': {
+        'CONNECTION_POOL_KWARGS': {'connection_class': FakeConnection},
+        'L1_KEY_PREFIXES': ('hot:',),
+        **options,
+    }})
+
+
+class TwoLevelCacheTests(TestCase):
+    def wait_for_listener(self, cache_):
+        """Start the pub/sub listener (which clears L1 once subscribed)"""
+        cache_.get('hot:missing')
+        self.assertTrue(cache_.l1.subscribed.wait(5))
+
+    def test_hot_keys_are_served_from_the_process(self):
+        cache_ = two_level_cache()
+        self.wait_for_listener(cache_)
+        redis = cache_.client.get_client()
+        cache_.set('hot:a', 1)
+        cache_.set('cold:a', 1)
+        self.assertEqual(cache_.get('hot:a'), 1)
+        self.assertEqual(cache_.get('cold:a'), 1)
+
+        redis.delete(cache_.make_key('hot:a'), cache_.make_key('cold:a'))
+        self.assertEqual(cache_.get('hot:a'), 1)
+        self.assertIsNone(cache_.get('cold:a'))
+
+        # Writes through the cache are seen at once
+        cache_.set('hot:a', 2)
+        self.assertEqual(cache_.get('hot:a'), 2)
+        cache_.delete('hot:a')
+        self.assertIsNone(cache_.get('hot:a'))
+
+    def test_writes_invalidate_other_processes(self):
+        writer = two_level_cache()
+        reader = two_level.TwoLevelRedisCache(
+            writer._server, {'OPTIONS': writer._params['OPTIONS']})
+        # As if in another process
+        reader.l1 = two_level.LocalTier(('hot:',))
+        self.wait_for_listener(writer)
+        self.wait_for_listener(reader)
+
+        writer.set('hot:a', 1)
+        self.assertEqual(reader.get('hot:a'), 1)
+        self.assertIn(reader.make_key('hot:a'), reader.l1.entries)
+
+        writer.set('hot:a', 2)
+        deadline = time.monotonic() + 5
+        while reader.get('hot:a') != 2:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_clear_empties_other_processes(self):
+        writer = two_level_cache()
+        reader = two_level.TwoLevelRedisCache(
+            writer._server, {'OPTIONS': writer._params['OPTIONS']})
+        # As if in another process
+        reader.l1 = two_level.LocalTier(('hot:',))
+        self.wait_for_listener(writer)
+        self.wait_for_listener(reader)
+
+        writer.set('hot:a', 1)
+        self.assertEqual(reader.get('hot:a'), 1)
+        writer.clear()
+        deadline = time.monotonic() + 5
+        while reader.l1.entries:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertIsNone(reader.get('hot:a'))
+
+    def test_read_racing_a_write_is_not_kept(self):
+        tier = two_level.LocalTier(('hot:',))
+        value, generation = tier.get('hot:a')
+        self.assertIs(value, two_level._MISSING)
+        # Invalidated while the value was being read from Redis
+        tier.invalidate('hot:a')
+        tier.set('hot:a', 'stale', generation)
+        self.assertIs(tier.get('hot:a')[0], two_level._MISSING)
+
+        _, generation = tier.get('hot:a')
+        tier.set('hot:a', 'fresh', generation)
+        self.assertEqual(tier.get('hot:a')[0], 'fresh')
+
+    def test_local_tier_is_bounded(self):
+        cache_ = two_level_cache(L1_MAX_ENTRIES=2)
+        self.wait_for_listener(cache_)
+        for name in 'abc':
+            cache_.set(f'hot:{name}', name)
+            cache_.get(f'hot:{name}')
+        self.assertEqual(len(cache_.l1.entries), 2)
+        self.assertNotIn(cache_.make_key('hot:a'), cache_.l1.entries)
+
+
+class CacheTagTests(VehicleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.vehicle = create_vehicle(self.index, self.seller)
+        self.tags = [
+            invalidation.vehicle_tag(self.vehicle.pk),
+            invalidation.seller_tag(self.seller.pk),
+            invalidation.INVENTORY_TAG,
+        ]
+
+    def assertBumped(self, tags, before, bumped=True):
+        after = invalidation.get_tag_versions(tags)
+        for tag in tags:
+            if bumped:
+                self.assertNotEqual(after[tag], before[tag], tag)
+            else:
+                self.assertEqual(after[tag], before[tag], tag)
+
+    def test_vehicle_changes_bump_its_tags(self):
+        other = invalidation.seller_tag(self.seller.pk + 1)
+        before = invalidation.get_tag_versions(self.tags + [other])
+        key = invalidation.tagged_key('detail', self.tags)
+
+        self.vehicle.price = 18000
+        self.vehicle.save()
+        self.assertBumped(self.tags, before)
+        self.assertBumped([other], before, bumped=False)
+        self.assertNotEqual(invalidation.tagged_key('detail', self.tags),
+                            key)
+
+        before = invalidation.get_tag_versions(self.tags)
+        self.vehicle.unpublish()
+        self.assertBumped(self.tags, before)
+
+    def test_only_approved_reviews_bump_the_vehicle(self):
+        tags = self.tags[:1]
+        before = invalidation.get_tag_versions(tags)
+        review = VehicleReview.objects.create(
+            vehicle=self.vehicle, user=self.seller, rating=5,
+            title='Great', comment='Great car',
+        )
+        self.assertBumped(tags, before, bumped=False)
+
+        review = VehicleReview.objects.get(pk=review.pk)
+        review.approved = True
+        review.save()
+        self.assertBumped(tags, before)
+
+    def test_category_changes_bump_category_tags(self):
+        category = VehicleCategory.objects.create(name='SUV')
+        tag = invalidation.category_tag('suv')
+        before = invalidation.get_tag_versions([tag] + self.tags[:1])
+        self.vehicle.categories.add(category)
+        self.assertBumped([tag] + self.tags[:1], before)
+
+        renamed = invalidation.category_tag('crossover')
+        before = invalidation.get_tag_versions([tag, renamed])
+        category = VehicleCategory.objects.get(pk=category.pk)
+        category.slug = 'crossover'
+        category.save()
+        self.assertBumped([tag, renamed], before)
+
+    def test_bulk_changes_coalesce_their_bumps(self):
+        with patch.object(invalidation, '_bump') as bump:
+            with invalidation.coalesced_bumps():
+                for i in range(3):
+                    create_vehicle(self.index, self.seller, slug=f'bulk-{i}')
+            bump.assert_called_once()
+            self.assertEqual(len(bump.call_args[0][0]), 5)
+
+    def test_tags_are_bumped_again_on_commit(self):
+        with patch.object(invalidation, '_bump') as bump:
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidation.bump_tags(self.tags)
+        self.assertEqual(bump.call_count, 2)
+
+
+class CachedComputeTests(VehicleTestCase):
+
+    def counter(self, value=1, delay=0):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(delay)
+            return value
+        return compute, calls
+
+    def test_value_is_computed_once(self):
+        compute, calls = self.counter()
+        for _ in range(3):
+            self.assertEqual(caching.cached_compute('k', compute, 60), 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_concurrent_misses_compute_once(self):
+        compute, calls = self.counter(delay=0.2)
+
+        def request(_):
+            return caching.cached_compute('hot', compute, 60)
+
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(request, range(10)))
+        self.assertEqual(results, [1] * 10)
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        caching.cached_compute('k', lambda: 'old', timeout=0)
+        # Another worker holds the refresh lock
+        cache.add(caching.LOCK_KEY.format(key='k'), 1)
+        self.assertEqual(caching.cached_compute('k', lambda: 'new', 0),
+                         'old')
+        cache.delete(caching.LOCK_KEY.format(key='k'))
+        self.assertEqual(caching.cached_compute('k', lambda: 'new', 0),
+                         'new')
+
+    def test_failed_refresh_serves_the_stale_value(self):
+        caching.cached_compute('k', lambda: 'old', timeout=0)
+
+        def fail():
+            raise RuntimeError
+
+        with self.assertLogs(caching.logger, 'ERROR'):
+            self.assertEqual(caching.cached_compute('k', fail, 60), 'old')
+        with self.assertRaises(RuntimeError):
+            caching.cached_compute('missing', fail, 60)
+
+    def test_not_found_is_not_masked_by_the_stale_value(self):
+        caching.cached_compute('k', lambda: 'old', timeout=0)
+
+        def missing():
+            raise Http404
+
+        with self.assertRaises(Http404):
+            caching.cached_compute('k', missing, 60)
+
+    def test_expired_lock_taken_by_another_worker_is_kept(self):
+        lock_key = caching.LOCK_KEY.format(key='k')
+
+        def slow():
+            # Our lock expired and another worker took it
+            cache.set(lock_key, 'theirs')
+            return 1
+
+        caching.cached_compute('k', slow, 60)
+        self.assertEqual(cache.get(lock_key), 'theirs')
+
+    def test_tag_bump_recomputes(self):
+        tags = [invalidation.INVENTORY_TAG]
+        caching.cached_compute('k', lambda: 'old', 60, tags=tags)
+        self.assertEqual(
+            caching.cached_compute('k', lambda: 'new', 60, tags=tags), 'old')
+        invalidation.bump_tags(tags)
+        self.assertEqual(
+            caching.cached_compute('k', lambda: 'new', 60, tags=tags), 'new')
+
+    def test_early_refresh_grows_near_expiry(self):
+        now = time.time()
+        fresh = caching.CachedValue(1, '', now + 3600, delta=0.01)
+        expiring = caching.CachedValue(1, '', now + 0.001, delta=1.0)
+        self.assertFalse(any(caching._should_refresh(fresh, 1.0)
+                             for _ in range(100)))
+        self.assertGreater(sum(caching._should_refresh(expiring, 1.0)
+                               for _ in range(100)), 90)
+
+    def test_home_snapshot_is_cached_until_inventory_changes(self):
+        create_vehicle(self.index, self.seller, title='Camry')
+        self.client.get(reverse('app:home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('app:home'))
+        self.assertFalse([query for query in queries.captured_queries
+                          if 'app_vehicle' in query['sql']])
+
+        create_vehicle(self.index, self.seller, title='Corolla',
+                       slug='corolla')
+        response = self.client.get(reverse('app:home'))
+        self.assertEqual(
+            [vehicle.title for vehicle in response.context['latest_vehicles']],
+            ['Corolla', 'Camry'])
+
+
+class SessionlessTests(VehicleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.vehicle = create_vehicle(self.index, self.seller)
+        self.urls = [
+            reverse('app:home'),
+            reverse('app:cars_list'),
+            reverse('app:search') + '?q=Test',
+        ]
+
+    def test_read_views_are_sessionless(self):
+        for name in ('home', 'cars_list', 'car_detail', 'search'):
+            url = reverse(f'app:{name}', kwargs={'pk': self.vehicle.pk}
+                          if name == 'car_detail' else None)
+            self.assertTrue(resolve(url).func.sessionless, name)
+
+    def test_anonymous_reads_create_no_session_or_cookies(self):
+        from django.contrib.sessions.models import Session
+
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotIn('Cookie', response.get('Vary', ''), url)
+            self.assertFalse(response.cookies, url)
+            self.assertFalse(response.context['user'].is_authenticated)
+        self.assertFalse(Session.objects.exists())
+
+    def test_signed_in_visitors_keep_their_session(self):
+        self.client.force_login(self.seller)
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.context['user'], self.seller, url)
+
+    def test_sessions_are_cached(self):
+        from django.contrib.sessions.backends.cached_db import KEY_PREFIX
+
+        self.client.force_login(self.seller)
+        session_key = self.client.session.session_key
+        self.assertIsNotNone(cache.get(KEY_PREFIX + session_key))
+
+
+class MicroCacheTests(VehicleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_vehicle(self.index, self.seller, title='Camry')
+        self.url = reverse('app:cars_list')
+
+    def test_anonymous_pages_are_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Micro-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached['X-Micro-Cache'], 'HIT')
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+
+    def test_pages_stay_out_of_the_in_process_tier(self):
+        key = micro_cache.canonical_key(RequestFactory().get(self.url))
+        self.assertFalse(key.startswith(settings.CACHE_L1_KEY_PREFIXES))
+
+    def test_inventory_changes_refresh_pages(self):
+        self.client.get(self.url)
+        create_vehicle(self.index, self.seller, title='Corolla',
+                       slug='corolla')
+        self.assertEqual(self.client.get(self.url)['X-Micro-Cache'], 'MISS')
+
+    def test_equivalent_urls_share_an_entry(self):
+        url = reverse('app:search')
+        self.client.get(url + '?q=camry&sort=price_desc')
+        response = self.client.get(
+            url + '?sort=price_desc&utm_source=mail&q=camry')
+        self.assertEqual(response['X-Micro-Cache'], 'HIT')
+
+    def test_ajax_requests_are_cached_separately(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url,
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response['X-Micro-Cache'], 'MISS')
+
+    def test_signed_in_visitors_bypass_the_cache(self):
+        self.client.get(self.url)
+        self.client.force_login(self.seller)
+        self.assertNotIn('X-Micro-Cache', self.client.get(self.url))
+
+    @override_settings(MICRO_CACHE_TIMEOUT=0)
+    def test_stale_page_is_served_while_refreshing(self):
+        self.client.get(self.url)
+        key = micro_cache.canonical_key(RequestFactory().get(self.url))
+        # Another worker is re-rendering the expired page
+        cache.add(caching.LOCK_KEY.format(key=key), 1)
+        self.assertEqual(self.client.get(self.url)['X-Micro-Cache'], 'HIT')
+        cache.delete(caching.LOCK_KEY.format(key=key))
+        self.assertEqual(self.client.get(self.url)['X-Micro-Cache'], 'MISS')
+
+
+POSTGRES_ENV = {
+    'SUPABASE_DB_NAME': 'postgres', 'SUPABASE_USER': 'carhouse',
+    'SUPABASE_PASSWORD': 'secret', 'SUPABASE_HOST': 'db.example.com',
+}
+
+
+class DatabaseConfigTests(TestCase):
+    def test_sqlite_without_the_environment(self):
+        for env in ({}, dict(POSTGRES_ENV, SUPABASE_HOST='')):
+            config = database.database_config(env, '/srv/carhouse')
+            self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+            self.assertEqual(str(config['NAME']), '/srv/carhouse/db.sqlite3')
+
+    def test_postgres_is_pooled(self):
+        env = dict(POSTGRES_ENV, WEB_CONCURRENCY='4', WEB_THREADS='8')
+        with patch.object(database, '_pool_check', return_value=len):
+            config = database.database_config(env)
+
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(config['HOST'], 'db.example.com')
+        self.assertEqual(config['PORT'], database.DEFAULT_PORT)
+        self.assertEqual(config['OPTIONS']['sslmode'], 'require')
+        # Pooled connections are not also kept by the thread
+        self.assertNotIn('CONN_MAX_AGE', config)
+        self.assertEqual(config['OPTIONS']['pool'], {
+            'min_size': 2, 'max_size': 8 + database.DEFAULT_POOL_SPARE,
+            'timeout': database.DEFAULT_POOL_TIMEOUT, 'check': len,
+        })
+
+    def test_pool_fits_the_connection_limit(self):
+        self.assertEqual(database.pool_size(workers=1, threads=1), 3)
+        self.assertEqual(
+            database.pool_size(workers=4, threads=8, max_connections=20), 5
+        )
+        self.assertEqual(
+            database.pool_size(workers=8, threads=4, max_connections=4), 1
+        )
+
+    def test_persistent_connections_without_the_pool(self):
+        env = dict(POSTGRES_ENV, DB_POOL='False', DB_CONN_MAX_AGE='120')
+        config = database.database_config(env)
+        self.assertNotIn('pool', config['OPTIONS'])
+        self.assertEqual(config['CONN_MAX_AGE'], 120)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+
+        # psycopg 3 is not installed
+        with patch.object(database, '_pool_check', return_value=None):
+            config = database.database_config(POSTGRES_ENV)
+        self.assertNotIn('pool', config['OPTIONS'])
+        self.assertEqual(config['CONN_MAX_AGE'],
+                         database.DEFAULT_CONN_MAX_AGE)
+
+
+class FakePool:
+    def get_stats(self):
+        return {
+            'pool_min': 2, 'pool_max': 10, 'pool_size': 4,
+            'pool_available': 1, 'requests_num': 8, 'requests_wait_ms': 20,
+        }
+
+
+class HealthTests(TestCase):
+    url = '/health'
+
+    def test_reports_the_database(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'status': 'ok',
+            'database': {'vendor': 'sqlite', 'pool': None},
+        })
+
+    def test_reports_pool_wait_time(self):
+        with patch.object(connection, 'pool', FakePool(), create=True):
+            pool = self.client.get(self.url).json()['database']['pool']
+        self.assertEqual(pool['requests_wait_ms'], 20)
+        self.assertEqual(pool['wait_ms_avg'], 2.5)
+        self.assertEqual(pool['requests_waiting'], 0)
+        self.assertEqual(pool['pool_available'], 1)
+
+    def test_unavailable_database(self):
+        with patch.object(connection, 'cursor',
+                          side_effect=DatabaseError('down')):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'unavailable')
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], MICRO_CACHE_ENABLED=False)
+class ReplicaRoutingTests(VehicleTestCase):
+    """The "replica" database is a second, empty SQLite database"""
+    # Includes the replica once setUpClass has added it
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # In memory; its tables are created from the models, as data
+        # migrations only write to the primary
+        connections.settings.update(connections.configure_settings({
+            **connections.settings,
+            'replica': {'ENGINE': 'django.db.backends.sqlite3',
+                        'NAME': ':memory:', 'TEST': {'MIGRATE': False}},
+        }))
+        connections['replica'].creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].creation.destroy_test_db(
+            ':memory:', verbosity=0)
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        super().setUp()
+        self.vehicle = create_vehicle(self.index, self.seller)
+        self.user = User.objects.create_user('buyer', password='pass')
+
+    def test_read_views_use_replicas(self):
+        for name in ('home', 'cars_list', 'car_detail', 'search'):
+            url = reverse(f'app:{name}', kwargs={'pk': self.vehicle.pk}
+                          if name == 'car_detail' else None)
+            self.assertTrue(resolve(url).func.replica_reads, name)
+
+    def test_listing_reads_from_a_replica(self):
+        response = self.client.get(reverse('app:cars_list'))
+        self.assertEqual(list(response.context['vehicles']), [])
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_home_snapshot_is_built_from_the_primary(self):
+        response = self.client.get(reverse('app:home'))
+        self.assertEqual(response.context['latest_vehicles'], [self.vehicle])
+
+    def test_writers_read_their_writes(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('app:save_vehicle'),
+                json.dumps({'vehicle_id': self.vehicle.pk}),
+                content_type='application/json',
+            )
+        self.assertTrue(SavedVehicle.objects.using('default').exists())
+        pin = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(pin['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        # Kept on the primary while the replica catches up
+        response = self.client.get(reverse('app:cars_list'))
+        self.assertEqual(response.context['user'], self.user)
+        self.assertIn(self.vehicle, response.context['vehicles'])
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Vehicle), 'default')
+
+        with replica_state(replica=True):
+            self.assertEqual(router.db_for_read(Vehicle), 'replica')
+            with use_primary():
+                self.assertEqual(router.db_for_read(Vehicle), 'default')
+            self.assertEqual(router.db_for_read(Vehicle), 'replica')
+
+            # Writes, and the reads after them, use the primary
+            self.assertEqual(
+                router.db_for_write(Vehicle, instance=self.vehicle),
+                'default'
+            )
+            self.assertEqual(router.db_for_read(Vehicle), 'default')
+
+        with replica_state(replica=False):
+            self.assertEqual(router.db_for_read(Vehicle), 'default')
@@ -12,11 +12,15 @@ from app.views.car.vehicle_review import VehicleReviewCreateView
 from app.views.car.views import VehicleCreateView
 from app.views.car.views import VehicleUpdateView
 from app.views.car.views import VehicleDeleteView
-from app.views.car.save_vehicle import SaveVehicleView
+from app.views.car.save_vehicle import (
+    SaveVehicleView, BulkSaveVehicleView
+)
 from app.views.car.user_vehicle import UserVehiclesView
 from app.views.car.save_vehicle import SavedVehiclesView
 from app.views.car.vehicle_search import VehicleSearchView
+from app.views.car.storefront import SellerStorefrontView
 from app.views.search import SearchView
+from app.views.health import HealthView
 
 app_name = "app"
 
@@ -28,6 +32,7 @@ urlpatterns = [
     path("services", ServicesView.as_view(), name="services"),
     path("search", SearchView.as_view(), name="search"),
     path("dashboard", DashboardView.as_view(), name="dashboard"),
+    path("health", HealthView.as_view(), name="health"),
 
     # Vehicle URLs
     path("cars", VehicleListView.as_view(), name="cars_list"),
@@ -44,6 +49,12 @@ urlpatterns = [
     path("cars/<int:vehicle_pk>/contact", ContactSellerView.as_view(),
          name="contact_seller"),
 
+    # Seller storefronts
+    path("sellers/<str:username>", SellerStorefrontView.as_view(),
+         name="profile_detail"),
+
     # AJAX endpoints
     path("api/save-vehicle", SaveVehicleView.as_view(), name="save_vehicle"),
+    path("api/save-vehicles", BulkSaveVehicleView.as_view(),
+         name="bulk_save_vehicles"),
 ]
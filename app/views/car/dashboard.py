@@ -17,11 +17,11 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         # User's listed vehicles
         context['user_vehicles'] = Vehicle.objects.filter(
             live=True, listed_by=self.request.user
-        ).order_by('-created_at')
+        ).with_cover_image().order_by('-created_at')
 
         # User's saved vehicles
         context['saved_vehicles'] = Vehicle.objects.filter(
             live=True, saved_by__user=self.request.user
-        ).order_by('-saved_by__saved_at')
+        ).with_cover_image().order_by('-saved_by__saved_at')
 
         return context
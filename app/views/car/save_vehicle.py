@@ -12,6 +12,10 @@ import json
 
 from app.models.car import Vehicle
 from app.models.cars.saved import SavedVehicle
+from app.views.helpers.saved import (
+    get_saved_vehicle_ids, save_vehicles, toggle_saved_vehicle,
+    unsave_vehicles,
+)
 
 User = get_user_model()
 
@@ -62,7 +66,7 @@ class UserSavedVehiclesView(LoginRequiredMixin, ListView):
         return Vehicle.objects.filter(
             saved_by__user=self.request.user,
             live=True, published=True
-        ).order_by('-saved_by__saved_at')
+        ).with_cover_image().order_by('-saved_by__saved_at')
 
 
 class SavedVehiclesView(LoginRequiredMixin, ListView):
@@ -89,17 +93,61 @@ class SaveVehicleView(LoginRequiredMixin, View):
         try:
             data = json.loads(request.body)
             vehicle_id = data.get('vehicle_id')
+            action = data.get('action')
             vehicle = get_object_or_404(Vehicle, id=vehicle_id)
 
-            saved_vehicle, created = SavedVehicle.objects.get_or_create(
-                user=request.user,
-                vehicle=vehicle
-            )
+            # An explicit action is idempotent; without one, toggle
+            if action == 'save':
+                save_vehicles(request.user, [vehicle.pk])
+                saved = True
+            elif action == 'unsave':
+                unsave_vehicles(request.user, [vehicle.pk])
+                saved = False
+            else:
+                saved = toggle_saved_vehicle(request.user, vehicle.pk)
+
+            return JsonResponse({'saved': saved})
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
 
-            if not created:
-                saved_vehicle.delete()
-                return JsonResponse({'saved': False})
+class BulkSaveVehicleView(LoginRequiredMixin, View):
+    """AJAX view to save/unsave several vehicles at once"""
+    max_vehicles = 100
 
-            return JsonResponse({'saved': True})
+    def post(self, request):
+        try:
+            data = json.loads(request.body)
+            action = data.get('action')
+            vehicle_ids = data.get('vehicle_ids') or []
+
+            if action not in ('save', 'unsave'):
+                raise ValueError("Action must be 'save' or 'unsave'.")
+            if not isinstance(vehicle_ids, list):
+                raise ValueError("vehicle_ids must be a list.")
+            if len(vehicle_ids) > self.max_vehicles:
+                raise ValueError(
+                    f"At most {self.max_vehicles} vehicles per request."
+                )
+
+            vehicle_ids = set(Vehicle.objects.filter(
+                id__in=[int(pk) for pk in vehicle_ids]
+            ).values_list('id', flat=True))
+
+            # The cache is only updated on commit, so apply the change
+            # to the returned set locally
+            saved_ids = get_saved_vehicle_ids(request.user)
+            if action == 'save':
+                save_vehicles(request.user, vehicle_ids)
+                saved_ids |= vehicle_ids
+            else:
+                unsave_vehicles(request.user, vehicle_ids)
+                saved_ids -= vehicle_ids
+
+            return JsonResponse({
+                'action': action,
+                'vehicle_ids': sorted(vehicle_ids),
+                'saved_count': len(saved_ids),
+            })
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
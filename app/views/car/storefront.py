@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.http import Http404
+from django.views.generic import TemplateView
+
+from app.views.helpers.saved import get_saved_vehicle_ids
+from app.views.helpers.storefront import get_storefront
+
+User = get_user_model()
+
+
+class SellerStorefrontView(TemplateView):
+    """Public storefront listing a seller's active vehicles"""
+    template_name = 'app/sellers/storefront.html'
+
+    def get_cursor(self):
+        try:
+            return int(self.request.GET.get('after', ''))
+        except ValueError:
+            return None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        seller_id = User.objects.filter(
+            username=self.kwargs['username'], is_active=True
+        ).values_list('pk', flat=True).first()
+        if seller_id is None:
+            raise Http404("Seller not found.")
+
+        storefront = get_storefront(seller_id, self.get_cursor())
+        vehicle_ids = {vehicle['id'] for vehicle in storefront['vehicles']}
+        context.update(storefront)
+        context.update({
+            'page_title': storefront['seller']['display_name'],
+            'saved_vehicle_ids': (
+                get_saved_vehicle_ids(self.request.user) & vehicle_ids
+            ),
+        })
+        return context
@@ -5,17 +5,80 @@ from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth import get_user_model
 from django.urls import reverse_lazy, reverse
 from django.contrib import messages
+from django.conf import settings
+from django.db import transaction
 from django.http import HttpResponseRedirect
 
 
 from app.models.car import (
-    Vehicle
+    Vehicle, VehicleIndexPage
 )
 from app.forms.car import (
     VehicleForm, VehicleGalleryImageFormSet
 )
+from app.views.helpers.cloudinary import get_image_handler
+from app.views.helpers.assets import release_images
+from app.views.helpers.uploads import (
+    stage_vehicle_images, upload_vehicle_images,
+)
 User = get_user_model()
 
+NO_VEHICLE_INDEX_ERROR = (
+    "New listings can't be published right now. Please try again later."
+)
+
+
+class VehicleGalleryMixin:
+    """
+    Save a vehicle form together with its gallery formset.
+    * By default images are staged for the background upload workers.
+    * With IMAGE_UPLOADS_DEFERRED off, they are uploaded concurrently
+        within the request so failures can be shown on the form.
+    """
+
+    def save_vehicle(self, parent=None):
+        if parent is not None:
+            # Vehicles are pages and live under the vehicle index
+            parent.add_child(instance=self.object)
+        else:
+            self.object.save()
+
+    def save_with_gallery(self, form, gallery_formset) -> bool:
+        """
+        Save everything; returns False if the vehicle has nowhere to be
+        listed or any image upload failed.
+        """
+        parent = None
+        if self.object.pk is None:
+            parent = VehicleIndexPage.objects.live().first()
+            if parent is None:
+                form.add_error(None, NO_VEHICLE_INDEX_ERROR)
+                return False
+
+        if getattr(settings, 'IMAGE_UPLOADS_DEFERRED', True):
+            with transaction.atomic():
+                self.save_vehicle(parent)
+                gallery_formset.instance = self.object
+                gallery_formset.save()
+
+                # Images upload to Cloudinary in the background
+                stage_vehicle_images(self.object, form, gallery_formset)
+            return True
+
+        held = upload_vehicle_images(form, gallery_formset,
+                                     get_image_handler())
+        try:
+            if not form.is_valid() or not gallery_formset.is_valid():
+                return False
+            with transaction.atomic():
+                self.save_vehicle(parent)
+                gallery_formset.instance = self.object
+                gallery_formset.save()
+            return True
+        finally:
+            # Uploads no saved row ended up using are deleted
+            release_images(held)
+
 
 # User Vehicle Management Views
 class UserVehicleListView(LoginRequiredMixin, ListView):
@@ -32,7 +95,8 @@ class UserVehicleListView(LoginRequiredMixin, ListView):
                                       ).order_by('-created_at')
 
 
-class UserVehicleCreateView(LoginRequiredMixin, CreateView):
+class UserVehicleCreateView(LoginRequiredMixin, VehicleGalleryMixin,
+                            CreateView):
     """Create view for user to add a new vehicle"""
     model = Vehicle
     form_class = VehicleForm
@@ -40,7 +104,10 @@ class UserVehicleCreateView(LoginRequiredMixin, CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if self.request.POST:
+        if 'gallery_formset' in kwargs:
+            # Re-rendering a formset that already carries errors
+            pass
+        elif self.request.POST:
             context['gallery_formset'] = VehicleGalleryImageFormSet(
                 self.request.POST, self.request.FILES
             )
@@ -59,26 +126,22 @@ class UserVehicleCreateView(LoginRequiredMixin, CreateView):
         context = self.get_context_data()
         gallery_formset = context['gallery_formset']
 
-        if gallery_formset.is_valid():
-            # Save the vehicle first
-            self.object.save()
-
-            # Then save the gallery images
-            gallery_formset.instance = self.object
-            gallery_formset.save()
-
+        if gallery_formset.is_valid() and \
+                self.save_with_gallery(form, gallery_formset):
             messages.success(self.request,
                              "Vehicle listing created successfully!")
             return HttpResponseRedirect(self.get_success_url())
         else:
-            return self.form_invalid(form)
+            return self.render_to_response(self.get_context_data(
+                form=form, gallery_formset=gallery_formset
+            ))
 
     def get_success_url(self):
         return reverse('app:vehicle_detail', kwargs={'slug': self.object.slug})
 
 
-class UserVehicleUpdateView(LoginRequiredMixin,
-                            UserPassesTestMixin, UpdateView):
+class UserVehicleUpdateView(LoginRequiredMixin, UserPassesTestMixin,
+                            VehicleGalleryMixin, UpdateView):
     """Update view for user's vehicle"""
     model = Vehicle
     form_class = VehicleForm
@@ -94,7 +157,10 @@ class UserVehicleUpdateView(LoginRequiredMixin,
     def get_context_data(self, **kwargs):
         instance = self.get_object()
         context = super().get_context_data(**kwargs)
-        if self.request.POST:
+        if 'gallery_formset' in kwargs:
+            # Re-rendering a formset that already carries errors
+            pass
+        elif self.request.POST:
             context['gallery_formset'] = VehicleGalleryImageFormSet(
                 self.request.POST, self.request.FILES, instance=instance
             )
@@ -112,19 +178,15 @@ class UserVehicleUpdateView(LoginRequiredMixin,
         context = self.get_context_data()
         gallery_formset = context['gallery_formset']
 
-        if gallery_formset.is_valid():
-            # Save the vehicle first
-            self.object.save()
-
-            # Then save the gallery images
-            gallery_formset.instance = self.object
-            gallery_formset.save()
-
+        if gallery_formset.is_valid() and \
+                self.save_with_gallery(form, gallery_formset):
             messages.success(self.request,
                              "Vehicle listing updated successfully!")
             return HttpResponseRedirect(self.get_success_url())
         else:
-            return self.form_invalid(form)
+            return self.render_to_response(self.get_context_data(
+                form=form, gallery_formset=gallery_formset
+            ))
 
     def get_success_url(self):
         return reverse('app:vehicle_detail', kwargs={'slug': self.object.slug})
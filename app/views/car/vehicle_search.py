@@ -44,7 +44,7 @@ class VehicleSearchView(ListView):
                 Q(description__icontains=query),
                 live=True, published=True,
                 sold=False
-            ).distinct()
+            ).distinct().with_cover_image()
         return Vehicle.objects.none()
 
     def get_context_data(self, **kwargs):
@@ -8,23 +8,32 @@ from django.shortcuts import get_object_or_404
 from django.contrib import messages
 from django.db.models import Avg, Count, Q
 from django.http import Http404
+from django.utils.decorators import method_decorator
 
 from app.models.car import Vehicle
 from app.models.cars.category import VehicleCategory
 from app.models.cars.review import VehicleReview
-from app.models.cars.saved import SavedVehicle
 
-from app.forms.search import VehicleSearchForm
 from app.forms.car import (
-    VehicleReviewForm, VehicleForm
+    VehicleReviewForm, VehicleForm, VehicleSearchForm
 )
+from app.views.helpers.saved import (
+    get_saved_on_page, get_saved_vehicle_ids
+)
+from app.views.helpers.micro_cache import micro_cache
+from app.views.helpers.uploads import stage_vehicle_images
 
 from app.forms.contact import ContactSellerForm
+from carhouse.middleware.replica import replica_reads
+from carhouse.middleware.sessionless import sessionless
 
 User = get_user_model()
 
 
 # Vehicle Views
+@method_decorator(sessionless, name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
+@method_decorator(micro_cache(), name='dispatch')
 class VehicleListView(ListView):
     """List view for vehicles with filtering"""
     model = Vehicle
@@ -35,7 +44,7 @@ class VehicleListView(ListView):
     def get_queryset(self):
         """Get filtered queryset based on search parameters"""
         queryset = Vehicle.objects.filter(
-            live=True, published=True, sold=False)
+            live=True, published=True, sold=False).with_cover_image()
 
         # Apply search form filters
         form = VehicleSearchForm(self.request.GET)
@@ -61,15 +70,17 @@ class VehicleListView(ListView):
                     filters[field] = form.cleaned_data[field]
 
             # Categories
-            if form.cleaned_data.get('category'):
-                filters['categories'] = form.cleaned_data['category']
+            if form.cleaned_data.get('categories'):
+                filters['categories__in'] = form.cleaned_data['categories']
 
             # Apply filters
             queryset = queryset.filter(**filters)
+            if 'categories__in' in filters:
+                queryset = queryset.distinct()
 
             # Search term
-            if form.cleaned_data.get('search'):
-                search_term = form.cleaned_data['search']
+            if form.cleaned_data.get('q'):
+                search_term = form.cleaned_data['q']
                 queryset = queryset.filter(
                     Q(title__icontains=search_term) |
                     Q(make__icontains=search_term) |
@@ -120,9 +131,16 @@ class VehicleListView(ListView):
             del get_params['page']
         context['current_filters'] = get_params.urlencode()
 
+        # Saved hearts for the whole page in one set intersection
+        context['saved_vehicle_ids'] = get_saved_on_page(
+            self.request.user, context['object_list']
+        )
+
         return context
 
 
+@method_decorator(sessionless, name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
 class VehicleDetailView(DetailView):
     """Detail view for a vehicle"""
     model = Vehicle
@@ -146,7 +164,8 @@ class VehicleDetailView(DetailView):
         vehicle = self.get_this_object()
 
         # Similar vehicles (same make, model or category)
-        similar_vehicles = queryset.exclude(pk=vehicle.pk)
+        similar_vehicles = queryset.exclude(
+            pk=vehicle.pk).with_cover_image()
 
         # Try to find by same make and model first
         similar_by_model = similar_vehicles.filter(
@@ -180,10 +199,9 @@ class VehicleDetailView(DetailView):
 
         # Check if user has saved this vehicle
         if self.request.user.is_authenticated:
-            context['is_saved'] = SavedVehicle.objects.filter(
-                user=self.request.user,
-                vehicle=vehicle
-            ).exists()
+            context['is_saved'] = (
+                vehicle.pk in get_saved_vehicle_ids(self.request.user)
+            )
 
             # Check if user has already reviewed this vehicle
             context['user_has_reviewed'] = VehicleReview.objects.filter(
@@ -217,6 +235,7 @@ class CategoryVehicleListView(ListView):
                                           slug=self.kwargs['slug'])
         return Vehicle.objects.filter(live=True, published=True,
                                       sold=False, categories=self.category
+                                      ).with_cover_image(
                                       ).order_by('-created_at')
 
     def get_context_data(self, **kwargs):
@@ -247,6 +266,7 @@ class VehicleCreateView(LoginRequiredMixin, CreateView):
         vehicle.listed_by = self.request.user
         self.object = vehicle
         vehicle.save()
+        stage_vehicle_images(vehicle, form)
         messages.success(self.request, 'Vehicle listing created successfully!')
         response = super().form_valid(form)
         return response
@@ -278,6 +298,7 @@ class VehicleUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         vehicle = form.instance
         self.object = vehicle
         vehicle.save()
+        stage_vehicle_images(vehicle, form)
         messages.success(self.request, 'Vehicle listing updated successfully!')
         return super().form_valid(form)
 
@@ -0,0 +1,34 @@
+from django.db import DatabaseError, connections
+from django.http import JsonResponse
+from django.views import View
+
+from carhouse.database import pool_stats
+
+
+class HealthView(View):
+    """
+    Liveness of this worker and its database, 503 when the database
+    cannot be reached.
+    * Includes the worker's connection pool counters (see
+        carhouse.database.pool_stats), so pool wait time can be scraped
+        and alerted on; null when the database is not pooled.
+    """
+
+    def get(self, request, *args, **kwargs):
+        connection = connections['default']
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            return JsonResponse({
+                'status': 'unavailable',
+                'database': {'vendor': connection.vendor, 'pool': None},
+            }, status=503)
+
+        return JsonResponse({
+            'status': 'ok',
+            'database': {
+                'vendor': connection.vendor,
+                'pool': pool_stats(),
+            },
+        })
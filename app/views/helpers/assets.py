@@ -0,0 +1,242 @@
+import hashlib
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from wagtail.models import Revision
+
+from app.models.car import Vehicle
+from app.models.cars.asset import ImageAsset
+from app.models.cars.gallery_image import VehicleGalleryImage
+from app.views.helpers.cloudinary import (
+    CloudinaryImageHandler, get_image_handler
+)
+from authentication.models.profile import Profile
+
+
+def file_digest(image) -> str:
+    """
+    Return the SHA-256 of an image's content.
+    * Reuses the digest computed while the upload streamed in.
+    """
+    digest = getattr(image, "sha256", None)
+    if digest:
+        return digest
+
+    sha256 = hashlib.sha256()
+    for chunk in image.chunks():
+        sha256.update(chunk)
+    image.seek(0)
+    return sha256.hexdigest()
+
+
+def hold_assets(digests: Iterable[str]) -> Dict[str, ImageAsset]:
+    """
+    Return {digest: asset} for the digests already uploaded, taking a
+    reference on each asset for every time its digest is given.
+    * The references are taken before the assets are read, so an asset
+        returned here can't be deleted by a concurrent release before
+        the rows reusing it are saved; see release_images.
+    """
+    by_count = defaultdict(list)
+    for digest, count in Counter(digests).items():
+        by_count[count].append(digest)
+    with transaction.atomic():
+        for count, group in by_count.items():
+            ImageAsset.objects.filter(sha256__in=group).update(
+                ref_count=F("ref_count") + count
+            )
+        return {
+            asset.sha256: asset
+            for asset in ImageAsset.objects.filter(sha256__in=set(digests))
+        }
+
+
+def register_asset(digest: str, fields: dict, size: int,
+                   placeholder: Optional[dict] = None, references: int = 0
+                   ) -> Tuple[ImageAsset, bool]:
+    """
+    Record a fresh upload under its digest, holding `references` to it.
+    * ``placeholder`` is the result of image_placeholder, if computed.
+    * Returns (asset, created); when another upload of the same content
+        won the race, its asset is returned (and held) instead.
+    """
+    try:
+        with transaction.atomic():
+            return ImageAsset.objects.create(
+                sha256=digest,
+                public_id=fields["cloudinary_image_id"],
+                secure_url=fields["cloudinary_image_url"],
+                optimized_url=fields["optimized_image_url"],
+                bytes=size or 0,
+                ref_count=references,
+                **(placeholder or {}),
+            ), True
+    except IntegrityError:
+        with transaction.atomic():
+            ImageAsset.objects.filter(sha256=digest).update(
+                ref_count=F("ref_count") + references
+            )
+            return ImageAsset.objects.get(sha256=digest), False
+
+
+def fill_placeholder(asset: ImageAsset,
+                     placeholder: Optional[dict]) -> None:
+    """Store a placeholder on an asset registered without one"""
+    if asset.image_placeholder or not placeholder or \
+            not placeholder.get("image_placeholder"):
+        return
+    for name, value in placeholder.items():
+        setattr(asset, name, value)
+    asset.save(update_fields=list(placeholder))
+
+
+def acquire_image(public_id: Optional[str]) -> None:
+    if public_id:
+        ImageAsset.objects.filter(public_id=public_id).update(
+            ref_count=F("ref_count") + 1
+        )
+
+
+def release_image(public_id: Optional[str]) -> None:
+    """
+    Drop one reference to an image.
+    * The Cloudinary asset is deleted once the transaction commits, if
+        nothing (not even a revision) references it any more by then.
+    * Images that predate ImageAsset are left for garbage collection.
+    """
+    if not public_id:
+        return
+    released = ImageAsset.objects.filter(
+        public_id=public_id, ref_count__gt=0
+    ).update(ref_count=F("ref_count") - 1)
+    if released:
+        transaction.on_commit(lambda: delete_unreferenced([public_id]))
+
+
+def release_images(public_ids: Iterable[str]) -> None:
+    """
+    Drop references taken by hold_assets or register_asset, once the
+    rows reusing the images have been saved (or failed to be).
+    """
+    for public_id in public_ids:
+        release_image(public_id)
+
+
+def _vehicle_revisions():
+    return Revision.objects.filter(
+        content_type=ContentType.objects.get_for_model(Vehicle)
+    )
+
+
+def delete_unreferenced(
+    public_ids: Iterable[str],
+    handler: Optional[CloudinaryImageHandler] = None,
+) -> int:
+    """
+    Delete the given assets that have no references, locally and on
+    Cloudinary. Returns the number deleted.
+    * Images a vehicle revision still points at are kept, as the
+        revision may yet be published or reverted to; they are left
+        for collect_orphaned_images once the revisions are gone.
+    """
+    public_ids = set(public_ids)
+    public_ids -= set(
+        _vehicle_revisions().filter(
+            content__cloudinary_image_id__in=public_ids
+        ).values_list("content__cloudinary_image_id", flat=True)
+    )
+    deleted = 0
+    for public_id in public_ids:
+        # Row by row, so an asset re-acquired meanwhile is kept
+        removed, _ = ImageAsset.objects.filter(
+            public_id=public_id, ref_count=0
+        ).delete()
+        if not removed:
+            continue
+
+        handler = handler or get_image_handler()
+        try:
+            handler.delete_image(public_id)
+        except Exception:
+            pass
+        deleted += 1
+    return deleted
+
+
+def referenced_public_ids() -> Set[str]:
+    """
+    Every Cloudinary public id that a local row points at: vehicle,
+    gallery and profile images (including their CloudinaryFields), the
+    primary images of vehicle revisions (which can still be published
+    or reverted to) and assets that still have references.
+    """
+    public_ids = set()
+    for model in (Vehicle, VehicleGalleryImage, Profile):
+        public_ids.update(
+            model._default_manager.exclude(cloudinary_image_id__isnull=True)
+            .exclude(cloudinary_image_id="")
+            .values_list("cloudinary_image_id", flat=True).iterator()
+        )
+    for model, field in ((VehicleGalleryImage, "image"),
+                         (Profile, "profile_pic")):
+        for value in model._default_manager.exclude(**{
+            f"{field}__isnull": True
+        }).values_list(field, flat=True).iterator():
+            public_ids.add(getattr(value, "public_id", value))
+    revisions = _vehicle_revisions()
+    for content in revisions.values_list("content", flat=True).iterator():
+        public_ids.add((content or {}).get("cloudinary_image_id"))
+    public_ids.update(
+        ImageAsset.objects.filter(ref_count__gt=0)
+        .values_list("public_id", flat=True).iterator()
+    )
+    public_ids.discard("")
+    public_ids.discard(None)
+    return public_ids
+
+
+def _stored_image_id(sender, instance) -> Optional[str]:
+    if instance.is_tracked:
+        return instance.get_original_value("cloudinary_image_id")
+    # e.g. a vehicle page rebuilt from a Wagtail revision
+    return sender._default_manager.filter(pk=instance.pk).values_list(
+        "cloudinary_image_id", flat=True
+    ).first()
+
+
+@receiver(pre_save, sender=Vehicle)
+@receiver(pre_save, sender=VehicleGalleryImage)
+def remember_image_reference(sender, instance, raw=False,
+                             update_fields=None, **kwargs):
+    """Capture the image the stored row points at before it changes"""
+    if raw or (update_fields is not None
+               and "cloudinary_image_id" not in update_fields):
+        instance.__dict__.pop("_stored_image_id", None)
+        return
+    instance._stored_image_id = (
+        None if instance._state.adding
+        else _stored_image_id(sender, instance)
+    )
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_save, sender=VehicleGalleryImage)
+def update_image_reference(sender, instance, **kwargs):
+    """Move a reference from the previous image to the current one"""
+    if "_stored_image_id" not in instance.__dict__:
+        return
+    previous = instance.__dict__.pop("_stored_image_id")
+    if previous != instance.cloudinary_image_id:
+        acquire_image(instance.cloudinary_image_id)
+        release_image(previous)
+
+
+@receiver(post_delete, sender=Vehicle)
+@receiver(post_delete, sender=VehicleGalleryImage)
+def remove_image_reference(sender, instance, **kwargs):
+    release_image(instance.get_original_value("cloudinary_image_id"))
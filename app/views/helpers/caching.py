@@ -0,0 +1,126 @@
+import logging
+import math
+import random
+import time
+from typing import Any, Callable, Iterable, NamedTuple
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+
+from app.views.helpers.invalidation import get_tag_versions
+
+# Outside the in-process tier, whatever the key
+LOCK_KEY = "lock:{key}"
+
+# Seconds a stale entry is kept (and served) past its timeout
+DEFAULT_GRACE = 60 * 5
+# Seconds a recompute may hold the lock before another worker takes over
+DEFAULT_LOCK_TIMEOUT = 10
+# Seconds between checks while waiting for another worker's result
+WAIT_INTERVAL = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+class CachedValue(NamedTuple):
+    value: Any
+    # Versions of the tags the value was computed under
+    signature: str
+    # When the value should be refreshed (time.time())
+    refresh_at: float
+    # Seconds the last computation took
+    delta: float
+
+
+def _signature(tags) -> str:
+    versions = get_tag_versions(tags) if tags else {}
+    return ".".join(versions[tag] for tag in sorted(versions))
+
+
+def _should_refresh(entry: CachedValue, beta: float) -> bool:
+    """
+    Probabilistic early expiration ("XFetch"): the closer the entry is
+    to expiring and the longer it takes to compute, the likelier one
+    request refreshes it early, so hot keys never expire all at once.
+    """
+    jitter = -entry.delta * beta * math.log(1 - random.random())
+    return time.time() + jitter >= entry.refresh_at
+
+
+def _compute_and_store(key: str, compute: Callable[[], Any],
+                       signature: str, timeout: int, grace: int) -> Any:
+    started = time.time()
+    value = compute()
+    delta = time.time() - started
+    cache.set(key, CachedValue(value, signature, started + timeout, delta),
+              timeout=timeout + grace)
+    return value
+
+
+def _release_lock(lock_key: str, token: str) -> None:
+    """
+    Delete the lock unless it expired and another worker has taken it
+    since.
+    """
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def cached_compute(key: str, compute: Callable[[], Any], timeout: int,
+                   tags: Iterable[str] = (), grace: int = DEFAULT_GRACE,
+                   lock_timeout: int = DEFAULT_LOCK_TIMEOUT,
+                   beta: float = 1.0) -> Any:
+    """
+    Return compute() cached under `key` for `timeout` seconds, without
+    letting a hot key stampede the database.
+    * Single flight: only the worker holding a short-lived lock
+        recomputes; the rest serve the previous value or, on a cold
+        miss, wait for the winner's result (up to `lock_timeout`).
+    * Stale-while-revalidate: expired values, and values whose tags
+        (see app.views.helpers.invalidation) have been bumped, are
+        kept `grace` seconds longer and served while one worker
+        refreshes them.
+    * Probabilistic early refresh ahead of expiry; `beta` > 1 favours
+        refreshing earlier.
+    * If the refresh fails the error is logged and the stale value is
+        served instead; Http404 and PermissionDenied always propagate.
+    """
+    signature = _signature(tags)
+    entry = cache.get(key)
+    if entry is not None and entry.signature == signature and \
+            not _should_refresh(entry, beta):
+        return entry.value
+
+    lock_key = LOCK_KEY.format(key=key)
+    token = uuid4().hex
+    if cache.add(lock_key, token, timeout=lock_timeout):
+        try:
+            return _compute_and_store(key, compute, signature, timeout,
+                                      grace)
+        except (Http404, PermissionDenied):
+            raise
+        except Exception:
+            if entry is None:
+                raise
+            logger.exception("Refreshing %s failed; serving the stale value",
+                             key)
+            return entry.value
+        finally:
+            _release_lock(lock_key, token)
+
+    if entry is not None:
+        # Another worker is refreshing it
+        return entry.value
+
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry.signature == signature:
+            return entry.value
+        if cache.get(lock_key) is None:
+            break
+    # The winner failed or is too slow; compute without the lock
+    return _compute_and_store(key, compute, signature, timeout, grace)
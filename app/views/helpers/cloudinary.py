@@ -1,11 +1,54 @@
+import threading
+import urllib.request
+from functools import lru_cache
+
 import cloudinary
+import cloudinary.api
 import cloudinary.uploader
 from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from uuid import uuid4
 
 from app.views.helpers.helpers import guess_file_type
 
 
+def validate_image(image) -> None:
+    """
+    Validate an image before upload (size, then type).
+    * Raises ValueError describing the first problem found.
+    """
+    # Already rejected while streaming in (see upload_handler)
+    upload_error = getattr(image, "upload_error", None)
+    if upload_error:
+        raise ValueError(upload_error)
+
+    # Size first: it is known without reading the file
+    if image.size > settings.MAX_UPLOAD_SIZE:
+        max_upload = f'{settings.MAX_UPLOAD_SIZE / (1024 * 1024):.2f}'
+        raise ValueError(f"Image too large. Max size is {max_upload}MB")
+
+    _allowed = settings.ALLOWED_IMAGE_TYPES
+    file_type = getattr(image, "sniffed_type", None) or guess_file_type(image)
+    if file_type not in _allowed:
+        raise ValueError(
+            f"Unsupported image type. Allowed types: {', '.join(_allowed)}"
+        )
+
+
+# Admin API limit for deleting resources in one call
+DELETE_BATCH_SIZE = 100
+
+
+@lru_cache(maxsize=4096)
+def _optimized_url(cloud_name: str, image_id: str) -> str:
+    """The SDK's URL builder is slow; memoize it per cloud and image"""
+    image = cloudinary.CloudinaryImage(image_id)
+    return image.build_url(quality="auto", fetch_format="auto").replace(
+        "http://", "https://"
+    )
+
+
 class CloudinaryImageHandler:
     """
     Class to handle Cloudinary Image Upload and Delete operations.
@@ -38,17 +81,8 @@ class CloudinaryImageHandler:
             overwrite: Whether to overwrite the image if it already exists.
             metadata: The metadata to add to the image.
         """
-        # Validate image type
-        _allowed = settings.ALLOWED_IMAGE_TYPES
-        if guess_file_type(image) not in _allowed:
-            raise ValueError(
-                f"Unsupported image type. Allowed types: {', '.join(_allowed)}"
-            )
-
         # Validate image before upload (size, type, etc.)
-        if image.size > settings.MAX_UPLOAD_SIZE:
-            max_upload = f'{settings.MAX_UPLOAD_SIZE / (1024 * 1024):.2f}'
-            raise ValueError(f"Image too large. Max size is {max_upload}MB")
+        validate_image(image)
 
         try:
             options = {
@@ -79,14 +113,65 @@ class CloudinaryImageHandler:
             raise Exception(f"Error deleting image from Cloudinary: {str(e)}")
         return response
 
+    def delete_images(self, public_ids: list) -> dict:
+        """
+        Delete up to DELETE_BATCH_SIZE images in one Admin API call.
+        * Returns {public_id: "deleted" | "not_found"}.
+        """
+        if len(public_ids) > DELETE_BATCH_SIZE:
+            raise ValueError(
+                f"At most {DELETE_BATCH_SIZE} images can be deleted at once"
+            )
+        try:
+            response = cloudinary.api.delete_resources(list(public_ids))
+        except Exception as e:
+            raise Exception(f"Error deleting images from Cloudinary: {str(e)}")
+        return response.get("deleted", {})
+
+    def list_images(self, next_cursor=None, prefix=None,
+                    max_results=500) -> dict:
+        """
+        Return one page of uploaded images from the Admin API:
+            {"resources": [{"public_id", "created_at", ...}],
+             "next_cursor": str or None}
+        """
+        options = {
+            "type": "upload",
+            "resource_type": "image",
+            "max_results": max_results,
+            "next_cursor": next_cursor,
+            "prefix": prefix,
+        }
+        options = {k: v for k, v in options.items() if v is not None}
+        try:
+            response = cloudinary.api.resources(**options)
+        except Exception as e:
+            raise Exception(f"Error listing images on Cloudinary: {str(e)}")
+        return {
+            "resources": response.get("resources", []),
+            "next_cursor": response.get("next_cursor"),
+        }
+
+    def fetch_image(self, public_id: str, width: int = 256,
+                    timeout: float = 10) -> bytes:
+        """
+        Download a downscaled rendition of an uploaded image, e.g. to
+        compute its placeholder without fetching the original.
+        """
+        url = cloudinary.CloudinaryImage(public_id).build_url(
+            width=width, crop="limit", format="png", secure=True,
+        )
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                return response.read()
+        except Exception as e:
+            raise Exception(f"Error fetching image from Cloudinary: {str(e)}")
+
     def get_optim_url(self, image_id: str) -> str:
         """
         Generate an optimized image URL for Cloudinary.
         """
-        image = cloudinary.CloudinaryImage(image_id)
-        return image.build_url(quality="auto", fetch_format="auto").replace(
-            "http://", "https://"
-        )
+        return _optimized_url(cloudinary.config().cloud_name, image_id)
 
     def get_public_id(self) -> str:
         """
@@ -95,6 +180,114 @@ class CloudinaryImageHandler:
         return str(uuid4())
 
 
+class FakeCloudinaryImageHandler(CloudinaryImageHandler):
+    """
+    In-memory stand-in for CloudinaryImageHandler, for tests and
+    offline development (see IMAGE_UPLOAD_HANDLER).
+    * Uploaded assets are kept in the class-level ``assets`` dict.
+    """
+    BASE_URL = "https://res.cloudinary.com/fake/image/upload"
+
+    assets = {}
+    delete_calls = []
+    _lock = threading.Lock()
+
+    def __init__(self) -> None:
+        pass
+
+    def upload_image(self, image, folder=None, public_id=None, tags=None,
+                     overwrite=True, metadata=None) -> dict:
+        validate_image(image)
+        public_id = public_id or self.get_public_id()
+        if folder:
+            public_id = f"{folder}/{public_id}"
+
+        image.seek(0)
+        data = image.read()
+        with self._lock:
+            if not overwrite and public_id in self.assets:
+                raise Exception(f"Cloudinary Error: {public_id} exists")
+            self.assets[public_id] = {
+                "data": data, "bytes": len(data), "tags": tags or [],
+                "metadata": metadata, "created_at": timezone.now(),
+            }
+        return {
+            "public_id": public_id,
+            "bytes": len(data),
+            "secure_url": f"{self.BASE_URL}/{public_id}",
+        }
+
+    def delete_image(self, public_id: str) -> dict:
+        with self._lock:
+            found = self.assets.pop(public_id, None)
+        return {"result": "ok" if found else "not found"}
+
+    def delete_images(self, public_ids: list) -> dict:
+        if len(public_ids) > DELETE_BATCH_SIZE:
+            raise ValueError(
+                f"At most {DELETE_BATCH_SIZE} images can be deleted at once"
+            )
+        with self._lock:
+            self.delete_calls.append(list(public_ids))
+            return {
+                public_id: ("deleted" if self.assets.pop(public_id, None)
+                            else "not_found")
+                for public_id in public_ids
+            }
+
+    def list_images(self, next_cursor=None, prefix=None,
+                    max_results=500) -> dict:
+        # The cursor is the last public id returned, so deleting listed
+        # images does not shift later pages (as with the real API)
+        with self._lock:
+            public_ids = sorted(
+                public_id for public_id in self.assets
+                if (not prefix or public_id.startswith(prefix))
+                and (next_cursor is None or public_id > next_cursor)
+            )
+            page = public_ids[:max_results]
+            resources = [{
+                "public_id": public_id,
+                "created_at": self.assets[public_id]["created_at"].isoformat(),
+            } for public_id in page]
+        more = len(public_ids) > max_results
+        return {
+            "resources": resources,
+            "next_cursor": page[-1] if more else None,
+        }
+
+    def fetch_image(self, public_id: str, width: int = 256,
+                    timeout: float = 10) -> bytes:
+        with self._lock:
+            found = self.assets.get(public_id)
+        if found is None:
+            raise Exception(
+                f"Error fetching image from Cloudinary: {public_id} not found"
+            )
+        return found["data"]
+
+    def get_optim_url(self, image_id: str) -> str:
+        return f"{self.BASE_URL}/q_auto,f_auto/{image_id}"
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls.assets.clear()
+            cls.delete_calls.clear()
+
+
+def get_image_handler() -> CloudinaryImageHandler:
+    """
+    Return an instance of the configured image handler class.
+    * IMAGE_UPLOAD_HANDLER is a dotted path, defaulting to Cloudinary.
+    """
+    path = getattr(
+        settings, "IMAGE_UPLOAD_HANDLER",
+        "app.views.helpers.cloudinary.CloudinaryImageHandler",
+    )
+    return import_string(path)()
+
+
 def handle_image_upload(instance, uploader, image, folder):
     """
     Handle image upload for a model instance.
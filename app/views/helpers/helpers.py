@@ -5,6 +5,9 @@ from django.conf import settings
 from django.http import HttpRequest, JsonResponse
 from django.core.exceptions import PermissionDenied
 
+# Bytes needed to recognise a file type from its magic numbers
+SNIFF_SIZE = 8192
+
 
 def is_ajax(request: HttpRequest) -> bool:
     """
@@ -84,12 +87,19 @@ def return_response(
 def guess_file_type(file) -> str:
     """
     Guess the image type from the image content using the filetype module.
+    * Accepts a file or the leading bytes of one.
+    * Only the first SNIFF_SIZE bytes are read; that is all the
+        magic-number checks look at.
     """
     try:
         import filetype
-        file.seek(0)
-        file_type = filetype.guess(file.read())
-        file.seek(0)
+        if isinstance(file, (bytes, bytearray)):
+            header = file[:SNIFF_SIZE]
+        else:
+            file.seek(0)
+            header = file.read(SNIFF_SIZE)
+            file.seek(0)
+        file_type = filetype.guess(header)
         return file_type.mime if file_type else None
     except Exception:
         return None
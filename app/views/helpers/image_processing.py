@@ -0,0 +1,295 @@
+import base64
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_heif_registered = False
+
+OUTPUT_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+# Longest side of the inline placeholder; 16px encodes to ~200 bytes
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+# Metadata (EXIF includes the orientation) optimize_image always strips
+METADATA_KEYS = ("exif", "xmp", "comment")
+
+
+def get_processing_options() -> dict:
+    """Settings for optimize_image, passed explicitly to pool workers"""
+    return {
+        "max_dimension": getattr(settings, "IMAGE_MAX_DIMENSION", 2560),
+        "output_format": getattr(settings, "IMAGE_OUTPUT_FORMAT", "WEBP"),
+        "quality": getattr(settings, "IMAGE_OUTPUT_QUALITY", 82),
+    }
+
+
+class ImageRejected(ValueError):
+    """Raised for an image that must not be processed or uploaded"""
+
+
+def _register_heif() -> None:
+    """Let Pillow read HEIC/HEIF photos (when pillow-heif is installed)"""
+    global _heif_registered
+    if _heif_registered:
+        return
+    try:
+        from pillow_heif import register_heif_opener
+    except ImportError:
+        return
+    register_heif_opener()
+    _heif_registered = True
+
+
+def _open_image(data: bytes):
+    """Open and decode an image, rejecting decompression bombs"""
+    from PIL import Image
+
+    _register_heif()
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Image.DecompressionBombError:
+        raise ImageRejected("Image dimensions are too large.")
+    return image
+
+
+def optimize_image(data: bytes, max_dimension: int = 2560,
+                   output_format: str = "WEBP",
+                   quality: int = 82) -> Optional[bytes]:
+    """
+    Normalize an image for upload.
+    * Applies the EXIF orientation, then drops EXIF and other metadata
+        (the colour profile is kept).
+    * Caps the longest side at max_dimension.
+    * Re-encodes as WebP or JPEG.
+    Returns None for content Pillow cannot or should not re-encode,
+    e.g. SVG or animated images, and for images that need none of the
+    above and would not get smaller; these are uploaded as they are.
+    Raises ImageRejected for decompression bombs.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = _open_image(data)
+    except (UnidentifiedImageError, OSError):
+        return None
+    if getattr(image, "is_animated", False):
+        return None
+
+    # Re-encoded even when the output is not smaller
+    normalize = max(image.size) > max_dimension or any(
+        key in image.info for key in METADATA_KEYS
+    )
+
+    icc_profile = image.info.get("icc_profile")
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    has_alpha = image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    if output_format == "JPEG" or not has_alpha:
+        image = image.convert("RGB")
+    else:
+        image = image.convert("RGBA")
+
+    output = io.BytesIO()
+    options = {"quality": quality, "optimize": True}
+    if output_format == "WEBP":
+        options = {"quality": quality, "method": 4}
+    if icc_profile:
+        options["icc_profile"] = icc_profile
+    image.save(output, format=output_format, **options)
+    if not normalize and output.tell() >= len(data):
+        return None
+    return output.getvalue()
+
+
+def image_placeholder(data: bytes,
+                      size: int = PLACEHOLDER_SIZE) -> dict:
+    """
+    Compute the low-quality placeholder of an image.
+    * ``image_placeholder`` is a tiny WebP as a data URI, meant to be
+        inlined and stretched (blurred by the browser) behind the real
+        image until it loads.
+    * ``dominant_color`` is the most common colour as #rrggbb.
+    Both are empty strings for content Pillow cannot (or will not,
+    for decompression bombs) read.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    _register_heif()
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft("RGB", (size * 8, size * 8))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return {"image_placeholder": "", "dominant_color": ""}
+
+    image.thumbnail((size * 4, size * 4), Image.BILINEAR)
+    # Quantize to a small palette so the dominant colour is the largest
+    # group of similar pixels rather than a muddy average
+    palette = image.quantize(colors=5)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+
+    image.thumbnail((size, size), Image.BILINEAR)
+    output = io.BytesIO()
+    image.save(output, format="WEBP", quality=PLACEHOLDER_QUALITY, method=6)
+    encoded = base64.b64encode(output.getvalue()).decode("ascii")
+    return {
+        "image_placeholder": f"data:image/webp;base64,{encoded}",
+        "dominant_color": f"#{red:02x}{green:02x}{blue:02x}",
+    }
+
+
+def optimize_image_file(path: str, options: dict) -> dict:
+    """
+    Optimize a staged image in place (its extension may change).
+    * Runs in a worker process, so it takes and returns plain data.
+    Returns the resulting path, byte counts, SHA-256 and placeholder.
+    """
+    with open(path, "rb") as fl:
+        data = fl.read()
+
+    processed = optimize_image(data, **options)
+    new_path = path
+    if processed is not None:
+        extension = OUTPUT_EXTENSIONS[options["output_format"]]
+        new_path = os.path.splitext(path)[0] + extension
+        with open(new_path, "wb") as fl:
+            fl.write(processed)
+        if new_path != path:
+            os.remove(path)
+
+    result = processed if processed is not None else data
+    return {
+        "path": new_path,
+        "original_bytes": len(data),
+        "processed_bytes": len(result),
+        "sha256": hashlib.sha256(result).hexdigest(),
+        **image_placeholder(result),
+    }
+
+
+def _optimize_staged(path: str, options: dict):
+    """optimize_image_file, returning errors instead of raising them"""
+    try:
+        return optimize_image_file(path, options)
+    except Exception as e:
+        return e
+
+
+def _optimize_upload(data: bytes,
+                     options: dict) -> Tuple[Optional[bytes], dict]:
+    """
+    Returns (ImageRejected, {}) for a rejected image, and (None, {}) for
+    one Pillow fails on, which is uploaded as it is.
+    """
+    try:
+        processed = optimize_image(data, **options)
+        return processed, image_placeholder(
+            processed if processed is not None else data
+        )
+    except ImageRejected as e:
+        return e, {}
+    except Exception:
+        return None, {}
+
+
+def _placeholder(data: Optional[bytes]):
+    """image_placeholder, returning errors instead of raising them"""
+    try:
+        return image_placeholder(data)
+    except Exception as e:
+        return e
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Return the shared process pool for image work, or None to run it
+    in the calling process (IMAGE_PROCESS_WORKERS = 0).
+    * Created once per process, whichever thread asks first.
+    * Workers are started by a fork server (or spawned), never forked
+        from a web worker that is running other threads.
+    """
+    global _process_pool
+    workers = getattr(settings, "IMAGE_PROCESS_WORKERS", 2)
+    if not workers:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            method = ("forkserver" if "forkserver" in
+                      multiprocessing.get_all_start_methods() else "spawn")
+            _process_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(method),
+            )
+    return _process_pool
+
+
+def _map(function, *iterables) -> list:
+    pool = get_process_pool()
+    if pool is None:
+        return list(map(function, *iterables))
+    return list(pool.map(function, *iterables))
+
+
+def optimize_staged_files(paths: List[str]) -> list:
+    """
+    Optimize staged images in parallel; see optimize_image_file.
+    * A file that fails yields its exception instead of a result.
+    """
+    options = get_processing_options()
+    return _map(_optimize_staged, paths, [options] * len(paths))
+
+
+def optimize_uploads(images: list) -> list:
+    """
+    Optimize uploaded images in parallel before they are uploaded.
+    * Returns files with the normalized content, its SHA-256 and its
+        placeholder (see image_placeholder) as attributes; images that
+        cannot be re-encoded are returned as they are.
+    * A rejected image yields its ImageRejected instead.
+    """
+    options = get_processing_options()
+    extension = OUTPUT_EXTENSIONS[options["output_format"]]
+    contents = []
+    for image in images:
+        image.seek(0)
+        contents.append(image.read())
+        image.seek(0)
+
+    optimized = []
+    processed = _map(_optimize_upload, contents, [options] * len(contents))
+    for image, (data, placeholder) in zip(images, processed):
+        if isinstance(data, ImageRejected):
+            optimized.append(data)
+            continue
+        if data is None:
+            upload = image
+        else:
+            name = os.path.splitext(os.path.basename(image.name))[0]
+            upload = ContentFile(data, name=f"{name}{extension}")
+            upload.sha256 = hashlib.sha256(data).hexdigest()
+        upload.placeholder = placeholder
+        optimized.append(upload)
+    return optimized
+
+
+def compute_placeholders(contents: List[bytes]) -> list:
+    """
+    Compute image_placeholder for many images in the process pool.
+    * An image that fails yields its exception instead of a result.
+    """
+    return _map(_placeholder, contents)
@@ -0,0 +1,242 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from app.models.car import Vehicle
+from app.models.cars.category import VehicleCategory, VehicleCategoryRelation
+from app.models.cars.feature import VehicleFeature
+from app.models.cars.review import VehicleReview
+from app.models.cars.saved import SavedVehicle
+
+TAG_VERSION_KEY = "tag:{tag}"
+
+# Anything listed, searched or counted across sellers
+INVENTORY_TAG = "inventory"
+
+_batch = threading.local()
+
+
+def vehicle_tag(pk: int) -> str:
+    return f"vehicle:{pk}"
+
+
+def seller_tag(user_id: int) -> str:
+    return f"seller:{user_id}"
+
+
+def category_tag(slug: str) -> str:
+    return f"category:{slug}"
+
+
+def _new_version() -> str:
+    return uuid4().hex[:16]
+
+
+def get_tag_versions(tags: Iterable[str]) -> Dict[str, str]:
+    """
+    Return {tag: version} for the given tags in one cache round trip.
+    * A missing version starts as a fresh random one, so an evicted
+        version can never fall back onto entries cached under it.
+    """
+    keys = {TAG_VERSION_KEY.format(tag=tag): tag for tag in set(tags)}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, tag in keys.items():
+        if tag not in versions:
+            cache.add(key, _new_version(), timeout=None)
+            versions[tag] = cache.get(key)
+    return versions
+
+
+def tagged_key(key: str, tags: Iterable[str]) -> str:
+    """
+    Return a cache key that changes whenever any of the tags is bumped;
+    entries stored under the previous key simply expire.
+    """
+    versions = get_tag_versions(tags)
+    return f"{key}@{'.'.join(versions[tag] for tag in sorted(versions))}"
+
+
+def _bump(tags) -> None:
+    cache.set_many({
+        TAG_VERSION_KEY.format(tag=tag): _new_version() for tag in tags
+    }, timeout=None)
+
+
+def bump_tags(tags: Iterable[Optional[str]]) -> None:
+    """
+    Make everything cached under the given tags stale.
+    * One cache write for any number of tags.
+    * Inside a transaction the tags are bumped again once it commits,
+        so entries rebuilt from the uncommitted state by concurrent
+        readers are dropped too.
+    * Inside coalesced_bumps() the tags are collected and bumped once,
+        when the block exits.
+    """
+    tags = {tag for tag in tags if tag}
+    if not tags:
+        return
+    pending = getattr(_batch, "tags", None)
+    if pending is not None:
+        pending.update(tags)
+        return
+
+    _bump(tags)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(tags))
+
+
+@contextmanager
+def coalesced_bumps():
+    """Collect every bump made in the block and apply each tag once"""
+    if getattr(_batch, "tags", None) is not None:
+        # Nested: the outermost block applies them
+        yield
+        return
+
+    _batch.tags = set()
+    try:
+        yield
+    finally:
+        tags, _batch.tags = _batch.tags, None
+        bump_tags(tags)
+
+
+def vehicle_tags(vehicle: Vehicle, seller_ids=()) -> set:
+    tags = {vehicle_tag(vehicle.pk), INVENTORY_TAG}
+    tags.update(seller_tag(user_id) for user_id in seller_ids if user_id)
+    return tags
+
+
+def invalidate_vehicles(vehicle_ids: Iterable[int]) -> None:
+    """
+    Bump the tags of vehicles changed without model signals, e.g. by
+    a queryset update.
+    """
+    vehicle_ids = set(vehicle_ids)
+    if not vehicle_ids:
+        return
+    seller_ids = set(
+        Vehicle.objects.filter(pk__in=vehicle_ids)
+        .values_list("listed_by_id", flat=True)
+    )
+    bump_tags(
+        [vehicle_tag(pk) for pk in vehicle_ids]
+        + [seller_tag(user_id) for user_id in seller_ids if user_id]
+        + [INVENTORY_TAG]
+    )
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_vehicle(sender, instance, raw=False, **kwargs):
+    """
+    Saved (including published and unpublished) or deleted; the
+    previous seller's storefront changes too when re-assigned.
+    """
+    if raw:
+        return
+    bump_tags(vehicle_tags(instance, (
+        instance.listed_by_id,
+        instance.get_original_value("listed_by_id"),
+    )))
+
+
+@receiver(post_save, sender=VehicleCategoryRelation)
+@receiver(post_delete, sender=VehicleCategoryRelation)
+def invalidate_category_relation(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    slug = VehicleCategory.objects.filter(
+        pk=instance.category_id
+    ).values_list("slug", flat=True).first()
+    bump_tags([
+        vehicle_tag(instance.vehicle_id), category_tag(slug), INVENTORY_TAG
+    ])
+
+
+@receiver(m2m_changed, sender=VehicleCategoryRelation)
+@receiver(m2m_changed, sender=Vehicle.features.through)
+def invalidate_vehicle_relations(sender, instance, action, reverse, model,
+                                 pk_set, **kwargs):
+    """
+    Categories or features added to or removed from vehicles; a clear
+    is handled before the rows go (and bumped again on commit).
+    """
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        # instance is the category or feature
+        related = [instance]
+        vehicle_ids = pk_set if action != "pre_clear" else set(
+            instance.vehicles.values_list("pk", flat=True)
+        )
+    else:
+        vehicle_ids = {instance.pk}
+        related = model._default_manager.all() if action == "pre_clear" \
+            else model._default_manager.filter(pk__in=pk_set)
+        if action == "pre_clear":
+            related = related.filter(vehicles=instance)
+
+    # Category and feature counts are shown across the inventory
+    tags = {vehicle_tag(pk) for pk in vehicle_ids} | {INVENTORY_TAG}
+    if model is VehicleCategory or isinstance(instance, VehicleCategory):
+        tags.update(category_tag(category.slug) for category in related)
+    bump_tags(tags)
+
+
+@receiver(post_save, sender=VehicleCategory)
+@receiver(post_delete, sender=VehicleCategory)
+def invalidate_category(sender, instance, raw=False, **kwargs):
+    """Renamed, re-slugged or removed; category filters are listed"""
+    if raw:
+        return
+    bump_tags([
+        category_tag(instance.slug),
+        category_tag(instance.get_original_value("slug")),
+        INVENTORY_TAG,
+    ])
+
+
+@receiver(pre_delete, sender=VehicleFeature)
+def remember_feature_vehicles(sender, instance, **kwargs):
+    instance._vehicle_ids = set(
+        instance.vehicles.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_save, sender=VehicleFeature)
+@receiver(post_delete, sender=VehicleFeature)
+def invalidate_feature(sender, instance, raw=False, **kwargs):
+    """Shown on every vehicle that has it, and in the search filters"""
+    if raw:
+        return
+    vehicle_ids = instance.__dict__.pop("_vehicle_ids", None)
+    if vehicle_ids is None:
+        vehicle_ids = instance.vehicles.values_list("pk", flat=True)
+    bump_tags([vehicle_tag(pk) for pk in vehicle_ids] + [INVENTORY_TAG])
+
+
+@receiver(post_save, sender=VehicleReview)
+@receiver(post_delete, sender=VehicleReview)
+def invalidate_review(sender, instance, raw=False, **kwargs):
+    """Only approved reviews are shown"""
+    if raw:
+        return
+    if instance.approved or instance.get_original_value("approved"):
+        bump_tags([vehicle_tag(instance.vehicle_id)])
+
+
+@receiver(post_save, sender=SavedVehicle)
+@receiver(post_delete, sender=SavedVehicle)
+def invalidate_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_tags([vehicle_tag(instance.vehicle_id)])
@@ -0,0 +1,114 @@
+import hashlib
+from functools import wraps
+from typing import Iterable, Optional
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from app.views.helpers.caching import cached_compute
+from app.views.helpers.invalidation import INVENTORY_TAG
+from carhouse.middleware.sessionless import is_sessionless
+
+MICRO_CACHE_KEY = "micro:{digest}"
+
+# Query parameters that never change what a page shows
+IGNORED_PARAMS = frozenset((
+    "utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content",
+    "fbclid", "gclid",
+))
+# Request headers a cached page may differ by
+VARY_HEADERS = ("X-Requested-With",)
+CACHEABLE_STATUSES = (200, 404)
+
+
+class Uncacheable(Exception):
+    """Raised to pass a response through without caching it"""
+
+    def __init__(self, response):
+        super().__init__(response.status_code)
+        self.response = response
+
+
+def canonical_key(request) -> str:
+    """
+    Cache key for a request: host, path, query string (sorted, without
+    tracking parameters) and VARY_HEADERS.
+    """
+    params = sorted(
+        (name, value) for name, values in request.GET.lists()
+        if name not in IGNORED_PARAMS for value in values
+    )
+    parts = [request.get_host(), request.path, urlencode(params)]
+    parts.extend(request.headers.get(name, "") for name in VARY_HEADERS)
+    digest = hashlib.sha256("\n".join(parts).encode()).hexdigest()[:32]
+    return MICRO_CACHE_KEY.format(digest=digest)
+
+
+def _snapshot(response) -> tuple:
+    """(status, headers, content) of a response safe to share"""
+    cache_control = response.get("Cache-Control", "")
+    if response.status_code not in CACHEABLE_STATUSES or \
+            response.streaming or response.cookies or \
+            "Cookie" in response.get("Vary", "") or \
+            "private" in cache_control or "no-store" in cache_control:
+        raise Uncacheable(response)
+    return response.status_code, list(response.items()), response.content
+
+
+def _restore(snapshot: tuple) -> HttpResponse:
+    status, headers, content = snapshot
+    response = HttpResponse(content, status=status)
+    for name, value in headers:
+        response[name] = value
+    return response
+
+
+def micro_cache(timeout: Optional[int] = None,
+                tags: Iterable[str] = (INVENTORY_TAG,)):
+    """
+    Cache whole responses to anonymous GETs for a few seconds; use
+    method_decorator(micro_cache(), name='dispatch') on class-based
+    views, which must also be sessionless.
+    * Entries are shared by every worker and refreshed through
+        cached_compute: one worker re-renders an expired page while the
+        rest serve the previous one.
+    * Bumping any of `tags` (the inventory generation by default)
+        makes the cached pages stale.
+    * Responses that set cookies, vary by cookie or are private are
+        passed through; X-Micro-Cache reports HIT or MISS.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not settings.MICRO_CACHE_ENABLED or \
+                    request.method != "GET" or not is_sessionless(request):
+                return view_func(request, *args, **kwargs)
+
+            rendered = []
+
+            def render():
+                response = view_func(request, *args, **kwargs)
+                if hasattr(response, "render"):
+                    response = response.render()
+                rendered.append(response)
+                return _snapshot(response)
+
+            try:
+                snapshot = cached_compute(
+                    canonical_key(request), render,
+                    timeout or settings.MICRO_CACHE_TIMEOUT, tags=tags,
+                    grace=settings.MICRO_CACHE_GRACE,
+                )
+            except Uncacheable as e:
+                return e.response
+
+            if rendered:
+                response = rendered[0]
+                response["X-Micro-Cache"] = "MISS"
+            else:
+                response = _restore(snapshot)
+                response["X-Micro-Cache"] = "HIT"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,115 @@
+from typing import Iterable, Set
+
+from django.core.cache import cache
+from django.db import transaction
+
+from app.models.cars.saved import SavedVehicle
+from app.views.helpers.invalidation import (
+    bump_tags, coalesced_bumps, vehicle_tag
+)
+
+SAVED_IDS_KEY = "saved_vehicles:{user_id}"
+SAVED_IDS_TIMEOUT = 60 * 60 * 24
+
+
+def _saved_ids_key(user_id: int) -> str:
+    return SAVED_IDS_KEY.format(user_id=user_id)
+
+
+def get_saved_vehicle_ids(user) -> Set[int]:
+    """
+    Return the set of vehicle ids saved by the user.
+    * Loaded from the database once, then served from the cache.
+    * Anonymous users always get an empty set.
+    """
+    if not user.is_authenticated:
+        return set()
+
+    key = _saved_ids_key(user.pk)
+    saved_ids = cache.get(key)
+    if saved_ids is None:
+        saved_ids = set(
+            SavedVehicle.objects.filter(user=user)
+            .values_list("vehicle_id", flat=True)
+        )
+        cache.set(key, saved_ids, timeout=SAVED_IDS_TIMEOUT)
+    return set(saved_ids)
+
+
+def get_saved_on_page(user, vehicles: Iterable) -> Set[int]:
+    """
+    Return the ids of the given vehicles that the user has saved.
+    * One set intersection for the whole page, no per-card queries.
+    """
+    if not user.is_authenticated:
+        return set()
+    return get_saved_vehicle_ids(user) & {vehicle.pk for vehicle in vehicles}
+
+
+def _forget_saved_ids(user_id: int) -> None:
+    """
+    Drop the cached id set so the next read reloads it.
+    * Dropped now and again once the transaction commits, so a set
+        reloaded from the uncommitted state in between is not kept.
+    * Deleting rather than updating the set means concurrent changes
+        by the same user (two tabs, a bulk save) can't overwrite each
+        other's.
+    """
+    key = _saved_ids_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def save_vehicles(user, vehicle_ids: Iterable[int]) -> Set[int]:
+    """
+    Save the given vehicles for the user.
+    * A single INSERT that ignores rows which already exist, so
+        repeated or concurrent requests never raise IntegrityError.
+    """
+    vehicle_ids = set(vehicle_ids)
+    if not vehicle_ids:
+        return set()
+
+    SavedVehicle.objects.bulk_create(
+        [SavedVehicle(user=user, vehicle_id=pk) for pk in vehicle_ids],
+        ignore_conflicts=True,
+    )
+    # bulk_create sends no signals
+    bump_tags(vehicle_tag(pk) for pk in vehicle_ids)
+    _forget_saved_ids(user.pk)
+    return vehicle_ids
+
+
+def unsave_vehicles(user, vehicle_ids: Iterable[int]) -> Set[int]:
+    """
+    Remove the given vehicles from the user's saved list.
+    * A single DELETE; removing an unsaved vehicle is a no-op.
+    """
+    vehicle_ids = set(vehicle_ids)
+    if not vehicle_ids:
+        return set()
+
+    with coalesced_bumps():
+        SavedVehicle.objects.filter(
+            user=user, vehicle_id__in=vehicle_ids
+        ).delete()
+    _forget_saved_ids(user.pk)
+    return vehicle_ids
+
+
+def toggle_saved_vehicle(user, vehicle_id: int) -> bool:
+    """
+    Toggle a saved vehicle and return whether it is now saved.
+    * Tries the DELETE first; only when nothing was deleted is the
+        row inserted, so a double click can't create and remove the
+        same row out of order.
+    """
+    deleted, _ = SavedVehicle.objects.filter(
+        user=user, vehicle_id=vehicle_id
+    ).delete()
+    if deleted:
+        _forget_saved_ids(user.pk)
+        return False
+
+    save_vehicles(user, [vehicle_id])
+    return True
@@ -0,0 +1,130 @@
+from typing import Optional
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from app.models.car import Vehicle
+from app.views.helpers.caching import cached_compute
+from app.views.helpers.invalidation import bump_tags, seller_tag
+from authentication.models.profile import (
+    Profile, SellerReview, profile_aggregates_changed
+)
+
+STOREFRONT_TIMEOUT = 60 * 10
+STOREFRONT_PAGE_SIZE = 12
+
+VEHICLE_CARD_FIELDS = (
+    'title', 'year', 'make', 'model', 'trim', 'price', 'sale_price',
+    'mileage', 'fuel_type', 'transmission', 'cloudinary_image_id',
+    'cloudinary_image_url', 'optimized_image_url', 'image_placeholder',
+    'dominant_color',
+)
+
+
+def invalidate_storefront(seller_id: Optional[int]) -> None:
+    """Make every cached page of a seller's storefront stale"""
+    if seller_id is not None:
+        bump_tags([seller_tag(seller_id)])
+
+
+def _vehicle_card(vehicle: Vehicle) -> dict:
+    return {
+        'id': vehicle.pk,
+        'title': vehicle.title,
+        'url': reverse('app:car_detail', kwargs={'pk': vehicle.pk}),
+        'year': vehicle.year,
+        'mileage': vehicle.mileage,
+        'price': vehicle.price,
+        'display_price': vehicle.display_price,
+        'has_discount': vehicle.has_discount,
+        'fuel_type': vehicle.get_fuel_type_display(),
+        'transmission': vehicle.get_transmission_display(),
+        'primary_image': vehicle.primary_image,
+        'cloudinary_image_id': vehicle.cloudinary_image_id,
+        'image_placeholder': vehicle.image_placeholder,
+        'dominant_color': vehicle.dominant_color,
+    }
+
+
+def _seller_summary(profile: Profile) -> dict:
+    user = profile.user
+    return {
+        'username': user.username,
+        'display_name': profile.display_name,
+        'account_type': profile.get_account_type_display(),
+        'is_verified_seller': profile.is_verified_seller,
+        'responds_quickly': profile.responds_quickly,
+        'profile_image': profile.profile_image,
+        'bio': profile.bio,
+        'location': ', '.join(
+            part for part in (profile.city, profile.country) if part
+        ),
+        'member_since': user.date_joined,
+        'rating': profile.rating,
+        'review_count': profile.review_count,
+        'rating_histogram': profile.rating_histogram,
+        'active_listings_count': profile.active_listings_count,
+        'sold_listings_count': profile.sold_listings_count,
+        'phone_number': profile.phone_number if profile.show_phone else '',
+        'email': user.email if profile.show_email else '',
+        'website': profile.website,
+        'facebook': profile.facebook,
+        'twitter': profile.twitter,
+        'instagram': profile.instagram,
+        'linkedin': profile.linkedin,
+    }
+
+
+def _build_storefront(seller_id: int, after: Optional[int]) -> dict:
+    """
+    Build one storefront page from the denormalized profile aggregates
+    and a single keyset-paginated vehicle query.
+    """
+    profile = Profile.objects.select_related('user').get(user_id=seller_id)
+
+    vehicles = Vehicle.objects.filter(
+        listed_by_id=seller_id, live=True, published=True, sold=False
+    ).with_cover_image()
+    if after:
+        vehicles = vehicles.filter(pk__lt=after)
+    vehicles = list(
+        vehicles.order_by('-pk')
+        .only(*VEHICLE_CARD_FIELDS)[:STOREFRONT_PAGE_SIZE + 1]
+    )
+
+    has_next = len(vehicles) > STOREFRONT_PAGE_SIZE
+    vehicles = vehicles[:STOREFRONT_PAGE_SIZE]
+    return {
+        'seller': _seller_summary(profile),
+        'vehicles': [_vehicle_card(vehicle) for vehicle in vehicles],
+        'next_cursor': vehicles[-1].pk if has_next else None,
+    }
+
+
+def get_storefront(seller_id: int, after: Optional[int] = None) -> dict:
+    """
+    Return a storefront page, cached per cursor under the seller's
+    tag (see app.views.helpers.caching and invalidation).
+    """
+    return cached_compute(
+        f"storefront:{seller_id}:{after or 0}",
+        lambda: _build_storefront(seller_id, after),
+        STOREFRONT_TIMEOUT, tags=[seller_tag(seller_id)],
+    )
+
+
+@receiver(post_save, sender=SellerReview)
+@receiver(post_delete, sender=SellerReview)
+def invalidate_review_storefront(sender, instance, **kwargs):
+    invalidate_storefront(instance.seller_id)
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_profile_storefront(sender, instance, **kwargs):
+    invalidate_storefront(instance.user_id)
+
+
+@receiver(profile_aggregates_changed)
+def invalidate_rebuilt_storefronts(sender, user_ids, **kwargs):
+    bump_tags(seller_tag(user_id) for user_id in user_ids)
@@ -0,0 +1,149 @@
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadedfile import (
+    TemporaryUploadedFile, UploadedFile
+)
+from django.core.files.uploadhandler import (
+    FileUploadHandler, StopFutureHandlers, TemporaryFileUploadHandler,
+)
+
+from app.views.helpers.helpers import SNIFF_SIZE, guess_file_type
+
+
+class RejectedUpload(UploadedFile):
+    """
+    Placeholder left in request.FILES for an image the upload handler
+    refused; validate_image turns ``upload_error`` into a form error.
+    """
+
+    def __init__(self, name, content_type, size, upload_error):
+        super().__init__(file=None, name=name, content_type=content_type,
+                         size=size)
+        self.upload_error = upload_error
+
+    def open(self, mode=None):
+        raise ValueError(self.upload_error)
+
+    def chunks(self, chunk_size=None):
+        raise ValueError(self.upload_error)
+
+
+class ValidatingImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Validate image uploads while they stream in.
+    * Requests above MAX_UPLOAD_REQUEST_SIZE are refused (400) from
+        their declared Content-Length before any body is read.
+    * Files in IMAGE_UPLOAD_FIELDS are checked against MAX_UPLOAD_SIZE
+        (declared size first), their type is sniffed from the first
+        SNIFF_SIZE bytes, and a SHA-256 is computed chunk by chunk.
+    * Rejected files are never written to disk; other fields are left
+        to the remaining upload handlers.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        limit = getattr(settings, "MAX_UPLOAD_REQUEST_SIZE", None)
+        if limit and content_length and content_length > limit:
+            # Raised outside the parser's StopUpload handling; Django
+            # answers this one with a 400
+            raise RequestDataTooBig(
+                "Upload exceeds MAX_UPLOAD_REQUEST_SIZE."
+            )
+
+    def new_file(self, field_name, file_name, content_type, content_length,
+                 charset=None, content_type_extra=None):
+        image_fields = getattr(settings, "IMAGE_UPLOAD_FIELDS", ())
+        # Formset fields are prefixed, e.g. gallery_images-0-image
+        self.active = field_name.rsplit("-", 1)[-1] in image_fields
+        if not self.active:
+            return
+
+        FileUploadHandler.new_file(
+            self, field_name, file_name, content_type, content_length,
+            charset, content_type_extra,
+        )
+        self.file = None
+        self.head = b""
+        self.received = 0
+        self.sniffed_type = None
+        self.sha256 = hashlib.sha256()
+        self.upload_error = None
+        if content_length and content_length > settings.MAX_UPLOAD_SIZE:
+            self.reject_size()
+        raise StopFutureHandlers()
+
+    def reject_size(self):
+        max_upload = f'{settings.MAX_UPLOAD_SIZE / (1024 * 1024):.2f}'
+        self.reject(f"Image too large. Max size is {max_upload}MB")
+
+    def reject(self, message):
+        self.upload_error = message
+        if self.file is not None:
+            # Closing a temporary upload deletes it
+            self.file.close()
+            self.file = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        self.received += len(raw_data)
+        if self.upload_error:
+            return None
+        if self.received > settings.MAX_UPLOAD_SIZE:
+            self.reject_size()
+            return None
+
+        self.sha256.update(raw_data)
+        if self.sniffed_type is None:
+            # Hold the first bytes in memory until there are enough
+            # to sniff; nothing touches the disk before that
+            self.head += raw_data
+            if len(self.head) < SNIFF_SIZE:
+                return None
+            raw_data, self.head = self.head, b""
+            if not self._sniff(raw_data):
+                return None
+
+        self.file.write(raw_data)
+        return None
+
+    def _sniff(self, data) -> bool:
+        """Check the type of the first bytes; False if rejected"""
+        self.sniffed_type = guess_file_type(data[:SNIFF_SIZE]) or ""
+        allowed = settings.ALLOWED_IMAGE_TYPES
+        if self.sniffed_type not in allowed:
+            self.reject(
+                f"Unsupported image type. Allowed types: {', '.join(allowed)}"
+            )
+            return False
+
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset,
+            self.content_type_extra,
+        )
+        return True
+
+    def upload_interrupted(self):
+        if getattr(self, "file", None) is not None:
+            super().upload_interrupted()
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+
+        if not self.upload_error and self.sniffed_type is None:
+            # Files smaller than SNIFF_SIZE are sniffed once complete
+            if self._sniff(self.head):
+                self.file.write(self.head)
+        if self.upload_error:
+            return RejectedUpload(self.file_name, self.content_type,
+                                  self.received, self.upload_error)
+
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sniffed_type = self.sniffed_type
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
@@ -0,0 +1,384 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+from typing import List, Optional, Tuple, Union
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from app.models.cars.upload import ImageUploadJob
+from app.views.helpers.assets import (
+    file_digest, fill_placeholder, hold_assets, register_asset,
+    release_images
+)
+from app.views.helpers.cloudinary import (
+    CloudinaryImageHandler, get_image_handler, handle_image_upload
+)
+from app.views.helpers.image_processing import (
+    ImageRejected, optimize_staged_files, optimize_uploads
+)
+
+VEHICLE_FOLDER = "vehicles"
+GALLERY_FOLDER = "vehicles/gallery"
+
+
+def get_upload_workers() -> int:
+    return getattr(settings, "IMAGE_UPLOAD_WORKERS", 4)
+
+
+def upload_concurrently(
+    handler: CloudinaryImageHandler,
+    uploads: List[Tuple[object, str]],
+    workers: Optional[int] = None,
+) -> List[Union[dict, Exception]]:
+    """
+    Upload (image, folder) pairs through a bounded thread pool.
+    * Returns one result per upload, in order: the image fields from
+        handle_image_upload, or the exception that upload raised.
+    * Threads only talk to the image handler, never the database.
+    """
+    def upload(pair):
+        image, folder = pair
+        try:
+            return handle_image_upload(None, handler, image, folder)
+        except Exception as e:
+            return e
+
+    if not uploads:
+        return []
+    workers = min(workers or get_upload_workers(), len(uploads))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(upload, uploads))
+
+
+def upload_deduplicated(
+    handler: CloudinaryImageHandler,
+    uploads: List[Tuple[object, str]],
+    workers: Optional[int] = None,
+) -> List[Union[dict, Exception]]:
+    """
+    Like upload_concurrently, but content that is already on Cloudinary
+    (matched by SHA-256) is reused instead of uploaded again, and
+    duplicates within the batch are uploaded once.
+    * Every successful result holds a reference on its asset, so it
+        can't be deleted before the row using it is saved; release
+        them with release_images afterwards, which also deletes fresh
+        uploads nothing ended up using.
+    * An image's ``placeholder`` attribute (see image_placeholder) is
+        stored on its asset and included in the results.
+    """
+    digests = [file_digest(image) for image, _ in uploads]
+    found = hold_assets(digests)
+    for digest, (image, _) in zip(digests, uploads):
+        if digest in found:
+            fill_placeholder(found[digest],
+                             getattr(image, "placeholder", None))
+
+    pending = {}
+    for index, digest in enumerate(digests):
+        if digest not in found and digest not in pending:
+            pending[digest] = index
+    results = upload_concurrently(
+        handler, [uploads[index] for index in pending.values()], workers
+    )
+
+    for (digest, index), result in zip(pending.items(), results):
+        if isinstance(result, Exception):
+            found[digest] = result
+            continue
+        image = uploads[index][0]
+        asset, created = register_asset(
+            digest, result, image.size, getattr(image, "placeholder", None),
+            references=digests.count(digest),
+        )
+        if not created:
+            # The same content was registered meanwhile; drop our copy
+            try:
+                handler.delete_image(result["cloudinary_image_id"])
+            except Exception:
+                pass
+        found[digest] = asset
+
+    return [
+        found[digest] if isinstance(found[digest], Exception)
+        else found[digest].image_fields
+        for digest in digests
+    ]
+
+
+def held_images(results: List[Union[dict, Exception]]) -> List[str]:
+    """The public ids held by the successful results of an upload"""
+    return [result["cloudinary_image_id"] for result in results
+            if not isinstance(result, Exception)]
+
+
+def upload_vehicle_images(form, gallery_formset,
+                          handler: CloudinaryImageHandler) -> List[str]:
+    """
+    Upload the primary image and gallery images of validated forms
+    concurrently, before anything is saved.
+    * Successful uploads are set on each form's instance.
+    * Failed uploads are reported as errors on their own form.
+    Returns the public ids held for the forms (see
+    upload_deduplicated), to release once they are saved or not.
+    """
+    targets = []
+    primary_image = form.cleaned_data.get("primary_image")
+    if primary_image:
+        targets.append((form, "primary_image", primary_image,
+                        VEHICLE_FOLDER))
+    for gallery_form in gallery_formset.forms:
+        if gallery_form in gallery_formset.deleted_forms:
+            continue
+        image = gallery_form.cleaned_data.get("image")
+        if image:
+            targets.append((gallery_form, "image", image, GALLERY_FOLDER))
+
+    images = optimize_uploads([image for _, _, image, _ in targets])
+    # Rejected images are reported without being uploaded
+    uploaded = iter(upload_deduplicated(handler, [
+        (image, folder) for image, (_, _, _, folder) in zip(images, targets)
+        if not isinstance(image, Exception)
+    ]))
+    results = [image if isinstance(image, Exception) else next(uploaded)
+               for image in images]
+
+    for (target_form, field, _, _), result in zip(targets, results):
+        if isinstance(result, Exception):
+            target_form.add_error(field, str(result))
+            continue
+        for name, value in result.items():
+            setattr(target_form.instance, name, value)
+    return held_images(results)
+
+
+def get_staging_dir() -> str:
+    return getattr(
+        settings, "IMAGE_UPLOAD_STAGING_DIR",
+        os.path.join(settings.MEDIA_ROOT, "uploads", "pending"),
+    )
+
+
+def stage_image_upload(instance, image, folder: str) -> ImageUploadJob:
+    """
+    Write an uploaded image to the staging directory and queue it.
+    * The Cloudinary upload happens later in process_upload_jobs.
+    """
+    staging_dir = get_staging_dir()
+    os.makedirs(staging_dir, exist_ok=True)
+
+    extension = os.path.splitext(image.name or "")[1].lower()
+    file_path = os.path.join(staging_dir, f"{uuid4()}{extension}")
+    sha256 = hashlib.sha256()
+    with open(file_path, "wb") as fl:
+        for chunk in image.chunks():
+            sha256.update(chunk)
+            fl.write(chunk)
+
+    return ImageUploadJob.objects.create(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_id=instance.pk,
+        file_path=file_path,
+        folder=folder,
+        sha256=sha256.hexdigest(),
+    )
+
+
+def stage_vehicle_images(vehicle, form,
+                         gallery_formset=None) -> List[ImageUploadJob]:
+    """
+    Queue the primary image of a saved vehicle form and the images
+    of its saved gallery formset.
+    """
+    jobs = []
+    primary_image = form.cleaned_data.get("primary_image")
+    if primary_image:
+        jobs.append(stage_image_upload(vehicle, primary_image,
+                                       VEHICLE_FOLDER))
+
+    if gallery_formset is not None:
+        for gallery_form in gallery_formset.forms:
+            image = gallery_form.cleaned_data.get("image")
+            # Deleted gallery images have their pk cleared on save
+            if image and gallery_form.instance.pk:
+                jobs.append(stage_image_upload(gallery_form.instance, image,
+                                               GALLERY_FOLDER))
+    return jobs
+
+
+def requeue_stale_jobs(timeout: int = 60 * 15) -> int:
+    """Put back jobs whose worker died mid-upload"""
+    return ImageUploadJob.objects.filter(
+        status=ImageUploadJob.UPLOADING,
+        updated_at__lt=timezone.now() - timedelta(seconds=timeout),
+    ).update(status=ImageUploadJob.PENDING, updated_at=timezone.now())
+
+
+def claim_upload_jobs(limit: int) -> List[ImageUploadJob]:
+    """
+    Claim up to `limit` pending jobs for this worker.
+    * Rows locked by another worker are skipped (where supported).
+    """
+    with transaction.atomic():
+        jobs = list(
+            ImageUploadJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ImageUploadJob.PENDING)
+            .select_related("content_type")[:limit]
+        )
+        ImageUploadJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ImageUploadJob.UPLOADING,
+            attempts=F("attempts") + 1,
+            updated_at=timezone.now(),
+        )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def optimize_jobs(jobs: List[ImageUploadJob]) -> Tuple[int, dict]:
+    """
+    Pre-process the staged files of jobs that have not been processed
+    yet, in the image process pool.
+    Returns the bytes saved and {job: ImageRejected} for the jobs whose
+    images must not be uploaded.
+    """
+    jobs = [job for job in jobs if job.processed_bytes is None]
+    results = optimize_staged_files([job.file_path for job in jobs])
+
+    saved, rejected = 0, {}
+    for job, result in zip(jobs, results):
+        if isinstance(result, ImageRejected):
+            rejected[job] = result
+            continue
+        if isinstance(result, Exception):
+            # Upload the file as it is; the upload reports real errors
+            continue
+        job.file_path = result["path"]
+        job.sha256 = result["sha256"]
+        job.original_bytes = result["original_bytes"]
+        job.processed_bytes = result["processed_bytes"]
+        job.image_placeholder = result["image_placeholder"]
+        job.dominant_color = result["dominant_color"]
+        job.save(update_fields=["file_path", "sha256", "original_bytes",
+                                "processed_bytes", "image_placeholder",
+                                "dominant_color", "updated_at"])
+        saved += job.original_bytes - job.processed_bytes
+    return saved, rejected
+
+
+def _upload_staged(handler: CloudinaryImageHandler, jobs: List[ImageUploadJob],
+                   workers: int) -> List[Union[dict, Exception]]:
+    """Open each staged file and upload the new content concurrently"""
+    with ExitStack() as stack:
+        uploads, missing = [], {}
+        for index, job in enumerate(jobs):
+            try:
+                fl = stack.enter_context(open(job.file_path, "rb"))
+            except OSError as e:
+                missing[index] = e
+                continue
+            image = File(fl, name=os.path.basename(job.file_path))
+            image.sha256 = job.sha256
+            image.placeholder = {
+                "image_placeholder": job.image_placeholder,
+                "dominant_color": job.dominant_color,
+            }
+            uploads.append((image, job.folder))
+        results = upload_deduplicated(handler, uploads, workers)
+        results = iter(results)
+        return [missing[index] if index in missing else next(results)
+                for index in range(len(jobs))]
+
+
+def _remove_staged(job: ImageUploadJob) -> None:
+    try:
+        os.remove(job.file_path)
+    except FileNotFoundError:
+        pass
+
+
+def _apply_upload(job: ImageUploadJob, fields: dict) -> None:
+    """Store the upload result on the job's target and retire the job"""
+    with transaction.atomic():
+        model = job.content_type.model_class()
+        target = model._default_manager.filter(pk=job.object_id).first()
+        if target is not None:
+            # Receivers move the asset references (see helpers.assets)
+            for name, value in fields.items():
+                setattr(target, name, value)
+            target.save(update_fields=list(fields))
+
+        job.status = ImageUploadJob.DONE
+        job.error = ""
+        job.save(update_fields=["status", "error", "updated_at"])
+
+    # Deletes the upload if the listing went away meanwhile
+    release_images([fields["cloudinary_image_id"]])
+    _remove_staged(job)
+
+
+def _fail_job(job: ImageUploadJob, error: Exception,
+              max_attempts: int) -> None:
+    """Retry the job later, or give up and drop its staged file"""
+    job.error = str(error)
+    job.status = (ImageUploadJob.FAILED if job.attempts >= max_attempts
+                  else ImageUploadJob.PENDING)
+    job.save(update_fields=["status", "error", "updated_at"])
+    if job.status == ImageUploadJob.FAILED:
+        _remove_staged(job)
+
+
+def process_upload_jobs(
+    limit: int = 50, workers: Optional[int] = None
+) -> Tuple[int, int, int]:
+    """
+    Pre-process and upload a batch of pending jobs concurrently.
+    * Images are optimized in a process pool, then uploaded from a
+        thread pool; results are written back to the database from
+        the calling thread.
+    * Failed jobs are retried until IMAGE_UPLOAD_MAX_ATTEMPTS, then
+        marked FAILED and their staged files removed. A job whose
+        result can't be stored, or whose image pre-processing rejects,
+        fails at once, without holding up the rest of the batch.
+    Returns (uploaded, failed, bytes saved by pre-processing).
+    """
+    max_attempts = getattr(settings, "IMAGE_UPLOAD_MAX_ATTEMPTS", 3)
+
+    requeue_stale_jobs()
+    jobs = claim_upload_jobs(limit)
+    if not jobs:
+        return 0, 0, 0
+
+    saved, rejected = optimize_jobs(jobs)
+    uploaded, failed = 0, len(rejected)
+    for job, error in rejected.items():
+        # Retrying would not help
+        _fail_job(job, error, max_attempts=job.attempts)
+    jobs = [job for job in jobs if job not in rejected]
+
+    handler = get_image_handler()
+    results = _upload_staged(handler, jobs, workers)
+
+    for job, result in zip(jobs, results):
+        if not isinstance(result, Exception):
+            try:
+                _apply_upload(job, result)
+            except Exception as e:
+                # Uploaded, but not stored; don't keep the upload
+                release_images([result["cloudinary_image_id"]])
+                _fail_job(job, e, max_attempts=job.attempts)
+                failed += 1
+            else:
+                uploaded += 1
+            continue
+
+        failed += 1
+        _fail_job(job, result, max_attempts)
+    return uploaded, failed, saved
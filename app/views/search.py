@@ -3,11 +3,19 @@ from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.models import Q
 from django.http import JsonResponse
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 
 from app.models.car import Vehicle
 from app.views.helpers.helpers import is_ajax
+from app.views.helpers.micro_cache import micro_cache
+from app.views.helpers.saved import get_saved_on_page
+from carhouse.middleware.replica import replica_reads
+from carhouse.middleware.sessionless import sessionless
 
 
+@method_decorator(sessionless, name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
+@method_decorator(micro_cache(), name='dispatch')
 class SearchView(ListView):
     template_name = "app/search/search.html"
     context_object_name = "search_results"
@@ -77,6 +85,8 @@ class SearchView(ListView):
             self.request.POST.get("sort", "relevance")
         self.page = self.request.GET.get("page", 1) or\
             self.request.POST.get("page", 1)
+        self.category = self.request.GET.get("category", "all") or\
+            self.request.POST.get("category", "all")
 
         # Get filtered results
         self.vehicle_results = self._get_filtered_results()
@@ -96,14 +106,14 @@ class SearchView(ListView):
         # If no query, show all results
         if not self.query:
             if self.category in ["all", "posts"]:
-                vehicle_results = Vehicle.objects.live()
+                vehicle_results = Vehicle.objects.live().with_cover_image()
 
         # If query exists, filter results
         if self.category in ["all", "posts"]:
             vehicle_results = Vehicle.objects.filter(
                 Q(title__icontains=self.query) |
                 Q(description__icontains=self.query)
-            )
+            ).with_cover_image()
         return vehicle_results
 
     def _apply_sorting(self):
@@ -174,6 +184,9 @@ class SearchView(ListView):
             "selected_year": self.year,
             "selected_sort": self.sort,
             "selected_page": self.page,
+            "saved_vehicle_ids": get_saved_on_page(
+                self.request.user, search_results
+            ),
         })
 
         return context
@@ -4,40 +4,62 @@ from django.db.models import Count, Q
 from django.views.generic.edit import FormView
 from django.contrib import messages
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
 
 from app.models.car import Vehicle
 from app.models.cars.category import VehicleCategory
 from app.forms.search import VehicleSearchForm
 from app.forms.contact import ContactMessageForm
+from app.views.helpers.caching import cached_compute
+from app.views.helpers.invalidation import INVENTORY_TAG
+from app.views.helpers.micro_cache import micro_cache
+from carhouse.middleware.replica import replica_reads
+from carhouse.middleware.sessionless import sessionless
+from carhouse.routers import use_primary
 
+HOME_SNAPSHOT_KEY = "home:snapshot"
+HOME_SNAPSHOT_TIMEOUT = 60 * 5
 
-class HomeView(TemplateView):
-    template_name = "app/home/home.html"
-    status = 200
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # Featured vehicles
-        context['featured_vehicles'] = Vehicle.objects.filter(
+def _build_home_snapshot() -> dict:
+    """The listings and categories shown on the homepage"""
+    return {
+        'featured_vehicles': list(Vehicle.objects.filter(
             live=True,
             published=True,
             featured=True,
             sold=False
-        )[:6]
-
-        # Latest vehicles
-        context['latest_vehicles'] = Vehicle.objects.filter(
+        ).with_cover_image()[:6]),
+        'latest_vehicles': list(Vehicle.objects.filter(
             live=True,
             published=True,
             sold=False
-        ).order_by('-first_published_at')[:8]
-
+        ).with_cover_image().order_by('-first_published_at')[:8]),
         # Popular categories with vehicle count
-        context['categories'] = VehicleCategory.objects.annotate(
+        'categories': list(VehicleCategory.objects.annotate(
             vehicle_count=Count('vehicles', filter=Q(vehicles__live=True,
                                                      vehicles__published=True))
-        ).filter(vehicle_count__gt=0).order_by('-vehicle_count')[:8]
+        ).filter(vehicle_count__gt=0).order_by('-vehicle_count')[:8]),
+    }
+
+
+@method_decorator(sessionless, name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
+@method_decorator(micro_cache(), name='dispatch')
+class HomeView(TemplateView):
+    template_name = "app/home/home.html"
+    status = 200
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        # Featured and latest vehicles, popular categories; built from
+        # the primary, as the snapshot is kept for longer than replicas lag
+        with use_primary():
+            context.update(cached_compute(
+                HOME_SNAPSHOT_KEY, _build_home_snapshot,
+                HOME_SNAPSHOT_TIMEOUT, tags=[INVENTORY_TAG],
+            ))
 
         # Search form
         context['search_form'] = VehicleSearchForm()
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from app.views.helpers.invalidation import coalesced_bumps
+from authentication.models.profile import (
+    profile_user_id_batches, recompute_seller_ratings
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild every seller's rating aggregate in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Number of profiles recomputed per batch",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        # Every seller's cache tags are bumped in one write at the end
+        with coalesced_bumps():
+            for seller_ids in profile_user_id_batches(options["batch_size"]):
+                total += recompute_seller_ratings(seller_ids)
+                self.stdout.write(f"Recomputed {total} seller ratings...")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Seller ratings rebuilt for {total} profiles.")
+        )
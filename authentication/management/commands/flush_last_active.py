@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from carhouse.middleware.last_active import flush_last_active
+
+
+class Command(BaseCommand):
+    help = "Write buffered activity timestamps to Profile.last_active"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=500,
+            help="Number of buffered timestamps written per UPDATE",
+        )
+
+    def handle(self, *args, **options):
+        total = flush_last_active(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated last_active for {total} profiles."
+        ))
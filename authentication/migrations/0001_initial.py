@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:11
+
+import cloudinary.models
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('search_params', models.JSONField(help_text='Saved search parameters')),
+                ('notify', models.BooleanField(default=True, help_text='Send notifications for new matching vehicles')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_notified', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Saved Search',
+                'verbose_name_plural': 'Saved Searches',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(blank=True, max_length=100)),
+                ('bio', models.TextField(blank=True, max_length=500)),
+                ('account_type', models.CharField(choices=[('buyer', 'Car Buyer'), ('seller', 'Car Seller'), ('dealer', 'Car Dealer'), ('admin', 'Admin')], default='buyer', help_text='Type of account for this user', max_length=20)),
+                ('phone_number', models.CharField(blank=True, max_length=17, validators=[django.core.validators.RegexValidator(message="Phone number must be entered in the format: '+999999999'.            Up to 15 digits allowed.", regex='^\\+?1?\\d{9,15}$')])),
+                ('show_phone', models.BooleanField(default=False, help_text='Show phone number on listings')),
+                ('show_email', models.BooleanField(default=False, help_text='Show email on listings')),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('state', models.CharField(blank=True, max_length=100)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('address', models.CharField(blank=True, max_length=255)),
+                ('postal_code', models.CharField(blank=True, max_length=20)),
+                ('website', models.URLField(blank=True, null=True)),
+                ('facebook', models.URLField(blank=True, null=True)),
+                ('twitter', models.URLField(blank=True, null=True)),
+                ('instagram', models.URLField(blank=True, null=True)),
+                ('linkedin', models.URLField(blank=True, null=True)),
+                ('profile_pic', cloudinary.models.CloudinaryField(blank=True, max_length=255, null=True, verbose_name='image')),
+                ('cloudinary_image_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('cloudinary_image_url', models.URLField(blank=True, null=True)),
+                ('optimized_image_url', models.URLField(blank=True, null=True)),
+                ('company_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('business_license', models.CharField(blank=True, max_length=100, null=True)),
+                ('is_verified_seller', models.BooleanField(default=False)),
+                ('email_notifications', models.BooleanField(default=True)),
+                ('sms_notifications', models.BooleanField(default=False)),
+                ('listing_count', models.PositiveIntegerField(default=0)),
+                ('rating', models.DecimalField(blank=True, decimal_places=1, max_digits=3, null=True)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_active', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Profile',
+                'verbose_name_plural': 'User Profiles',
+                'indexes': [models.Index(fields=['account_type'], name='authenticat_account_fdc6c5_idx'), models.Index(fields=['is_verified_seller'], name='authenticat_is_veri_8a17b0_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SellerReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5')], help_text='Rating from 1 to 5 stars')),
+                ('title', models.CharField(max_length=100)),
+                ('comment', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('is_approved', models.BooleanField(default=False)),
+                ('reviewer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='given_reviews', to=settings.AUTH_USER_MODEL)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_reviews', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'unique_together': {('reviewer', 'seller')},
+            },
+        ),
+    ]
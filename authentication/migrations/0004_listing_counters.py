@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_alter_profile_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='active_listings_count',
+            field=models.PositiveIntegerField(default=0, help_text='Live, published and unsold listings'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='sold_listings_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
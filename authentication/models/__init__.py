@@ -0,0 +1,3 @@
+from authentication.models.profile import (  # noqa: F401
+    Profile, SellerReview, SavedSearch
+)
@@ -1,16 +1,60 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from cloudinary.models import CloudinaryField
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.apps import apps
+from django.db.models import (
+    Case, Count, ExpressionWrapper, F, FloatField, Q, Sum, When
+)
+from django.db.models.functions import Greatest
 from django.urls import reverse_lazy as reverse
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.utils import timezone
+from django.db.models.fields.related_descriptors import (
+    ReverseOneToOneDescriptor
+)
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
 from django.core.validators import RegexValidator
-from django.utils.functional import cached_property
 # from django.utils.text import slugify
 # from wagtail.fields import RichTextField
 
+from carhouse.mixins.dirty_fields import DirtyFieldsMixin
+
+# Sent with ``user_ids`` after aggregates are rebuilt in bulk, which
+# bypasses the per-row model signals
+profile_aggregates_changed = Signal()
+
+
+class AutoCreatedProfileDescriptor(ReverseOneToOneDescriptor):
+    """
+    ``user.profile`` that creates the missing profile on first access
+    instead of raising RelatedObjectDoesNotExist.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        try:
+            return super().__get__(instance, cls)
+        except self.RelatedObjectDoesNotExist:
+            if instance.pk is None:
+                raise
+            profile, _ = self.related.related_model.objects.get_or_create(
+                **{self.related.field.name: instance}
+            )
+            self.__set__(instance, profile)
+            return profile
 
-class Profile(models.Model):
+
+class AutoOneToOneField(models.OneToOneField):
+    """OneToOneField whose reverse accessor creates the related row"""
+    related_accessor_class = AutoCreatedProfileDescriptor
+
+
+class Profile(DirtyFieldsMixin, models.Model):
     """
     Extended user profile for the car listing platform.
     Uses User reference.
@@ -23,7 +67,7 @@ class Profile(models.Model):
     ]
 
     # User relationship
-    user = models.OneToOneField(
+    user = AutoOneToOneField(
         User,
         on_delete=models.CASCADE,
         related_name='profile'
@@ -83,11 +127,23 @@ class Profile(models.Model):
     sms_notifications = models.BooleanField(default=False)
 
     # Platform engagement
+    # Listing counters are maintained by the Vehicle signals below
     listing_count = models.PositiveIntegerField(default=0)
+    active_listings_count = models.PositiveIntegerField(
+        default=0, help_text="Live, published and unsold listings")
+    sold_listings_count = models.PositiveIntegerField(default=0)
     rating = models.DecimalField(max_digits=3, decimal_places=1,
                                  null=True, blank=True)
     review_count = models.PositiveIntegerField(default=0)
 
+    # Running seller rating aggregate (approved reviews only)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -112,7 +168,7 @@ class Profile(models.Model):
 
     def get_absolute_url(self):
         """Return the URL for this profile"""
-        return reverse('profile_detail',
+        return reverse('app:profile_detail',
                        kwargs={'username': self.user.username})
 
     @property
@@ -132,13 +188,43 @@ class Profile(models.Model):
         # Default placeholder
         return "/static/images/default-profile.png"
 
-    @cached_property
-    def active_listings_count(self):
-        """Return count of active vehicle listings"""
-        return self.user.vehicles.filter(published=True, sold=False).count()
-
+    @property
+    def rating_histogram(self):
+        """Return the number of approved reviews per star, 5 to 1"""
+        return {
+            star: getattr(self, f'rating_{star}_count')
+            for star in range(5, 0, -1)
+        }
 
-class SellerReview(models.Model):
+    @property
+    def responds_quickly(self):
+        """Whether the seller was active within RESPONSIVE_SELLER_WINDOW"""
+        if self.last_active is None:
+            return False
+        window = getattr(settings, 'RESPONSIVE_SELLER_WINDOW', 60 * 60 * 24)
+        return timezone.now() - self.last_active <= timedelta(seconds=window)
+
+
+class SellerReviewQuerySet(models.QuerySet):
+
+    def moderate(self, approve=True):
+        """
+        Approve or unapprove every review in the queryset.
+        Bypasses the per-review signals and recomputes each affected
+        seller's rating (and bumps their cache tags) once for the whole
+        batch.
+        """
+        from app.views.helpers.invalidation import coalesced_bumps
+
+        with coalesced_bumps(), transaction.atomic():
+            changed = self.exclude(is_approved=approve)
+            seller_ids = set(changed.values_list('seller_id', flat=True))
+            updated = changed.update(is_approved=approve)
+            recompute_seller_ratings(seller_ids)
+        return updated
+
+
+class SellerReview(DirtyFieldsMixin, models.Model):
     """
     Reviews for sellers/dealers from buyers
     """
@@ -161,6 +247,8 @@ class SellerReview(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_approved = models.BooleanField(default=False)
 
+    objects = SellerReviewQuerySet.as_manager()
+
     class Meta:
         unique_together = ('reviewer', 'seller')
         ordering = ['-created_at']
@@ -168,6 +256,42 @@ class SellerReview(models.Model):
     def __str__(self):
         return f"Review of {self.seller} by {self.reviewer}"
 
+    def save(self, *args, **kwargs):
+        # The rating transition is taken from the locked row, not this
+        # instance's snapshot, so saves of stale copies of the same
+        # review apply it once
+        with transaction.atomic():
+            self._locked_approved_rating = self._lock_stored_rating()
+            super().save(*args, **kwargs)
+
+    def _lock_stored_rating(self):
+        """Lock the stored row; return its approved_rating"""
+        if self._state.adding or self.pk is None:
+            return None
+        row = SellerReview.objects.select_for_update().filter(
+            pk=self.pk
+        ).values('seller_id', 'rating', 'is_approved').first()
+        if row and row['is_approved']:
+            return row['seller_id'], row['rating']
+        return None
+
+    @property
+    def approved_rating(self):
+        """Return (seller_id, rating) if this review counts, else None"""
+        if self.is_approved:
+            return self.seller_id, self.rating
+        return None
+
+    @property
+    def stored_approved_rating(self):
+        """approved_rating of the row as it was loaded from the db"""
+        if not self.is_tracked:
+            return None
+        if self.get_original_value('is_approved'):
+            return (self.get_original_value('seller_id'),
+                    self.get_original_value('rating'))
+        return None
+
 
 class SavedSearch(models.Model):
     """
@@ -196,36 +320,278 @@ class SavedSearch(models.Model):
 
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    """Create a Profile instance when a new User is created"""
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """
+    Create a Profile instance when a new User is created.
+    Other saves (e.g. last_login on every login) never touch the
+    profile; users that predate this get one lazily via user.profile.
+    """
+    if created and not raw:
         Profile.objects.create(user=instance)
 
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Ensure the Profile is saved when the User is saved"""
-    # Create profile if it doesn't exist (for existing users)
-    Profile.objects.get_or_create(user=instance)
-    instance.profile.save()
+def profile_user_id_batches(batch_size):
+    """Yield lists of profile user ids in keyset-paginated batches"""
+    last_user_id = 0
+    while True:
+        user_ids = list(
+            Profile.objects.filter(user_id__gt=last_user_id)
+            .order_by('user_id')
+            .values_list('user_id', flat=True)[:batch_size]
+        )
+        if not user_ids:
+            return
+        yield user_ids
+        last_user_id = user_ids[-1]
 
 
-@receiver(post_save, sender=SellerReview)
-def update_seller_rating(sender, instance, **kwargs):
-    """Update seller's average rating when a review is created or updated"""
-    if instance.is_approved:
-        seller = instance.seller
-        approved_reviews = SellerReview.objects.filter(
-            seller=seller,
-            is_approved=True
+def _rating_update(sum_delta, count_delta, star_deltas):
+    """
+    Build the UPDATE kwargs that shift a seller's rating aggregate.
+    The average is derived from the adjusted sum and count in the
+    same statement, so concurrent reviews never read a stale total;
+    the rating column itself rounds it to one decimal place.
+    """
+    new_sum = F('rating_sum') + sum_delta
+    new_count = F('review_count') + count_delta
+    updates = {
+        'rating_sum': new_sum,
+        'review_count': new_count,
+        'rating': Case(
+            When(review_count__gt=-count_delta, then=ExpressionWrapper(
+                new_sum * 1.0 / new_count, output_field=FloatField())),
+            default=None,
+        ),
+    }
+    for star, delta in star_deltas.items():
+        if delta:
+            field = f'rating_{star}_count'
+            updates[field] = F(field) + delta
+    return updates
+
+
+def adjust_seller_rating(seller_id, added=None, removed=None):
+    """
+    Atomically add and/or remove one approved rating for a seller.
+    """
+    star_deltas = {}
+    if added is not None:
+        star_deltas[added] = star_deltas.get(added, 0) + 1
+    if removed is not None:
+        star_deltas[removed] = star_deltas.get(removed, 0) - 1
+
+    Profile.objects.filter(user_id=seller_id).update(**_rating_update(
+        sum_delta=(added or 0) - (removed or 0),
+        count_delta=(added is not None) - (removed is not None),
+        star_deltas=star_deltas,
+    ))
+
+
+def recompute_seller_ratings(seller_ids):
+    """
+    Recompute the rating aggregate of the given sellers from scratch.
+    One grouped query and one bulk update per call.
+    """
+    seller_ids = set(seller_ids)
+    if not seller_ids:
+        return 0
+
+    stars = range(1, 6)
+    totals = {
+        row['seller_id']: row for row in SellerReview.objects.filter(
+            seller_id__in=seller_ids, is_approved=True
+        ).order_by().values('seller_id').annotate(
+            total=Sum('rating'),
+            count=Count('id'),
+            **{f'rating_{star}_count': Count('id', filter=Q(rating=star))
+               for star in stars},
+        )
+    }
+
+    fields = ['rating', 'rating_sum', 'review_count'] + [
+        f'rating_{star}_count' for star in stars
+    ]
+    profiles = list(
+        Profile.objects.filter(user_id__in=seller_ids).only('user_id', *fields)
+    )
+    for profile in profiles:
+        row = totals.get(profile.user_id, {})
+        profile.rating_sum = row.get('total') or 0
+        profile.review_count = row.get('count') or 0
+        profile.rating = (
+            round(Decimal(profile.rating_sum) / profile.review_count, 1)
+            if profile.review_count else None
         )
+        for star in stars:
+            field = f'rating_{star}_count'
+            setattr(profile, field, row.get(field) or 0)
+
+    Profile.objects.bulk_update(profiles, fields)
+    profile_aggregates_changed.send(sender=Profile, user_ids=seller_ids)
+    return len(profiles)
 
-        # Calculate new rating average
-        ratings_sum = sum(review.rating for review in approved_reviews)
-        count = approved_reviews.count()
 
-        if count > 0:
-            # Update seller's profile
-            seller.profile.rating = round(ratings_sum / count, 1)
-            seller.profile.review_count = count
-            seller.profile.save()
+@receiver(post_save, sender=SellerReview)
+def update_seller_rating(sender, instance, raw=False, **kwargs):
+    """Apply the approve, edit or unapprove transition of a review"""
+    if raw:
+        return
+
+    if '_locked_approved_rating' in instance.__dict__:
+        previous = instance.__dict__.pop('_locked_approved_rating')
+    else:
+        previous = instance.stored_approved_rating
+    current = instance.approved_rating
+    if previous == current:
+        return
+
+    if previous and current and previous[0] == current[0]:
+        adjust_seller_rating(current[0], added=current[1],
+                             removed=previous[1])
+        return
+    if previous:
+        adjust_seller_rating(previous[0], removed=previous[1])
+    if current:
+        adjust_seller_rating(current[0], added=current[1])
+
+
+@receiver(post_delete, sender=SellerReview)
+def remove_seller_rating(sender, instance, **kwargs):
+    """Remove a deleted review's contribution to the seller rating"""
+    if instance.is_tracked:
+        previous = instance.stored_approved_rating
+    else:
+        previous = instance.approved_rating
+    if previous:
+        adjust_seller_rating(previous[0], removed=previous[1])
+
+
+LISTING_COUNTERS = (
+    'listing_count', 'active_listings_count', 'sold_listings_count'
+)
+
+
+def _listing_contribution(live, published, sold):
+    """Return what one vehicle adds to each listing counter"""
+    return {
+        'listing_count': 1,
+        'active_listings_count': int(bool(live and published and not sold)),
+        'sold_listings_count': int(bool(sold)),
+    }
+
+
+def _vehicle_listing_state(vehicle, stored=False):
+    """
+    Return (owner id, counter contribution) of a vehicle, either as it
+    is now or as it is stored in the database.
+    """
+    if stored:
+        value = vehicle.get_original_value
+    else:
+        def value(attname):
+            return getattr(vehicle, attname)
+
+    owner_id = value('listed_by_id')
+    if owner_id is None:
+        return None
+    return owner_id, _listing_contribution(
+        value('live'), value('published'), value('sold')
+    )
+
+
+def adjust_listing_counters(owner_id, deltas):
+    """Atomically shift a seller's listing counters"""
+    updates = {
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items() if delta
+    }
+    if updates:
+        Profile.objects.filter(user_id=owner_id).update(**updates)
+
+
+def recompute_listing_counters(user_ids):
+    """
+    Recompute the listing counters of the given sellers from scratch.
+    One grouped query and one bulk update per call.
+    """
+    user_ids = set(user_ids)
+    if not user_ids:
+        return 0
+
+    Vehicle = apps.get_model('app', 'Vehicle')
+    active = Q(live=True, published=True, sold=False)
+    totals = {
+        row['listed_by_id']: row for row in Vehicle.objects.filter(
+            listed_by_id__in=user_ids
+        ).order_by().values('listed_by_id').annotate(
+            listing_count=Count('pk'),
+            active_listings_count=Count('pk', filter=active),
+            sold_listings_count=Count('pk', filter=Q(sold=True)),
+        )
+    }
+
+    profiles = list(
+        Profile.objects.filter(user_id__in=user_ids)
+        .only('user_id', *LISTING_COUNTERS)
+    )
+    for profile in profiles:
+        row = totals.get(profile.user_id, {})
+        for field in LISTING_COUNTERS:
+            setattr(profile, field, row.get(field, 0))
+
+    Profile.objects.bulk_update(profiles, LISTING_COUNTERS)
+    profile_aggregates_changed.send(sender=Profile, user_ids=user_ids)
+    return len(profiles)
+
+
+@receiver(pre_save, sender='app.Vehicle')
+def remember_listing_state(sender, instance, raw=False, **kwargs):
+    """Capture what the stored row contributes before it is replaced"""
+    state = None
+    if raw or instance._state.adding:
+        pass
+    elif instance.is_tracked:
+        state = _vehicle_listing_state(instance, stored=True)
+    else:
+        # e.g. a page rebuilt from a Wagtail revision
+        stored = sender.objects.filter(pk=instance.pk).values(
+            'listed_by_id', 'live', 'published', 'sold').first()
+        if stored and stored['listed_by_id'] is not None:
+            state = stored['listed_by_id'], _listing_contribution(
+                stored['live'], stored['published'], stored['sold'])
+    instance._stored_listing_state = state
+
+
+@receiver(post_save, sender='app.Vehicle')
+def update_listing_counters(sender, instance, raw=False, **kwargs):
+    """Apply a create, publish, unpublish, sell or re-assign transition"""
+    if raw:
+        return
+
+    previous = instance.__dict__.pop('_stored_listing_state', None)
+    current = _vehicle_listing_state(instance)
+    if previous == current:
+        return
+
+    deltas = {}
+    if previous:
+        owner_id, contribution = previous
+        deltas[owner_id] = {f: -n for f, n in contribution.items()}
+    if current:
+        owner_id, contribution = current
+        owner_deltas = deltas.setdefault(owner_id, {})
+        for field, n in contribution.items():
+            owner_deltas[field] = owner_deltas.get(field, 0) + n
+
+    for owner_id, owner_deltas in deltas.items():
+        adjust_listing_counters(owner_id, owner_deltas)
+
+
+@receiver(post_delete, sender='app.Vehicle')
+def remove_listing_counters(sender, instance, **kwargs):
+    """Remove a deleted vehicle from its seller's listing counters"""
+    state = _vehicle_listing_state(instance, stored=instance.is_tracked)
+    if state:
+        owner_id, contribution = state
+        adjust_listing_counters(
+            owner_id, {f: -n for f, n in contribution.items()})
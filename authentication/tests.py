@@ -1,3 +1,259 @@
-from django.test import TestCase
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from app.views.helpers import invalidation
+from authentication.models.profile import Profile, SellerReview
+from carhouse.middleware.last_active import (
+    FLUSHED_KEY, GAP_KEY, GAP_TIMEOUT, SEQUENCE_KEY, record_activity
+)
+
+
+class SellerRatingTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.reviewers = [
+            User.objects.create_user(f'buyer{i}', password='pass')
+            for i in range(3)
+        ]
+
+    def review(self, reviewer, rating, approved=True):
+        return SellerReview.objects.create(
+            reviewer=reviewer, seller=self.seller, rating=rating,
+            title='Review', comment='Comment', is_approved=approved,
+        )
+
+    def profile(self):
+        return Profile.objects.get(user=self.seller)
+
+    def test_unapproved_reviews_do_not_count(self):
+        self.review(self.reviewers[0], 5, approved=False)
+        profile = self.profile()
+        self.assertEqual(profile.review_count, 0)
+        self.assertIsNone(profile.rating)
+
+    def test_approve_edit_and_delete_transitions(self):
+        first = self.review(self.reviewers[0], 4)
+        self.review(self.reviewers[1], 5)
+        profile = self.profile()
+        self.assertEqual((profile.review_count, profile.rating_sum), (2, 9))
+        self.assertEqual(profile.rating, Decimal('4.5'))
+
+        first = SellerReview.objects.get(pk=first.pk)
+        first.rating = 2
+        first.save()
+        profile = self.profile()
+        self.assertEqual(profile.rating, Decimal('3.5'))
+        self.assertEqual(profile.rating_histogram,
+                         {5: 1, 4: 0, 3: 0, 2: 1, 1: 0})
+
+        first.is_approved = False
+        first.save()
+        self.assertEqual(self.profile().rating, Decimal('5.0'))
+
+        SellerReview.objects.filter(seller=self.seller).delete()
+        profile = self.profile()
+        self.assertEqual((profile.review_count, profile.rating_sum), (0, 0))
+        self.assertIsNone(profile.rating)
+
+    def test_stale_copies_apply_a_transition_once(self):
+        review = self.review(self.reviewers[0], 4, approved=False)
+        first = SellerReview.objects.get(pk=review.pk)
+        second = SellerReview.objects.get(pk=review.pk)
+        for copy in (first, second):
+            copy.is_approved = True
+            copy.save()
+        profile = self.profile()
+        self.assertEqual((profile.review_count, profile.rating_sum), (1, 4))
+
+        first.rating = 2
+        first.save()
+        second.rating = 2
+        second.save()
+        profile = self.profile()
+        self.assertEqual((profile.review_count, profile.rating_sum), (1, 2))
+        self.assertEqual(profile.rating_histogram,
+                         {5: 0, 4: 0, 3: 0, 2: 1, 1: 0})
+
+    def test_bulk_moderation_recomputes_once(self):
+        for reviewer, rating in zip(self.reviewers, [1, 3, 5]):
+            self.review(reviewer, rating, approved=False)
+
+        updated = SellerReview.objects.filter(
+            seller=self.seller).moderate(approve=True)
+        self.assertEqual(updated, 3)
+        profile = self.profile()
+        self.assertEqual(profile.review_count, 3)
+        self.assertEqual(profile.rating, Decimal('3.0'))
+
+    def test_bulk_moderation_bumps_the_seller_tag_once(self):
+        for reviewer, rating in zip(self.reviewers, [1, 3, 5]):
+            self.review(reviewer, rating, approved=False)
+
+        with patch.object(invalidation, '_bump') as bump:
+            SellerReview.objects.filter(
+                seller=self.seller).moderate(approve=True)
+        bump.assert_called_once_with({invalidation.seller_tag(self.seller.pk)})
+
+    def test_backfill_bumps_every_batch_at_once(self):
+        other = User.objects.create_user('dealer', password='pass')
+        with patch.object(invalidation, '_bump') as bump:
+            call_command('backfill_seller_ratings', batch_size=1,
+                         stdout=StringIO())
+        bump.assert_called_once()
+        self.assertLessEqual(
+            {invalidation.seller_tag(self.seller.pk),
+             invalidation.seller_tag(other.pk)},
+            bump.call_args[0][0]
+        )
+
+    def test_backfill_command(self):
+        self.review(self.reviewers[0], 3)
+        self.review(self.reviewers[1], 4)
+        Profile.objects.filter(user=self.seller).update(
+            rating=None, rating_sum=0, review_count=0, rating_3_count=0,
+            rating_4_count=0,
+        )
+
+        call_command('backfill_seller_ratings', batch_size=1,
+                     stdout=StringIO())
+        profile = self.profile()
+        self.assertEqual(profile.review_count, 2)
+        self.assertEqual(profile.rating, Decimal('3.5'))
+
+
+class ProfileWriteTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('driver', password='Pass-1234')
+
+    def profile_writes(self, queries):
+        return [
+            query['sql'] for query in queries
+            if 'authentication_profile' in query['sql']
+            and not query['sql'].startswith('SELECT')
+        ]
+
+    def test_login_issues_no_profile_writes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('authentication:login'), {
+                'username': 'driver', 'password': 'Pass-1234',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.profile_writes(queries), [])
+
+    def test_unchanged_profile_save_is_skipped(self):
+        profile = Profile.objects.get(user=self.user)
+        with self.assertNumQueries(0):
+            profile.save()
+
+    def test_unchanged_profile_picture_is_not_dirty(self):
+        Profile.objects.filter(user=self.user).update(
+            profile_pic='image/upload/v1/avatars/driver.jpg')
+        profile = Profile.objects.get(user=self.user)
+        self.assertTrue(profile.profile_pic)
+        with self.assertNumQueries(0):
+            profile.save()
+
+        profile.profile_pic = 'image/upload/v2/avatars/other.jpg'
+        self.assertIn('profile_pic', profile.get_dirty_fields())
+
+    def test_changed_profile_updates_only_dirty_columns(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.bio = 'Weekend mechanic'
+        self.assertEqual(profile.get_dirty_fields(), {'bio': ''})
+
+        with CaptureQueriesContext(connection) as queries:
+            profile.save()
+        [update] = self.profile_writes(queries)
+        self.assertIn('"bio"', update)
+        self.assertIn('"updated_at"', update)
+        self.assertNotIn('"city"', update)
+        self.assertFalse(profile.is_dirty())
+
+    def test_profile_is_created_lazily(self):
+        Profile.objects.filter(user=self.user).delete()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.profile.user_id, user.pk)
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+
+
+@override_settings(LAST_ACTIVE_BUFFERED=True)
+class LastActiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('driver', password='pass')
+        self.client.force_login(self.user)
+
+    def last_active(self):
+        return Profile.objects.get(user=self.user).last_active
+
+    def test_requests_are_buffered_until_flush(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('authentication:login'))
+        self.assertFalse(any(
+            'authentication_profile' in query['sql']
+            and query['sql'].startswith('UPDATE') for query in queries
+        ))
+        self.assertIsNone(self.last_active())
+
+        call_command('flush_last_active', stdout=StringIO())
+        profile = Profile.objects.get(user=self.user)
+        self.assertIsNotNone(profile.last_active)
+        self.assertTrue(profile.responds_quickly)
+
+    def test_activity_is_recorded_once_per_interval(self):
+        self.assertTrue(record_activity(self.user.pk))
+        self.assertFalse(record_activity(self.user.pk))
+
+    def test_flush_writes_one_update_per_batch(self):
+        users = [self.user] + [
+            User.objects.create_user(f'driver{i}', password='pass')
+            for i in range(3)
+        ]
+        for user in users:
+            record_activity(user.pk)
+
+        with self.assertNumQueries(2):
+            call_command('flush_last_active', batch_size=2,
+                         stdout=StringIO())
+        self.assertFalse(Profile.objects.filter(
+            user__in=users, last_active__isnull=True).exists())
+
+        with self.assertNumQueries(0):
+            call_command('flush_last_active', stdout=StringIO())
+
+    def test_flush_waits_for_slots_still_being_written(self):
+        other = User.objects.create_user('driver2', password='pass')
+        record_activity(self.user.pk)
+        # Slot 2 reserved by a request that has yet to write it
+        cache.incr(SEQUENCE_KEY)
+        record_activity(other.pk)
+
+        call_command('flush_last_active', stdout=StringIO())
+        self.assertIsNotNone(self.last_active())
+        self.assertIsNone(Profile.objects.get(user=other).last_active)
+        self.assertEqual(cache.get(FLUSHED_KEY), 1)
+
+        # Given up on once it has been missing for GAP_TIMEOUT
+        slot, seen = cache.get(GAP_KEY)
+        cache.set(GAP_KEY, (slot, seen - GAP_TIMEOUT))
+        call_command('flush_last_active', stdout=StringIO())
+        self.assertIsNotNone(Profile.objects.get(user=other).last_active)
+        self.assertEqual(cache.get(FLUSHED_KEY), 3)
+
+    @override_settings(LAST_ACTIVE_BUFFERED=False)
+    def test_written_directly_without_a_shared_cache(self):
+        self.assertTrue(record_activity(self.user.pk))
+        self.assertIsNotNone(self.last_active())
+        self.assertIsNone(cache.get(SEQUENCE_KEY))
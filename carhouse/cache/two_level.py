@@ -0,0 +1,270 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django_redis.cache import RedisCache
+
+INVALIDATION_CHANNEL = 'cache:l1:invalidate'
+# Broadcast in place of a key when the whole cache is cleared
+CLEAR_ALL = '*'
+
+_MISSING = object()
+
+
+class LocalTier:
+    """
+    Bounded in-process LRU in front of Redis, shared by every thread.
+    * Every write to an L1 key, in any process, is broadcast over Redis
+        pub/sub; a listener thread drops the key from this process (or
+        everything, for CLEAR_ALL).
+    * Each invalidation stamps the key with the next local generation.
+        A value read from Redis is only kept if its key has not been
+        stamped since the read began, so a write racing a read can
+        never leave a stale entry behind.
+    * L1_TIMEOUT bounds staleness should a broadcast be missed.
+    """
+
+    def __init__(self, prefixes, max_entries=1000, timeout=30):
+        self.prefixes = tuple(prefixes)
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        # key -> generation of its latest invalidation (bounded); older
+        # stamps are folded into `floor`
+        self.stamps = OrderedDict()
+        self.generation = 0
+        self.floor = 0
+        self.origin = uuid4().hex
+        self.lock = threading.Lock()
+        self.listener = None
+        self.pid = None
+        # Set while the listener is subscribed
+        self.subscribed = threading.Event()
+
+    def handles(self, key: str) -> bool:
+        return key.startswith(self.prefixes)
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return _MISSING, self.generation
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return _MISSING, self.generation
+            self.entries.move_to_end(key)
+            return value, None
+
+    def set(self, key: str, value, generation: int) -> None:
+        """Keep a value read from Redis since `generation`"""
+        with self.lock:
+            if self.floor > generation or \
+                    self.stamps.get(key, -1) > generation:
+                return
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+            self.stamps[key] = self.generation
+            self.stamps.move_to_end(key)
+            while len(self.stamps) > self.max_entries:
+                _, self.floor = self.stamps.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.generation += 1
+            self.floor = self.generation
+            self.entries.clear()
+            self.stamps.clear()
+
+    def ensure_listener(self, get_client) -> None:
+        """Start (or, after a fork, restart) the pub/sub listener"""
+        if self.listener is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.listener is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.listener = threading.Thread(
+                target=self.listen, args=(get_client,), daemon=True,
+                name='cache-l1-listener',
+            )
+            self.listener.start()
+
+    def listen(self, get_client) -> None:
+        while True:
+            try:
+                pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Broadcasts may have been missed while disconnected
+                self.clear()
+                self.subscribed.set()
+                for message in pubsub.listen():
+                    data = message['data']
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    origin, _, key = data.partition('|')
+                    if origin == self.origin:
+                        continue
+                    if key == CLEAR_ALL:
+                        self.clear()
+                    else:
+                        self.invalidate(key)
+            except Exception:
+                self.subscribed.clear()
+                self.clear()
+                time.sleep(1)
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def get_local_tier(location: str, options: dict) -> LocalTier:
+    """One LocalTier per Redis location per process"""
+    with _tiers_lock:
+        if location not in _tiers:
+            _tiers[location] = LocalTier(
+                options.get('L1_KEY_PREFIXES', ()),
+                options.get('L1_MAX_ENTRIES', 1000),
+                options.get('L1_TIMEOUT', 30),
+            )
+        return _tiers[location]
+
+
+class TwoLevelRedisCache(RedisCache):
+    """
+    django-redis cache with an in-process L1 for hot keys; see
+    LocalTier. Keys outside L1_KEY_PREFIXES behave exactly as with
+    RedisCache, and get_redis_connection() keeps working.
+
+    OPTIONS:
+        L1_KEY_PREFIXES: keys served from L1, e.g. ("storefront:",)
+        L1_MAX_ENTRIES: entries kept per process (default 1000)
+        L1_TIMEOUT: seconds an entry may be served (default 30)
+    """
+
+    def __init__(self, server, params):
+        options = params.get('OPTIONS', {})
+        l1_options = {
+            name: value for name, value in options.items()
+            if name.startswith('L1_')
+        }
+        # Copied: the OPTIONS dict is shared with settings.CACHES
+        params = {**params, 'OPTIONS': {
+            name: value for name, value in options.items()
+            if name not in l1_options
+        }}
+        super().__init__(server, params)
+        location = server if isinstance(server, str) else ','.join(server)
+        self.l1 = get_local_tier(location, l1_options)
+
+    def _in_l1(self, key) -> bool:
+        return bool(self.l1.prefixes) and self.l1.handles(str(key))
+
+    def invalidate_local(self, *keys, version=None) -> None:
+        """Drop written keys from L1 here and in every other process"""
+        keys = [self.make_key(key, version) for key in keys
+                if self._in_l1(key)]
+        if not keys:
+            return
+        pipe = self.client.get_client().pipeline(transaction=False)
+        for key in keys:
+            self.l1.invalidate(key)
+            pipe.publish(INVALIDATION_CHANNEL, f'{self.l1.origin}|{key}')
+        pipe.execute()
+
+    def get(self, key, default=None, version=None, client=None):
+        if not self._in_l1(key):
+            return super().get(key, default, version, client)
+
+        local_key = self.make_key(key, version)
+        value, generation = self.l1.get(local_key)
+        if value is not _MISSING:
+            return value
+
+        value = super().get(key, _MISSING, version, client)
+        # Once the client exists, so the listener shares its pool
+        self.l1.ensure_listener(self.client.get_client)
+        if value is _MISSING:
+            return default
+        self.l1.set(local_key, value, generation)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        found = {}
+        missing = []
+        generations = {}
+        for key in keys:
+            if self._in_l1(key):
+                value, generation = self.l1.get(self.make_key(key, version))
+                if value is not _MISSING:
+                    found[key] = value
+                    continue
+                generations[key] = generation
+            missing.append(key)
+        if not missing:
+            return found
+
+        fetched = super().get_many(missing, version, client)
+        if generations:
+            self.l1.ensure_listener(self.client.get_client)
+        for key, value in fetched.items():
+            if key in generations:
+                self.l1.set(self.make_key(key, version), value,
+                            generations[key])
+        found.update(fetched)
+        return found
+
+    def set(self, key, *args, version=None, **kwargs):
+        result = super().set(key, *args, version=version, **kwargs)
+        self.invalidate_local(key, version=version)
+        return result
+
+    def add(self, key, *args, version=None, **kwargs):
+        result = super().add(key, *args, version=version, **kwargs)
+        if result:
+            self.invalidate_local(key, version=version)
+        return result
+
+    def delete(self, key, *args, version=None, **kwargs):
+        result = super().delete(key, *args, version=version, **kwargs)
+        self.invalidate_local(key, version=version)
+        return result
+
+    def delete_many(self, keys, *args, version=None, **kwargs):
+        keys = list(keys)
+        result = super().delete_many(keys, *args, version=version, **kwargs)
+        self.invalidate_local(*keys, version=version)
+        return result
+
+    def set_many(self, data, *args, version=None, **kwargs):
+        result = super().set_many(data, *args, version=version, **kwargs)
+        self.invalidate_local(*data, version=version)
+        return result
+
+    def incr(self, key, *args, version=None, **kwargs):
+        result = super().incr(key, *args, version=version, **kwargs)
+        self.invalidate_local(key, version=version)
+        return result
+
+    def decr(self, key, *args, version=None, **kwargs):
+        result = super().decr(key, *args, version=version, **kwargs)
+        self.invalidate_local(key, version=version)
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self.l1.clear()
+        if self.l1.prefixes:
+            self.client.get_client().publish(
+                INVALIDATION_CHANNEL, f'{self.l1.origin}|{CLEAR_ALL}')
+        return result
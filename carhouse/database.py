@@ -0,0 +1,151 @@
+import os
+from pathlib import Path
+from typing import Mapping, Optional
+
+# Postgres (Supabase) is used only when all of these are set
+DATABASE_ENV = (
+    'SUPABASE_DB_NAME', 'SUPABASE_USER', 'SUPABASE_PASSWORD', 'SUPABASE_HOST',
+)
+DEFAULT_PORT = '5432'
+
+# Connections a pool keeps open while idle
+POOL_MIN_SIZE = 2
+# Connections per worker beyond its request threads (image upload jobs)
+DEFAULT_POOL_SPARE = 2
+# Seconds a request waits for a pooled connection before failing
+DEFAULT_POOL_TIMEOUT = 10
+# Seconds a connection is reused between requests when not pooled
+DEFAULT_CONN_MAX_AGE = 60
+
+
+def _int(env: Mapping[str, str], name: str, default: int) -> int:
+    return int(env.get(name) or default)
+
+
+def pool_size(workers: int, threads: int, spare: int = DEFAULT_POOL_SPARE,
+              max_connections: Optional[int] = None) -> int:
+    """
+    Connections one worker process's pool may open: one per request
+    thread plus `spare` for background threads.
+    * Capped to the worker's share of `max_connections`, so that the
+        pools of every worker fit within the server's (or pooler's)
+        connection limit.
+    """
+    size = threads + spare
+    if max_connections:
+        size = min(size, max_connections // max(workers, 1))
+    return max(size, 1)
+
+
+def _pool_check():
+    """psycopg_pool's checkout health check, or None without psycopg 3"""
+    try:
+        from psycopg_pool import ConnectionPool
+    except ImportError:
+        return None
+    return ConnectionPool.check_connection
+
+
+def database_config(env: Mapping[str, str] = os.environ,
+                    base_dir: Optional[Path] = None) -> dict:
+    """
+    The default DATABASES entry for the given environment.
+    * SQLite in base_dir unless every DATABASE_ENV variable is set.
+    * Postgres uses psycopg's native connection pool (DB_POOL, on by
+        default), sized by pool_size() from WEB_CONCURRENCY (workers),
+        WEB_THREADS (threads per worker), DB_POOL_SPARE and
+        DB_MAX_CONNECTIONS; connections are checked as they are handed
+        out, so ones dropped by the server are replaced.
+    * Without the pool (DB_POOL=False, e.g. behind a transaction
+        pooler, or without psycopg 3) each thread keeps its connection
+        for DB_CONN_MAX_AGE seconds and checks it before reuse.
+    """
+    if not all(env.get(name) for name in DATABASE_ENV):
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': Path(base_dir or '.') / 'db.sqlite3',
+        }
+
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env['SUPABASE_DB_NAME'],
+        'USER': env['SUPABASE_USER'],
+        'PASSWORD': env['SUPABASE_PASSWORD'],
+        'HOST': env['SUPABASE_HOST'],
+        'PORT': env.get('SUPABASE_PORT') or DEFAULT_PORT,
+        'OPTIONS': {'sslmode': env.get('DB_SSLMODE', 'require')},
+    }
+    check = _pool_check() if env.get('DB_POOL', 'True') == 'True' else None
+    if check is None:
+        config['CONN_MAX_AGE'] = _int(env, 'DB_CONN_MAX_AGE',
+                                      DEFAULT_CONN_MAX_AGE)
+        config['CONN_HEALTH_CHECKS'] = True
+        return config
+
+    max_size = pool_size(
+        workers=_int(env, 'WEB_CONCURRENCY', 1),
+        threads=_int(env, 'WEB_THREADS', 1),
+        spare=_int(env, 'DB_POOL_SPARE', DEFAULT_POOL_SPARE),
+        max_connections=_int(env, 'DB_MAX_CONNECTIONS', 0) or None,
+    )
+    # Pooled connections outlive requests; CONN_MAX_AGE must stay 0
+    config['OPTIONS']['pool'] = {
+        'min_size': min(POOL_MIN_SIZE, max_size),
+        'max_size': max_size,
+        'timeout': _int(env, 'DB_POOL_TIMEOUT', DEFAULT_POOL_TIMEOUT),
+        'check': check,
+    }
+    return config
+
+
+def replica_configs(env: Mapping[str, str], primary: dict) -> dict:
+    """
+    DATABASES entries ("replica_1", ...) for the comma separated
+    SUPABASE_REPLICA_HOSTS, each configured (and pooled) like the
+    primary Postgres database.
+    * Tests use the primary in their place.
+    """
+    hosts = [host.strip() for host in
+             env.get('SUPABASE_REPLICA_HOSTS', '').split(',') if host.strip()]
+    if not hosts or 'postgresql' not in primary['ENGINE']:
+        return {}
+
+    replicas = {}
+    for number, host in enumerate(hosts, start=1):
+        options = dict(primary['OPTIONS'])
+        if 'pool' in options:
+            options['pool'] = dict(options['pool'])
+        replicas[f'replica_{number}'] = dict(
+            primary, HOST=host, OPTIONS=options,
+            TEST={'MIRROR': 'default'},
+        )
+    return replicas
+
+
+def pool_stats(alias: str = 'default') -> Optional[dict]:
+    """
+    This process's connection pool counters for a database, or None
+    when it is not pooled.
+    * requests_wait_ms is the total time spent waiting for a
+        connection; wait_ms_avg spreads it over requests_num.
+    * requests_waiting are waiting right now.
+    """
+    from django.db import connections
+
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    requests = stats.get('requests_num', 0)
+    wait_ms = stats.get('requests_wait_ms', 0)
+    return {
+        'pool_min': stats.get('pool_min'),
+        'pool_max': stats.get('pool_max'),
+        'pool_size': stats.get('pool_size'),
+        'pool_available': stats.get('pool_available'),
+        'requests_num': requests,
+        'requests_waiting': stats.get('requests_waiting', 0),
+        'requests_wait_ms': wait_ms,
+        'requests_errors': stats.get('requests_errors', 0),
+        'wait_ms_avg': round(wait_ms / requests, 2) if requests else 0,
+    }
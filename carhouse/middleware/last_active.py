@@ -0,0 +1,153 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+THROTTLE_KEY = 'last_active:throttle:{user_id}'
+SLOT_KEY = 'last_active:slot:{slot}'
+SEQUENCE_KEY = 'last_active:sequence'
+FLUSHED_KEY = 'last_active:flushed'
+FLUSH_LOCK_KEY = 'last_active:flush_lock'
+GAP_KEY = 'last_active:gap'
+
+# Pending timestamps outlive a missed flush or two before expiring
+PENDING_TIMEOUT = 60 * 60 * 24
+# Seconds a reserved but unwritten slot holds back the flush before it
+# is given up on (its writer died, or the entry was evicted)
+GAP_TIMEOUT = 60
+
+
+def get_interval() -> int:
+    return getattr(settings, 'LAST_ACTIVE_INTERVAL', 300)
+
+
+def is_buffered() -> bool:
+    """
+    Whether timestamps are buffered in the cache; only when the cache
+    is shared by every process (Redis), as the flush runs in its own.
+    """
+    return getattr(settings, 'LAST_ACTIVE_BUFFERED', True)
+
+
+def record_activity(user_id: int, now=None) -> bool:
+    """
+    Buffer an activity timestamp for the user in the cache.
+    * At most once per user per LAST_ACTIVE_INTERVAL.
+    * Each timestamp takes a slot from an atomic sequence so the
+        flush can find them without scanning keys.
+    * Written straight to the profile when the cache is not shared
+        (see is_buffered).
+    Returns True if a timestamp was recorded.
+    """
+    if not cache.add(THROTTLE_KEY.format(user_id=user_id), 1,
+                     timeout=get_interval()):
+        return False
+
+    if not is_buffered():
+        from authentication.models.profile import Profile
+
+        Profile.objects.filter(user_id=user_id).update(
+            last_active=now or timezone.now()
+        )
+        return True
+
+    cache.add(SEQUENCE_KEY, 0, timeout=None)
+    slot = cache.incr(SEQUENCE_KEY)
+    cache.set(SLOT_KEY.format(slot=slot), (user_id, now or timezone.now()),
+              timeout=PENDING_TIMEOUT)
+    return True
+
+
+def _gap_expired(slot: int) -> bool:
+    """
+    Whether a reserved slot has been missing for GAP_TIMEOUT; slots
+    are written right after they are reserved, so one missing for
+    long is never coming.
+    """
+    now = time.time()
+    gap = cache.get(GAP_KEY)
+    if gap is None or gap[0] != slot:
+        cache.set(GAP_KEY, (slot, now), timeout=GAP_TIMEOUT * 10)
+        return False
+    return now - gap[1] >= GAP_TIMEOUT
+
+
+def flush_last_active(batch_size: int = 500) -> int:
+    """
+    Persist buffered timestamps to Profile.last_active.
+    * One UPDATE per batch of slots, keeping the latest per user.
+    * Stops at a slot that has been reserved but not yet written, so
+        it is picked up by a later flush rather than skipped.
+    * Guarded by a cache lock so concurrent flushes don't overlap.
+    Returns the number of profiles updated.
+    """
+    from authentication.models.profile import Profile
+
+    if not cache.add(FLUSH_LOCK_KEY, 1, timeout=60 * 5):
+        return 0
+
+    updated = 0
+    try:
+        head = cache.get(SEQUENCE_KEY, 0)
+        flushed = cache.get(FLUSHED_KEY, 0)
+        if flushed > head:
+            # The sequence was evicted and restarted
+            flushed = 0
+
+        for start in range(flushed + 1, head + 1, batch_size):
+            end = min(start + batch_size, head + 1)
+            keys = [SLOT_KEY.format(slot=slot) for slot in range(start, end)]
+            found = cache.get_many(keys)
+
+            # Only as far as the first slot still being written
+            read = []
+            for slot, key in zip(range(start, end), keys):
+                if key not in found and not _gap_expired(slot):
+                    break
+                read.append(key)
+
+            latest = {}
+            for key in read:
+                if key not in found:
+                    continue
+                user_id, timestamp = found[key]
+                if user_id not in latest or latest[user_id] < timestamp:
+                    latest[user_id] = timestamp
+
+            if latest:
+                updated += Profile.objects.filter(
+                    user_id__in=latest
+                ).update(last_active=Case(
+                    *[When(user_id=user_id, then=Value(timestamp))
+                      for user_id, timestamp in latest.items()],
+                    output_field=DateTimeField(),
+                ))
+
+            if read:
+                cache.delete_many(read)
+                cache.set(FLUSHED_KEY, start + len(read) - 1, timeout=None)
+            if len(read) < len(keys):
+                break
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+    return updated
+
+
+class LastActiveMiddleware:
+    """
+    Record when authenticated users were last active without writing
+    to the database on every request; see flush_last_active.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            record_activity(user.pk)
+        return response
@@ -1,35 +1,324 @@
-from django.core.cache import cache
+import hashlib
+import math
+import threading
 import time
+from typing import NamedTuple, Optional
+
 from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+
+from app.views.helpers.helpers import is_ajax
+
+RATE_LIMIT_KEY = 'ratelimit:{key}:{bucket}'
 
 
 class RateLimitExceeded(Exception):
     pass
 
 
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the current window ends
+    reset: int
+    # Seconds until a request of the same cost would be admitted
+    retry_after: int
+
+
+def get_redis_client():
+    """The raw Redis client behind the default cache, if django-redis"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def _retry_after(previous: int, current: int, elapsed: float,
+                 window: int, target: int) -> float:
+    """
+    Seconds until the sliding estimate falls to `target`, assuming no
+    further hits.
+    """
+    if previous and current <= target:
+        # Still inside this window, as the previous one's weight decays
+        return max(window * (1 - (target - current) / previous) - elapsed, 0)
+    # Only once this window has become the previous one
+    wait = window * (1 - target / current) if current > 0 else 0
+    return window - elapsed + max(wait, 0)
+
+
+def _count_with_redis(client, current_key: str, previous_key: str,
+                      cost: int, window: int):
+    """Increment and read both windows in one MULTI/EXEC round trip"""
+    pipe = client.pipeline(transaction=True)
+    pipe.incrby(current_key, cost)
+    pipe.expire(current_key, window * 2)
+    pipe.get(previous_key)
+    current, _, previous = pipe.execute()
+    return int(previous or 0), int(current)
+
+
+def _count_with_cache(current_key: str, previous_key: str, cost: int,
+                      window: int):
+    """Increment and read both windows with atomic cache operations"""
+    try:
+        current = cache.incr(current_key, cost)
+    except ValueError:
+        # First hit of the window; another request may win the add
+        if cache.add(current_key, cost, timeout=window * 2):
+            current = cost
+        else:
+            current = cache.incr(current_key, cost)
+    return cache.get(previous_key, 0), current
+
+
+def _count(key: str, bucket: int, cost: int, window: int):
+    """
+    Add `cost` to a window of `key` in the shared cache; returns the
+    (previous, current) window totals.
+    """
+    current_key = RATE_LIMIT_KEY.format(key=key, bucket=bucket)
+    previous_key = RATE_LIMIT_KEY.format(key=key, bucket=bucket - 1)
+
+    client = get_redis_client()
+    if client is not None:
+        return _count_with_redis(
+            client, cache.make_key(current_key),
+            cache.make_key(previous_key), cost, window,
+        )
+    return _count_with_cache(current_key, previous_key, cost, window)
+
+
+def _decide(previous: int, current: int, elapsed: float, limit: int,
+            window: int, cost: int) -> RateLimitResult:
+    estimate = previous * (1 - elapsed / window) + current
+    allowed = estimate <= limit
+    retry_after = 0
+    if not allowed:
+        retry_after = max(math.ceil(_retry_after(
+            previous, current, elapsed, window, limit - cost
+        )), 1)
+    return RateLimitResult(
+        allowed=allowed,
+        limit=limit,
+        remaining=max(int(limit - estimate), 0),
+        reset=math.ceil(window - elapsed),
+        retry_after=retry_after,
+    )
+
+
+def hit(key: str, limit: int, window: int, cost: int = 1,
+        now: Optional[float] = None) -> RateLimitResult:
+    """
+    Count a request of `cost` against `key` and decide whether it is
+    within `limit` per `window` seconds.
+    * Sliding window counter: the current fixed window plus the
+        previous one weighted by how much of it still overlaps, so
+        bursts at a window edge cannot pass at twice the limit.
+    * The increment is atomic and decides admission, so concurrent
+        requests can never be over-admitted. Rejected requests count
+        too, so a client hammering the limit stays limited.
+    * With django-redis this is a single round trip.
+    """
+    now = time.time() if now is None else now
+    bucket, elapsed = divmod(now, window)
+    previous, current = _count(key, int(bucket), cost, window)
+    return _decide(previous, current, elapsed, limit, window, cost)
+
+
+class _LocalCount:
+    __slots__ = ('bucket', 'pending', 'previous', 'current', 'synced_at')
+
+    def __init__(self, bucket: int):
+        self.bucket = bucket
+        self.pending = 0
+        self.previous = self.current = 0
+        # Never synced: the first hit goes to the shared cache
+        self.synced_at = float('-inf')
+
+
+class LocalRateLimiter:
+    """
+    In-process tier in front of the shared counters, for policies in
+    "approximate" mode.
+    * Hits accumulate locally and are added to the shared cache as one
+        delta once RATELIMIT_SYNC_HITS cost has built up or
+        RATELIMIT_SYNC_INTERVAL ms have passed; decisions in between
+        use the last shared totals plus the local delta.
+    * Each process can admit at most RATELIMIT_SYNC_HITS cost per key
+        that other processes have not seen yet, so the overshoot is
+        bounded by processes x RATELIMIT_SYNC_HITS (plus whatever
+        arrives within one sync interval).
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: int, cost: int = 1,
+            now: Optional[float] = None) -> RateLimitResult:
+        now = time.time() if now is None else now
+        bucket, elapsed = divmod(now, window)
+        bucket = int(bucket)
+        sync_hits = getattr(settings, 'RATELIMIT_SYNC_HITS', 10)
+        interval = getattr(settings, 'RATELIMIT_SYNC_INTERVAL', 250) / 1000
+
+        stale = None
+        with self.lock:
+            count = self.counts.get(key)
+            if count is None or count.bucket != bucket:
+                if count is not None and count.pending:
+                    stale = count
+                if count is None and len(self.counts) >= self.max_keys:
+                    self._prune(bucket)
+                count = self.counts[key] = _LocalCount(bucket)
+            count.pending += cost
+            delta = 0
+            if count.pending >= sync_hits or \
+                    now - count.synced_at >= interval:
+                delta, count.pending = count.pending, 0
+                count.synced_at = now
+            previous, current = count.previous, count.current
+            pending = count.pending
+
+        if stale is not None:
+            # Hits left over from the window that just ended
+            _count(key, stale.bucket, stale.pending, window)
+        if delta:
+            previous, current = _count(key, bucket, delta, window)
+            with self.lock:
+                if count.current < current:
+                    count.previous, count.current = previous, current
+        else:
+            current += pending
+        return _decide(previous, current, elapsed, limit, window, cost)
+
+    def _prune(self, bucket: int) -> None:
+        """Drop counters with nothing pending from windows now over"""
+        for key, count in list(self.counts.items()):
+            if count.bucket < bucket and not count.pending:
+                del self.counts[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.counts.clear()
+
+
+local_limiter = LocalRateLimiter()
+
+
+def set_rate_limit_headers(response, result: RateLimitResult,
+                           window: int) -> None:
+    """Add the IETF draft RateLimit-* headers (and Retry-After)"""
+    response['RateLimit-Limit'] = str(result.limit)
+    response['RateLimit-Remaining'] = str(result.remaining)
+    response['RateLimit-Reset'] = str(result.reset)
+    response['RateLimit-Policy'] = f'{result.limit};w={window}'
+    if not result.allowed:
+        response['Retry-After'] = str(result.retry_after)
+
+
+def rate_limited_response(request, result: RateLimitResult):
+    message = str(RateLimitExceeded(
+        f"Rate limit exceeded. Try again in {result.retry_after} seconds."
+    ))
+    if is_ajax(request):
+        return JsonResponse({"success": False, "errors": message},
+                            status=429)
+    return HttpResponse(message, status=429, content_type='text/plain')
+
+
+class RateLimitPolicy(NamedTuple):
+    name: str
+    limit: int
+    window: int
+    # What requests are counted per: "ip", "user" or "api_key"
+    key: str = 'ip'
+    # "strict" counts every request in the shared cache; "approximate"
+    # batches counts through the in-process tier (LocalRateLimiter)
+    mode: str = 'strict'
+
+    def hit(self, key: str, cost: int = 1) -> RateLimitResult:
+        if self.mode == 'approximate':
+            return local_limiter.hit(key, self.limit, self.window, cost)
+        return hit(key, self.limit, self.window, cost)
+
+
+def get_policy(name: str) -> RateLimitPolicy:
+    """
+    Return a policy from RATELIMIT_POLICIES; "default" is built from
+    RATELIMIT and RATELIMIT_WINDOW unless configured there.
+    """
+    policies = getattr(settings, 'RATELIMIT_POLICIES', {})
+    if name in policies:
+        return RateLimitPolicy(name, **policies[name])
+    if name != 'default':
+        raise ValueError(f"Unknown rate limit policy: {name}")
+    return RateLimitPolicy(
+        name, settings.RATELIMIT,
+        getattr(settings, 'RATELIMIT_WINDOW', 60 * 60),
+        mode=getattr(settings, 'RATELIMIT_MODE', 'strict'),
+    )
+
+
+def get_route_policy(url_name: Optional[str]):
+    """Return (policy, cost) for a URL name; see RATELIMIT_ROUTES"""
+    routes = getattr(settings, 'RATELIMIT_ROUTES', {})
+    name, cost = routes.get(url_name, ('default', 1))
+    return get_policy(name), cost
+
+
+def client_key(request, kind: str) -> str:
+    """Identify who a request is counted against for a policy"""
+    if kind == 'user':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+    elif kind == 'api_key':
+        api_key = request.headers.get('X-Api-Key')
+        if api_key:
+            # Keep raw keys out of the cache
+            digest = hashlib.sha256(api_key.encode()).hexdigest()[:32]
+            return f'key:{digest}'
+    return f"ip:{request.META.get('REMOTE_ADDR')}"
+
+
+def is_exempt(path: str) -> bool:
+    return path.startswith(
+        tuple(getattr(settings, 'RATELIMIT_EXEMPT_PATHS', ()))
+    )
+
+
 class RateLimitMiddleware:
+    """
+    Rate limit requests per route policy; see RATELIMIT_ROUTES and hit.
+    * Exempt paths are never counted; unknown paths (e.g. 404 probes)
+        count against the default policy.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        ip = request.META.get('REMOTE_ADDR')
-        key = f'ratelimit:{ip}'
-
-        # get request count & last reset time
-        data = cache.get(key, {'count': 0, 'reset': time.time()})
-
-        # reset if an hour has passed since last reset time
-        if (time.time() - data['reset'] > 3600):
-            data = {'count': 0, 'reset': time.time()}
-
-        # check limit (set in settings.py, DEFAULT to 100)
-        rate_limit = settings.RATELIMIT if settings.RATELIMIT >= 100 else 100
-        if (data['count'] >= rate_limit):
-            from app.views.errors import handler_429 as _429
-            return _429(request, RateLimitExceeded("Rate Limit Exceeded"))
+        if is_exempt(request.path_info):
+            return self.get_response(request)
 
-        data['count'] += 1
-        cache.set(key, data, timeout=3600)
+        try:
+            url_name = resolve(request.path_info).view_name
+        except Resolver404:
+            url_name = None
+        policy, cost = get_route_policy(url_name)
+        key = f'{policy.name}:{client_key(request, policy.key)}'
 
-        response = self.get_response(request)
+        result = policy.hit(key, cost)
+        if result.allowed:
+            response = self.get_response(request)
+        else:
+            response = rate_limited_response(request, result)
+        set_rate_limit_headers(response, result, policy.window)
         return response
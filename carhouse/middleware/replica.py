@@ -0,0 +1,57 @@
+from functools import wraps
+
+from django.conf import settings
+
+from carhouse.middleware.sessionless import SAFE_METHODS
+from carhouse.routers import allow_replica_reads, replica_state
+
+
+def replica_reads(view_func):
+    """
+    Mark a read-only view whose queries may be served by a replica; use
+    method_decorator(replica_reads, name='dispatch') on class-based
+    views. See ReplicaMiddleware.
+    """
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        return view_func(*args, **kwargs)
+
+    wrapper.replica_reads = True
+    return wrapper
+
+
+class ReplicaMiddleware:
+    """
+    Route the reads of GET and HEAD requests to replica_reads views to
+    a replica (see carhouse.routers.ReplicaRouter), and keep a visitor
+    on the primary for a while after they write so they read their own
+    writes.
+    * A response to a request that wrote anything (a save, a review, a
+        listing edit, a login) sets the REPLICA_PIN_COOKIE for
+        REPLICA_PIN_SECONDS, longer than replicas lag behind; requests
+        carrying it only use the primary.
+    * Must come first, so writes made by later middleware (e.g. session
+        saves) are noticed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with replica_state() as state:
+            response = self.get_response(request)
+
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                secure=request.is_secure(), httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'replica_reads', False) and \
+                request.method in SAFE_METHODS and \
+                settings.REPLICA_PIN_COOKIE not in request.COOKIES:
+            allow_replica_reads()
+        return None
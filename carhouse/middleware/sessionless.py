@@ -0,0 +1,53 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def sessionless(view_func):
+    """
+    Mark a read-only view as servable to anonymous visitors without a
+    session; use method_decorator(sessionless, name='dispatch') on
+    class-based views. See SessionlessMiddleware.
+    """
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        return view_func(*args, **kwargs)
+
+    wrapper.sessionless = True
+    return wrapper
+
+
+def is_sessionless(request) -> bool:
+    """Whether the request is being served without a session"""
+    return getattr(request, 'sessionless', False)
+
+
+class SessionlessMiddleware:
+    """
+    Serve GET and HEAD requests to sessionless views without touching
+    the session when the visitor has no session cookie, so the
+    response carries no Set-Cookie or Vary: Cookie and a shared cache
+    can store it.
+    * Without a session cookie the visitor is anonymous, so request.user
+        is set without a session lookup.
+    * Sessionless views must not render CSRF tokens, which would set
+        the CSRF cookie (and Vary: Cookie) again.
+    * Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'sessionless', False) and \
+                request.method in SAFE_METHODS and \
+                settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            request.sessionless = True
+            request.user = AnonymousUser()
+        return None
@@ -0,0 +1,103 @@
+import copy
+
+
+def _stored(field, value):
+    """A field value as written to the database, safe to keep"""
+    return copy.deepcopy(field.get_prep_value(value))
+
+
+class DirtyFieldsMixin:
+    """
+    Track field values as loaded from the database so that saving an
+    existing row only writes the columns that actually changed, and
+    skips the UPDATE entirely when nothing did.
+
+    Only instances loaded through the ORM are tracked; new instances
+    and explicit ``update_fields`` saves behave exactly as before.
+    The loaded values stay available to pre_save/post_save receivers
+    and are refreshed once the save completes. Values are kept (and
+    compared) as ``field.get_prep_value()`` returns them, so objects
+    without value equality, e.g. a CloudinaryField's resource, compare
+    by what would be stored.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_fields()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_fields(fields)
+
+    def _snapshot_fields(self, field_names=None):
+        """Record the current values of the given (or all) fields"""
+        loaded = self.__dict__
+        if field_names is None or not self.is_tracked:
+            self._original_values = {}
+        for field in self._meta.concrete_fields:
+            if field_names is not None and field.name not in field_names \
+                    and field.attname not in field_names:
+                continue
+            if field.attname in loaded:
+                self._original_values[field.attname] = _stored(
+                    field, loaded[field.attname]
+                )
+
+    @property
+    def is_tracked(self):
+        """Whether the instance holds a snapshot of its stored row"""
+        return "_original_values" in self.__dict__
+
+    def get_original_value(self, attname):
+        """Return the stored value of a field, or its current value"""
+        if self.is_tracked and attname in self._original_values:
+            return self._original_values[attname]
+        return getattr(self, attname)
+
+    def get_dirty_fields(self):
+        """
+        Return {field name: stored value} for every changed field.
+        Fields that were deferred at load time count as changed once
+        they are assigned.
+        """
+        if not self.is_tracked:
+            return {}
+
+        loaded = self.__dict__
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in loaded:
+                continue
+            original = self._original_values.get(field.attname, field)
+            if original is field or \
+                    original != _stored(field, loaded[field.attname]):
+                dirty[field.name] = None if original is field else original
+        return dirty
+
+    def is_dirty(self):
+        return bool(self.get_dirty_fields())
+
+    def save_base(self, *args, update_fields=None, **kwargs):
+        using = kwargs.get("using")
+        if (
+            update_fields is None
+            and self.is_tracked
+            and not self._state.adding
+            and not kwargs.get("raw")
+            and not kwargs.get("force_insert")
+            and (using is None or using == self._state.db)
+            and self.pk == self._original_values.get(self._meta.pk.attname)
+        ):
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                return
+            # auto_now columns still move whenever something is written
+            update_fields = set(dirty) | {
+                field.name for field in self._meta.concrete_fields
+                if getattr(field, "auto_now", False)
+            }
+
+        super().save_base(*args, update_fields=update_fields, **kwargs)
+        self._snapshot_fields(update_fields)
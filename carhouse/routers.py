@@ -0,0 +1,94 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+class ReplicaState:
+    """Routing state of the current request"""
+
+    def __init__(self, replica: bool = False):
+        # Reads may go to a replica
+        self.replica = replica
+        # Something was written; later reads must see it
+        self.wrote = False
+        # The replica chosen for the request, so its reads agree
+        self.alias = None
+
+
+_state: ContextVar[Optional[ReplicaState]] = ContextVar(
+    'replica_state', default=None
+)
+
+
+@contextmanager
+def replica_state(replica: bool = False):
+    """Route the queries made in the block; see ReplicaRouter"""
+    state = ReplicaState(replica)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def allow_replica_reads() -> None:
+    """Let the rest of the current request read from a replica"""
+    state = _state.get()
+    if state is not None:
+        state.replica = True
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary in the block, e.g. to build a value that is
+    cached for longer than replicas lag behind.
+    """
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    replica, state.replica = state.replica, False
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+class ReplicaRouter:
+    """
+    Send reads to DATABASE_REPLICAS where the request allows it (see
+    carhouse.middleware.replica), everything else to the primary.
+    * Writes always go to the primary, and once a request has written
+        its reads do too.
+    * A request reads from one replica throughout.
+    * Outside a request (commands, background threads) everything uses
+        the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica or state.wrote or \
+                not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            state.alias = random.choice(settings.DATABASE_REPLICAS)
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Never the database the instance was read from
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 
+from carhouse.database import database_config, replica_configs
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -53,12 +55,6 @@ if ENVIRONMENT == 'production':
     _ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', DEFAULT_HOSTS).split(',')
     ALLOWED_HOSTS.extend(_ALLOWED_HOSTS)
 
-    SUPABASE_USER = os.environ.get('SUPABASE_USER')
-    SUPABASE_DB_NAME = os.environ.get('SUPABASE_DB_NAME')
-    SUPABASE_PASSWORD = os.environ.get('SUPABASE_PASSWORD')
-    SUPABASE_HOST = os.environ.get('SUPABASE_HOST')
-    SUPABASE_PORT = os.environ.get('SUPABASE_PORT')
-
     CLOUDINARY_CLOUD_NAME = os.environ.get('CLOUDINARY_CLOUD_NAME')
     CLOUDINARY_API_KEY = os.environ.get('CLOUDINARY_API_KEY')
     CLOUDINARY_API_SECRET = os.environ.get('CLOUDINARY_API_SECRET')
@@ -73,16 +69,19 @@ INSTALLED_APPS.extend([
 ])
 
 MIDDLEWARE = [
+    'carhouse.middleware.replica.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'carhouse.middleware.sessionless.SessionlessMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
     "carhouse.middleware.rate_limit.RateLimitMiddleware",
+    "carhouse.middleware.last_active.LastActiveMiddleware",
 ]
 
 ROOT_URLCONF = 'carhouse.urls'
@@ -109,14 +108,23 @@ WSGI_APPLICATION = 'carhouse.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# Postgres when the SUPABASE_* variables are set, pooled per worker and
+# sized from WEB_CONCURRENCY and WEB_THREADS (see carhouse.database),
+# else SQLite.
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(os.environ, BASE_DIR),
 }
 
+# Read replicas (SUPABASE_REPLICA_HOSTS) serve the reads of listing,
+# search, home and detail pages; a visitor who writes is kept on the
+# primary for REPLICA_PIN_SECONDS (see carhouse.middleware.replica).
+DATABASES.update(replica_configs(os.environ, DATABASES['default']))
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['carhouse.routers.ReplicaRouter']
+REPLICA_PIN_COOKIE = 'primary'
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 15))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -232,6 +240,35 @@ WAGTAILADMIN_RICH_TEXT_EDITORS = {
 }
 
 MAX_UPLOAD_SIZE: int = 15 * 1024 * 1024  # 15MB
+# A primary image plus a full gallery, with room for the form fields
+MAX_UPLOAD_REQUEST_SIZE: int = MAX_UPLOAD_SIZE * 12
+
+# Image fields validated while streaming in; formset prefixes ignored
+IMAGE_UPLOAD_FIELDS: list = ['primary_image', 'image']
+FILE_UPLOAD_HANDLERS: list = [
+    'app.views.helpers.upload_handler.ValidatingImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Background image uploads (see app.views.helpers.uploads)
+IMAGE_UPLOAD_HANDLER = os.environ.get(
+    'IMAGE_UPLOAD_HANDLER',
+    'app.views.helpers.cloudinary.CloudinaryImageHandler'
+)
+IMAGE_UPLOAD_STAGING_DIR = os.path.join(MEDIA_ROOT, 'uploads', 'pending')
+IMAGE_UPLOAD_WORKERS = int(os.environ.get('IMAGE_UPLOAD_WORKERS', 4))
+IMAGE_UPLOAD_MAX_ATTEMPTS = 3
+# Pre-processing before upload (see app.views.helpers.image_processing);
+# IMAGE_PROCESS_WORKERS = 0 processes images in the calling process
+IMAGE_MAX_DIMENSION = 2560
+IMAGE_OUTPUT_FORMAT = 'WEBP'
+IMAGE_OUTPUT_QUALITY = 82
+IMAGE_PROCESS_WORKERS = int(os.environ.get('IMAGE_PROCESS_WORKERS', 2))
+# False uploads listing images concurrently inside the request instead,
+# so a failed upload can be reported on its form
+IMAGE_UPLOADS_DEFERRED = os.environ.get(
+    'IMAGE_UPLOADS_DEFERRED', 'True') == 'True'
 
 ALLOWED_IMAGE_TYPES: list = [
     'image/jpeg', 'image/png', 'image/gif', 'image/webp',
@@ -278,7 +315,97 @@ def csrf_failure(request, reason=""):
 
 CSRF_FAILURE_VIEW = csrf_failure
 
+# Cache: Redis (shared by every worker) when REDIS_URL is set, else
+# per-process memory. Keys under CACHE_L1_KEY_PREFIXES are also kept in
+# a small in-process tier, invalidated over Redis pub/sub on every write
+# (see carhouse.cache.two_level). The tier is bounded by entry count, so
+# only small, hot keys belong there: not micro-cached pages, which are
+# large and keyed by arbitrary query strings
+REDIS_URL = os.environ.get('REDIS_URL')
+REDIS_PASSWORD = os.environ.get('REDIS_PASSWORD')
+CACHE_L1_KEY_PREFIXES = ('storefront:', 'tag:')
+CACHE_L1_MAX_ENTRIES = int(os.environ.get('CACHE_L1_MAX_ENTRIES', 1000))
+CACHE_L1_TIMEOUT = int(os.environ.get('CACHE_L1_TIMEOUT', 30))
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'carhouse.cache.two_level.TwoLevelRedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'carhouse',
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                'PASSWORD': REDIS_PASSWORD,
+                'SOCKET_CONNECT_TIMEOUT': 2,
+                'SOCKET_TIMEOUT': 2,
+                'L1_KEY_PREFIXES': CACHE_L1_KEY_PREFIXES,
+                'L1_MAX_ENTRIES': CACHE_L1_MAX_ENTRIES,
+                'L1_TIMEOUT': CACHE_L1_TIMEOUT,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Sessions are read from the cache (Redis when configured) and written
+# through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Whole-page cache for anonymous GETs to opted-in views, in seconds; stale
+# pages are served for MICRO_CACHE_GRACE more while one worker refreshes
+# them (see app.views.helpers.micro_cache)
+MICRO_CACHE_ENABLED = os.environ.get('MICRO_CACHE_ENABLED', 'True') == 'True'
+MICRO_CACHE_TIMEOUT = 10
+MICRO_CACHE_GRACE = 60
+
+# Requests per client IP per sliding window of RATELIMIT_WINDOW seconds
+# (the "default" policy, for routes not listed in RATELIMIT_ROUTES)
 RATELIMIT = 1000
+RATELIMIT_WINDOW = 60 * 60
+RATELIMIT_MODE = 'approximate'
+# Separate budgets for expensive routes: requests, weighted by each
+# route's cost, per window, counted per client "ip", signed-in "user"
+# or "api_key" (X-Api-Key header); the last two fall back to the IP
+# "mode" is "strict" (every request counted in the shared cache) or
+# "approximate" (counted through the in-process tier, see below)
+RATELIMIT_POLICIES = {
+    'search': {'limit': 120, 'window': 60, 'key': 'ip',
+               'mode': 'approximate'},
+    'auth': {'limit': 10, 'window': 60 * 5, 'key': 'ip'},
+    'saves': {'limit': 120, 'window': 60, 'key': 'user'},
+    'captcha': {'limit': 30, 'window': 60, 'key': 'ip'},
+}
+# URL name -> (policy, cost)
+RATELIMIT_ROUTES = {
+    'app:search': ('search', 2),
+    'app:car_search': ('search', 1),
+    'authentication:login': ('auth', 1),
+    'authentication:signup': ('auth', 1),
+    'authentication:password_reset': ('auth', 1),
+    'app:save_vehicle': ('saves', 1),
+    'app:bulk_save_vehicles': ('saves', 5),
+    'captcha-refresh': ('captcha', 1),
+}
+# Paths that skip rate accounting entirely (assets, health checks)
+RATELIMIT_EXEMPT_PATHS = ('/static/', '/media/', '/health')
+# Approximate policies sync their local counts to the shared cache
+# after this much cost or this many milliseconds, whichever is first;
+# each worker process can overshoot a limit by at most RATELIMIT_SYNC_HITS
+RATELIMIT_SYNC_HITS = 10
+RATELIMIT_SYNC_INTERVAL = 250
+
+# Seconds between recorded activity timestamps per user; buffered
+# timestamps are written to Profile.last_active by flush_last_active
+LAST_ACTIVE_INTERVAL = 300
+# Buffering needs a cache shared with the flush command's process;
+# with the per-process fallback timestamps are written directly
+LAST_ACTIVE_BUFFERED = bool(REDIS_URL)
+# Sellers active within this many seconds get the "responds quickly" badge
+RESPONSIVE_SELLER_WINDOW = 60 * 60 * 24
 
 # Cloudinary configuration
 CLOUDINARY_STORAGE = {